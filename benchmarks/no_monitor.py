@@ -0,0 +1,62 @@
+"""
+Measure what pytest-monitor costs when disabled with --no-monitor, compared to
+pytest run without the plugin at all (-p no:monitor).
+
+    python benchmarks/no_monitor.py --tests 100000 --repeat 3
+
+The suite is made of no-op tests. Each configuration runs it in a fresh
+pytest process and the best wall time of all repetitions is reported.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+TEST_MODULE = """
+import pytest
+
+
+@pytest.mark.parametrize("i", range({n_tests}))
+def test_noop(i):
+    pass
+"""
+
+CONFIGURATIONS = {
+    "without plugin": ["-p", "no:monitor"],
+    "--no-monitor": ["--no-monitor"],
+}
+
+
+def run(directory, args):
+    cmd = [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider", *args]
+    start = time.perf_counter()
+    subprocess.run(cmd, cwd=directory, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tests", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--monitored",
+        action="store_true",
+        help="Also time a monitored run, storing metrics in a temporary database.",
+    )
+    args = parser.parse_args()
+
+    configurations = dict(CONFIGURATIONS)
+    with tempfile.TemporaryDirectory() as directory:
+        if args.monitored:
+            configurations["monitored"] = ["--db", os.path.join(directory, "bench.db")]
+        with open(os.path.join(directory, "test_noop.py"), "w", encoding="utf-8") as f:
+            f.write(TEST_MODULE.format(n_tests=args.tests))
+        for name, extra in configurations.items():
+            best = min(run(directory, extra) for _ in range(args.repeat))
+            print(f"{name:>16}: {best:8.2f} s ({best / args.tests * 1e6:6.1f} us/test)")
+
+
+if __name__ == "__main__":
+    main()
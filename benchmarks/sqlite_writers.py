@@ -0,0 +1,83 @@
+"""
+Measure how many metrics per second concurrent writers can store in a single
+SQLite database, like parallel pytest sessions sharing the same --db.
+
+    python benchmarks/sqlite_writers.py --writers 1 8 32 --metrics 2000
+
+Each writer is a separate process inserting its metrics through
+SqliteDBHandler. Results are given for the default pragmas and for the
+former settings (rollback journal, FULL synchronization).
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+from pytest_monitor.handler import SqliteDBHandler
+
+LEGACY_PRAGMAS = {"journal_mode": "DELETE", "synchronous": "FULL", "busy_timeout": "10000"}
+
+
+def write_metrics(db_path, n_metrics, batch_size, pragmas, start):
+    db = SqliteDBHandler(db_path, batch_size=batch_size, pragmas=pragmas)
+    start.wait()
+    for i in range(n_metrics):
+        db.insert_metric(
+            "session",
+            "env",
+            "2024-01-01T00:00:00",
+            "test_item",
+            "tests.test_module",
+            f"test_item[{os.getpid()}-{i}]",
+            "tests/test_module.py",
+            "function",
+            "",
+            1.0,
+            0.5,
+            0.1,
+            0.6,
+            12.0,
+            True,
+        )
+    db.close()
+
+
+def run(n_writers, n_metrics, batch_size, pragmas):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, ".pymon")
+        SqliteDBHandler(db_path, pragmas=pragmas).close()  # create the schema once
+        start = multiprocessing.Barrier(n_writers + 1)
+        writers = [
+            multiprocessing.Process(
+                target=write_metrics, args=(db_path, n_metrics, batch_size, pragmas, start)
+            )
+            for _ in range(n_writers)
+        ]
+        for writer in writers:
+            writer.start()
+        start.wait()
+        t_a = time.perf_counter()
+        for writer in writers:
+            writer.join()
+        elapsed = time.perf_counter() - t_a
+        failed = sum(writer.exitcode != 0 for writer in writers)
+    return n_writers * n_metrics / elapsed, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--writers", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--metrics", type=int, default=2000, help="metrics per writer")
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    print(f"{'writers':>8} {'pragmas':>8} {'metrics/s':>12} {'failed':>7}")
+    for n_writers in args.writers:
+        for label, pragmas in (("default", None), ("legacy", LEGACY_PRAGMAS)):
+            throughput, failed = run(n_writers, args.metrics, args.batch_size, pragmas)
+            print(f"{n_writers:>8} {label:>8} {throughput:>12.0f} {failed:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -16,13 +16,13 @@ import pathlib
 
 
 def read_version():
-    init = pathlib.Path(__file__).parent.parent.parent / "pytest_monitor" / "__init__.py"
-    with init.open("r") as pkg_init_f:
-        version_read = [line.strip() for line in pkg_init_f if line.startswith("__version__")]
+    pyproject = pathlib.Path(__file__).parent.parent.parent / "pyproject.toml"
+    with pyproject.open("r") as pyproject_f:
+        version_read = [line.strip() for line in pyproject_f if line.startswith("version")]
     if len(version_read) > 1:
-        raise ValueError('Multiple version found in "pytest_monitor" package!')
+        raise ValueError('Multiple version found in "pyproject.toml"!')
     if not version_read:
-        raise ValueError('No version found in "pytest_monitor" package!')
+        raise ValueError('No version found in "pyproject.toml"!')
     return version_read[0].split("=", 1)[1].strip("\" '")
 
 
@@ -1,3 +1,7 @@
-import importlib.metadata
+def __getattr__(name):
+    # Reading the package metadata is slow: only do it when asked for.
+    if name == "__version__":
+        import importlib.metadata
 
-__version__ = importlib.metadata.version("pytest-monitor")
+        return importlib.metadata.version("pytest-monitor")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
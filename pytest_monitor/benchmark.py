@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Repeated measures of a test body (see the monitor_repeat marker and the
+--monitor-repeat option). A single run is noisy: the body is run several times
+and the median, minimum and standard deviation of each measure are stored.
+The number of runs is either fixed or adapted to the noise of the test, runs
+going on until the confidence interval of the run time is narrow enough.
+The memory usage of a run is its peak over the memory held before it.
+"""
+import math
+import statistics
+import time
+
+from pytest_monitor.profiler import memory_usage
+
+# Two-sided 95% quantiles of the Student t distribution, by degrees of freedom.
+_T_95 = (
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042,
+)  # fmt: skip
+_Z_95 = 1.959964
+
+
+def _stdev(values):
+    return statistics.stdev(values) if len(values) > 1 else 0.0
+
+
+def _t_95(df):
+    if df <= len(_T_95):
+        return _T_95[df - 1]
+    # Cornish-Fisher expansion, accurate to 1e-3 beyond 30 degrees of freedom
+    return _Z_95 + (_Z_95**3 + _Z_95) / (4 * df)
+
+
+def relative_confidence_interval(values):
+    """
+    Half width of the 95% confidence interval of the mean of values, as a
+    percentage of this mean. None if it cannot be computed.
+    """
+    mean = statistics.fmean(values) if len(values) > 1 else 0.0
+    if mean <= 0:
+        return None
+    n = len(values)
+    half_width = _t_95(n - 1) * statistics.stdev(values) / math.sqrt(n)
+    return 100 * half_width / mean
+
+
+class Samples:
+    """Wall time, CPU times, peak and retained memory of each measured run of a test body."""
+
+    def __init__(self):
+        self.total_time = []
+        self.user_time = []
+        self.kernel_time = []
+        self.mem_usage = []
+        self.mem_retained = []
+
+    def __len__(self):
+        return len(self.total_time)
+
+    def add(self, total_time, user_time, kernel_time, mem_usage, mem_retained):
+        self.total_time.append(total_time)
+        self.user_time.append(user_time)
+        self.kernel_time.append(kernel_time)
+        self.mem_usage.append(mem_usage)
+        self.mem_retained.append(mem_retained)
+
+    @property
+    def cpu_time(self):
+        return [u + k for u, k in zip(self.user_time, self.kernel_time)]
+
+    def medians(self):
+        """Median total time, user time, kernel time and memory usage of the runs."""
+        return tuple(
+            statistics.median(values)
+            for values in (self.total_time, self.user_time, self.kernel_time, self.mem_usage)
+        )
+
+    def measures(self):
+        """Optional measures of the metric (see pytest_monitor.handler.METRIC_MEASURES)."""
+        cpu_time = self.cpu_time
+        return {
+            "iterations": len(self),
+            "total_time_min": min(self.total_time),
+            "total_time_stdev": _stdev(self.total_time),
+            "cpu_time_min": min(cpu_time),
+            "cpu_time_stdev": _stdev(cpu_time),
+            "mem_usage_min": min(self.mem_usage),
+            "mem_usage_stdev": _stdev(self.mem_usage),
+            "total_time_ci": relative_confidence_interval(self.total_time),
+            # Growth over all the measured runs, which a leak makes steady
+            "mem_retained": sum(self.mem_retained),
+        }
+
+
+def run_repeated(fun, process, sampler, repeat, warmup=0, ci=None, budget=None, max_runs=1000):
+    """
+    Run fun warmup times without measuring it, then repeat times measuring
+    each run with the given sampler. Runs stop at the first exception.
+    If a target confidence interval is given, runs go on past repeat until
+    the confidence interval of the run time is narrow enough, until the time
+    budget is spent or until max_runs runs are done.
+    :param fun: Callable to run, without arguments.
+    :param process: psutil.Process whose CPU times are measured.
+    :param sampler: Memory sampler of the session (see PeakTracker).
+    :param repeat: Number of measured runs, or minimum number if ci is given.
+    :param warmup: Number of runs done beforehand, not measured.
+    :param ci: Target half width of the 95% confidence interval of the mean run
+               time, as a percentage of this mean.
+    :param budget: Time (in seconds) after which measured runs stop, whatever
+                   the confidence interval. No limit if None.
+    :param max_runs: Number of runs after which measured runs stop, whatever the
+                     confidence interval and the budget (repeat runs at least).
+    :return: a tuple (Samples, exception), exception being None if all runs succeeded.
+    """
+    samples = Samples()
+    try:
+        for _ in range(warmup):
+            fun()
+    except BaseException as e:
+        return samples, e
+    if ci is not None:
+        repeat = max(repeat, 2)  # the least to estimate a confidence interval
+    deadline = None if budget is None else time.perf_counter() + budget
+    while True:
+        rss_a = sampler.resident()
+        times_a = process.cpu_times()
+        start = time.perf_counter()
+        (memuse, exception) = memory_usage((fun, ()), sampler=sampler)
+        total_time = time.perf_counter() - start
+        times_b = process.cpu_times()
+        samples.add(
+            total_time,
+            times_b.user - times_a.user,
+            times_b.system - times_a.system,
+            max(memuse - rss_a, 0.0),
+            sampler.resident() - rss_a,
+        )
+        if isinstance(exception, BaseException):
+            return samples, exception
+        if len(samples) < repeat:
+            continue
+        if ci is None or len(samples) >= max_runs:
+            return samples, None
+        if deadline is not None and time.perf_counter() >= deadline:
+            return samples, None
+        interval = relative_confidence_interval(samples.total_time)
+        if interval is None or interval <= ci:
+            return samples, None
@@ -0,0 +1,46 @@
+import argparse
+import sys
+
+from pytest_monitor.handler import PostgresDBHandler, RemoteHandler
+from pytest_monitor.spool import Spool, spooled_targets
+
+
+def replay(spool_dir):
+    """
+    Deliver the records left in the spool directory by previous sessions.
+    Returns the number of targets that could not be reached.
+    """
+    failures = 0
+    for target in spooled_targets(spool_dir):
+        spool = Spool(spool_dir, target)
+        try:
+            handler = PostgresDBHandler() if target == "postgres" else RemoteHandler(target)
+            spool.replay(handler.replay)
+            handler.close()
+        except Exception as e:
+            print(f"Unable to replay records spooled for {target}: {e}", file=sys.stderr)
+            failures += 1
+        else:
+            print(f"Replayed records spooled for {target}.")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="pytest-monitor")
+    commands = parser.add_subparsers(dest="command", required=True)
+    replay_parser = commands.add_parser(
+        "replay", help="Deliver metrics spooled while the storage was unreachable."
+    )
+    replay_parser.add_argument(
+        "--spool-dir",
+        default=".pymon-spool",
+        help="Spool directory used by the sessions (default: .pymon-spool).",
+    )
+    args = parser.parse_args(argv)
+    if args.command == "replay":
+        return 1 if replay(args.spool_dir) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,19 +1,394 @@
+import datetime
+import gzip
+import io
+import json
 import os
 import sqlite3
+import time
+import warnings
+from http import HTTPStatus
 
-try:
-    import psycopg
-except ImportError:
-    import psycopg2 as psycopg
+from pytest_monitor.spool import Backoff, RejectedError, deliver
+
+# Pragmas applied to SQLite connections, unless overridden. WAL journaling
+# lets concurrent sessions read and write the same database, and waiting for
+# locks (busy_timeout, in ms) avoids 'database is locked' errors. NORMAL
+# synchronization stays safe in WAL mode: only the last transactions may be
+# lost on power failure. A negative cache_size is a size in KiB.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": "10000",
+    "cache_size": "-16384",
+}
+
+# Indexes of the PostgreSQL TEST_METRICS table, serving history lookups.
+# Metrics of an item are ordered by start time in the item index, so that its
+# history is read without sorting. Items are indexed by a hash of their path,
+# name and variant: these columns may exceed the size of a btree entry (about
+# 2.7 kB) for long parametrizations, which would fail the whole batch. Lookups
+# filter on the same expression, METRICS_ITEM_HASH.
+METRICS_ITEM_HASH = "md5(ITEM_PATH || '/' || ITEM || '/' || ITEM_VARIANT)"
+METRICS_INDEXES = (
+    "DROP INDEX IF EXISTS TEST_METRICS_ITEM_IDX",  # Former index of the full columns
+    "CREATE INDEX IF NOT EXISTS TEST_METRICS_ITEM_H_IDX"
+    f" ON TEST_METRICS(({METRICS_ITEM_HASH}), ITEM_START_TS)",
+    "CREATE INDEX IF NOT EXISTS TEST_METRICS_SESSION_IDX ON TEST_METRICS(SESSION_H)",
+    "CREATE INDEX IF NOT EXISTS TEST_METRICS_ENV_IDX ON TEST_METRICS(ENV_H)",
+    "CREATE INDEX IF NOT EXISTS TEST_METRICS_START_TS_IDX"
+    " ON TEST_METRICS(ITEM_START_TS)",
+)
+
+# Optional measures of a metric: column name and type. They are given to
+# insert_metric() as a dictionary keyed by lower case column name, and left
+# NULL when not measured.
+METRIC_MEASURES = (
+    # Repeated runs (see --monitor-repeat): TOTAL_TIME, USER_TIME, KERNEL_TIME
+    # and MEM_USAGE are then medians over the measured runs.
+    ("ITERATIONS", "integer"),  # Number of measured runs
+    ("TOTAL_TIME_MIN", "float"),
+    ("TOTAL_TIME_STDEV", "float"),
+    ("CPU_TIME_MIN", "float"),  # User and kernel time of a run
+    ("CPU_TIME_STDEV", "float"),
+    ("MEM_USAGE_MIN", "float"),
+    ("MEM_USAGE_STDEV", "float"),
+    # Half width of the 95% confidence interval of the mean run time, as a
+    # percentage of this mean. Adaptive runs (see --monitor-ci) go on until
+    # it is small enough.
+    ("TOTAL_TIME_CI", "float"),
+    # Setup and teardown phases of tests: TOTAL_TIME, USER_TIME, KERNEL_TIME
+    # and MEM_USAGE only measure the call of the test function.
+    ("SETUP_TIME", "float"),
+    ("SETUP_USER_TIME", "float"),
+    ("SETUP_KERNEL_TIME", "float"),
+    ("SETUP_MEM_USAGE", "float"),  # Max resident memory used by the setup
+    ("TEARDOWN_TIME", "float"),
+    ("TEARDOWN_USER_TIME", "float"),
+    ("TEARDOWN_KERNEL_TIME", "float"),
+    ("TEARDOWN_MEM_USAGE", "float"),  # Max resident memory used by the teardown
+    # Resident memory gained between the start and the end of the item
+    ("MEM_RETAINED", "float"),
+)
+MEASURE_NAMES = tuple(name for name, _ in METRIC_MEASURES)
+
+
+def measure_values(measures):
+    """Values of the optional measures of a metric, in the order of METRIC_MEASURES."""
+    measures = measures or {}
+    return tuple(measures.get(name.lower()) for name in MEASURE_NAMES)
+
+
+# Columns of the FIXTURE_METRICS table, following the session and execution
+# context columns, in the order given to insert_fixture_metric(). Each row
+# describes the setup and teardown of a fixture instance.
+FIXTURE_METRICS_COLUMNS = (
+    "FIXTURE",
+    "FIXTURE_PATH",
+    "SCOPE",
+    "SETUP_START_TS",
+    "SETUP_TIME",
+    "SETUP_USER_TIME",
+    "SETUP_KERNEL_TIME",
+    "SETUP_MEM_DELTA",
+    "TEARDOWN_TIME",
+    "TEARDOWN_USER_TIME",
+    "TEARDOWN_KERNEL_TIME",
+    "TEARDOWN_MEM_DELTA",
+    "USERS",
+    "AMORTIZED_TIME",
+    "WORKER_ID",
+)
+
+# Columns of the PostgreSQL TEST_METRICS table written by pytest-monitor, in
+# the order of the rows streamed by COPY.
+METRICS_COLUMNS = (
+    "SESSION_H",
+    "ENV_H",
+    "ITEM_START_TIME",
+    "ITEM",
+    "ITEM_PATH",
+    "ITEM_VARIANT",
+    "ITEM_FS_LOC",
+    "KIND",
+    "COMPONENT",
+    "TOTAL_TIME",
+    "USER_TIME",
+    "KERNEL_TIME",
+    "CPU_USAGE",
+    "MEM_USAGE",
+    "TEST_PASSED",
+    "WORKER_ID",
+    "ITEM_START_TS",
+) + MEASURE_NAMES
+
+# Layout of the SQLite database. Version 0 is the former layout, where each
+# TEST_METRICS row repeats the item, component, session and context strings.
+# Since version 1, these are interned in lookup tables and metrics refer to
+# them by integer keys. TEST_METRICS is kept as a view on the former layout.
+# Since version 2, times are stored as seconds since the epoch, and only
+# formatted by readers. Since version 3, metrics have optional measures
+# (METRIC_MEASURES): the version is raised whenever measures are added, so that
+# their columns are added to existing databases. Version 4 adds TOTAL_TIME_CI.
+# Version 5 adds FIXTURE_METRICS, version 6 the setup and teardown measures,
+# version 7 MEM_RETAINED.
+SQLITE_SCHEMA_VERSION = 7
+
+SQLITE_SCHEMA = (
+    """
+CREATE TABLE IF NOT EXISTS TEST_SESSIONS(
+    SESSION_ID integer primary key, -- Surrogate key used by metrics
+    SESSION_H varchar(64) not null unique, -- Session identifier
+    RUN_DATE varchar(64), -- Date of test run
+    SCM_ID varchar(128), -- SCM change id
+    RUN_DESCRIPTION json,
+    RUN_TS float -- Date of test run, in seconds since the epoch
+);""",
+    """
+CREATE TABLE IF NOT EXISTS EXECUTION_CONTEXTS (
+   ENV_ID integer primary key,
+   ENV_H varchar(64) not null unique,
+   CPU_COUNT integer,
+   CPU_FREQUENCY_MHZ integer,
+   CPU_TYPE varchar(64),
+   CPU_VENDOR varchar(256),
+   RAM_TOTAL_MB integer,
+   MACHINE_NODE varchar(512),
+   MACHINE_TYPE varchar(32),
+   MACHINE_ARCH varchar(16),
+   SYSTEM_INFO varchar(256),
+   PYTHON_INFO varchar(512)
+);""",
+    """
+CREATE TABLE IF NOT EXISTS TEST_ITEMS (
+    ITEM_ID integer primary key,
+    ITEM_PATH varchar(4096), -- Path of the item, following Python import specification
+    ITEM varchar(2048), -- Name of the item
+    ITEM_VARIANT varchar(2048), -- Optional parametrization of an item.
+    ITEM_FS_LOC varchar(2048), -- Relative path from pytest invocation directory to the item's module.
+    KIND varchar(64), -- Package, Module or function
+    UNIQUE (ITEM_PATH, ITEM, ITEM_VARIANT, KIND, ITEM_FS_LOC)
+);""",
+    """
+CREATE TABLE IF NOT EXISTS COMPONENTS (
+    COMPONENT_ID integer primary key,
+    COMPONENT varchar(512) unique -- Tested component if any
+);""",
+    """
+CREATE TABLE IF NOT EXISTS METRICS (
+    SESSION_ID integer REFERENCES TEST_SESSIONS(SESSION_ID),
+    ENV_ID integer REFERENCES EXECUTION_CONTEXTS(ENV_ID),
+    ITEM_ID integer REFERENCES TEST_ITEMS(ITEM_ID),
+    COMPONENT_ID integer REFERENCES COMPONENTS(COMPONENT_ID),
+    ITEM_START_TS float, -- Effective start time of the test, in seconds since the epoch
+    TOTAL_TIME float, -- Total time spent running the item
+    USER_TIME float, -- time spent in user space
+    KERNEL_TIME float, -- time spent in kernel space
+    CPU_USAGE float, -- cpu usage
+    MEM_USAGE float, -- Max resident memory used.
+    TEST_PASSED boolean, -- boolean indicating if test passed
+    WORKER_ID varchar(64) NULL -- pytest-xdist worker which ran the item, if any
+);""",
+    # Optional measures are added to METRICS before the view is created, see
+    # SqliteDBHandler.prepare().
+    # Start times are given in local time, as ISO 8601 strings, like former
+    # versions stored them.
+    """
+CREATE VIEW IF NOT EXISTS TEST_METRICS AS
+SELECT S.SESSION_H, E.ENV_H,
+       CASE WHEN M.ITEM_START_TS IS NOT NULL THEN printf('%s.%06d',
+           strftime('%Y-%m-%dT%H:%M:%S',
+                    CAST(round(M.ITEM_START_TS * 1000000) AS INTEGER) / 1000000,
+                    'unixepoch', 'localtime'),
+           CAST(round(M.ITEM_START_TS * 1000000) AS INTEGER) % 1000000)
+       END AS ITEM_START_TIME,
+       I.ITEM_PATH, I.ITEM, I.ITEM_VARIANT, I.ITEM_FS_LOC, I.KIND, C.COMPONENT,
+       M.TOTAL_TIME, M.USER_TIME, M.KERNEL_TIME, M.CPU_USAGE, M.MEM_USAGE,
+       M.TEST_PASSED, M.WORKER_ID, M.ITEM_START_TS{measures}
+FROM METRICS M
+JOIN TEST_ITEMS I ON I.ITEM_ID = M.ITEM_ID
+LEFT JOIN TEST_SESSIONS S ON S.SESSION_ID = M.SESSION_ID
+LEFT JOIN EXECUTION_CONTEXTS E ON E.ENV_ID = M.ENV_ID
+LEFT JOIN COMPONENTS C ON C.COMPONENT_ID = M.COMPONENT_ID;""".format(
+        measures="".join(f", M.{name}" for name in MEASURE_NAMES)
+    ),
+    # Indexes serving history lookups (see pytest_monitor.query). Metrics of
+    # an item are ordered by start time, so that its history is read without
+    # sorting.
+    "CREATE INDEX IF NOT EXISTS METRICS_ITEM_IDX ON METRICS(ITEM_ID, ITEM_START_TS)",
+    "CREATE INDEX IF NOT EXISTS METRICS_SESSION_IDX ON METRICS(SESSION_ID)",
+    "CREATE INDEX IF NOT EXISTS METRICS_ENV_IDX ON METRICS(ENV_ID)",
+    "CREATE INDEX IF NOT EXISTS METRICS_START_TIME_IDX ON METRICS(ITEM_START_TS)",
+    """
+CREATE TABLE IF NOT EXISTS FIXTURE_METRICS (
+    SESSION_ID integer REFERENCES TEST_SESSIONS(SESSION_ID),
+    ENV_ID integer REFERENCES EXECUTION_CONTEXTS(ENV_ID),
+    FIXTURE varchar(2048), -- Name of the fixture
+    FIXTURE_PATH varchar(4096), -- Module defining the fixture
+    SCOPE varchar(16), -- Scope of the fixture (function, class, module, package or session)
+    SETUP_START_TS float, -- Start time of the setup, in seconds since the epoch
+    SETUP_TIME float, -- Time spent setting the fixture up
+    SETUP_USER_TIME float, -- time spent in user space by the setup
+    SETUP_KERNEL_TIME float, -- time spent in kernel space by the setup
+    SETUP_MEM_DELTA float, -- Change of the resident memory during the setup
+    TEARDOWN_TIME float, -- Time spent tearing the fixture down
+    TEARDOWN_USER_TIME float, -- time spent in user space by the teardown
+    TEARDOWN_KERNEL_TIME float, -- time spent in kernel space by the teardown
+    TEARDOWN_MEM_DELTA float, -- Change of the resident memory during the teardown
+    USERS integer, -- Number of tests which used the fixture instance
+    AMORTIZED_TIME float, -- Setup and teardown wall time per test using the fixture instance
+    WORKER_ID varchar(64) NULL -- pytest-xdist worker which set the fixture up, if any
+);""",
+    "CREATE INDEX IF NOT EXISTS FIXTURE_METRICS_SESSION_IDX ON FIXTURE_METRICS(SESSION_ID)",
+)
+
+# Lookup tables of the SQLite database: surrogate key and identifying columns.
+SQLITE_LOOKUPS = {
+    "TEST_SESSIONS": ("SESSION_ID", ("SESSION_H",)),
+    "EXECUTION_CONTEXTS": ("ENV_ID", ("ENV_H",)),
+    "TEST_ITEMS": ("ITEM_ID", ("ITEM_PATH", "ITEM", "ITEM_VARIANT", "KIND", "ITEM_FS_LOC")),
+    "COMPONENTS": ("COMPONENT_ID", ("COMPONENT",)),
+}
+
+# Statements moving a database from the former layout (tables renamed with a
+# LEGACY_ prefix) to the current one. PYMON_EPOCH() converts ISO 8601 dates.
+SQLITE_MIGRATION = (
+    "INSERT INTO TEST_SESSIONS(SESSION_H, RUN_DATE, SCM_ID, RUN_DESCRIPTION, RUN_TS)"
+    " SELECT SESSION_H, RUN_DATE, SCM_ID, RUN_DESCRIPTION, PYMON_EPOCH(RUN_DATE)"
+    " FROM LEGACY_TEST_SESSIONS ORDER BY RUN_DATE",
+    "INSERT OR IGNORE INTO TEST_SESSIONS(SESSION_H)"
+    " SELECT DISTINCT SESSION_H FROM LEGACY_TEST_METRICS WHERE SESSION_H IS NOT NULL",
+    "INSERT INTO EXECUTION_CONTEXTS(ENV_H, CPU_COUNT, CPU_FREQUENCY_MHZ, CPU_TYPE,"
+    " CPU_VENDOR, RAM_TOTAL_MB, MACHINE_NODE, MACHINE_TYPE, MACHINE_ARCH, SYSTEM_INFO,"
+    " PYTHON_INFO) SELECT ENV_H, CPU_COUNT, CPU_FREQUENCY_MHZ, CPU_TYPE, CPU_VENDOR,"
+    " RAM_TOTAL_MB, MACHINE_NODE, MACHINE_TYPE, MACHINE_ARCH, SYSTEM_INFO, PYTHON_INFO"
+    " FROM LEGACY_EXECUTION_CONTEXTS",
+    # Former versions recorded only the first character of the context hash
+    # for contexts already known. Such references are resolved when there is
+    # no ambiguity.
+    "CREATE TEMP TABLE ENV_MAP AS SELECT L.ENV_H, COALESCE("
+    " (SELECT ENV_ID FROM EXECUTION_CONTEXTS E WHERE E.ENV_H = L.ENV_H),"
+    " (SELECT MIN(ENV_ID) FROM EXECUTION_CONTEXTS E WHERE length(L.ENV_H) = 1"
+    "  AND substr(E.ENV_H, 1, 1) = L.ENV_H HAVING COUNT(*) = 1)) AS ENV_ID"
+    " FROM (SELECT DISTINCT ENV_H FROM LEGACY_TEST_METRICS) L",
+    "INSERT OR IGNORE INTO EXECUTION_CONTEXTS(ENV_H)"
+    " SELECT ENV_H FROM temp.ENV_MAP WHERE ENV_ID IS NULL AND ENV_H IS NOT NULL",
+    "UPDATE temp.ENV_MAP SET ENV_ID = (SELECT ENV_ID FROM EXECUTION_CONTEXTS E"
+    " WHERE E.ENV_H = temp.ENV_MAP.ENV_H) WHERE ENV_ID IS NULL",
+    "INSERT OR IGNORE INTO TEST_ITEMS(ITEM_PATH, ITEM, ITEM_VARIANT, KIND, ITEM_FS_LOC)"
+    " SELECT DISTINCT ITEM_PATH, ITEM, ITEM_VARIANT, KIND, ITEM_FS_LOC"
+    " FROM LEGACY_TEST_METRICS",
+    "INSERT OR IGNORE INTO COMPONENTS(COMPONENT)"
+    " SELECT DISTINCT COMPONENT FROM LEGACY_TEST_METRICS WHERE COMPONENT IS NOT NULL",
+    "INSERT INTO METRICS(SESSION_ID, ENV_ID, ITEM_ID, COMPONENT_ID, ITEM_START_TS,"
+    " TOTAL_TIME, USER_TIME, KERNEL_TIME, CPU_USAGE, MEM_USAGE, TEST_PASSED, WORKER_ID)"
+    " SELECT S.SESSION_ID, E.ENV_ID,"
+    " (SELECT ITEM_ID FROM TEST_ITEMS I WHERE I.ITEM_PATH IS L.ITEM_PATH"
+    "  AND I.ITEM IS L.ITEM AND I.ITEM_VARIANT IS L.ITEM_VARIANT AND I.KIND IS L.KIND"
+    "  AND I.ITEM_FS_LOC IS L.ITEM_FS_LOC),"
+    " C.COMPONENT_ID, PYMON_EPOCH(L.ITEM_START_TIME), L.TOTAL_TIME, L.USER_TIME,"
+    " L.KERNEL_TIME,"
+    " L.CPU_USAGE, L.MEM_USAGE, L.TEST_PASSED, L.WORKER_ID"
+    " FROM LEGACY_TEST_METRICS L"
+    " LEFT JOIN TEST_SESSIONS S ON S.SESSION_H = L.SESSION_H"
+    " LEFT JOIN temp.ENV_MAP E ON E.ENV_H = L.ENV_H"
+    " LEFT JOIN COMPONENTS C ON C.COMPONENT = L.COMPONENT"
+    " ORDER BY L.rowid",
+    "DROP TABLE temp.ENV_MAP",
+    "DROP TABLE LEGACY_TEST_METRICS",
+    "DROP TABLE LEGACY_TEST_SESSIONS",
+    "DROP TABLE LEGACY_EXECUTION_CONTEXTS",
+)
+
+# Statements moving a database from version 1 to the current layout: the
+# former METRICS table is renamed METRICS_V1 once its view and indexes
+# (which names are reused) are dropped.
+SQLITE_UPGRADE_V1 = (
+    "DROP VIEW IF EXISTS TEST_METRICS",
+    "DROP INDEX IF EXISTS METRICS_ITEM_IDX",
+    "DROP INDEX IF EXISTS METRICS_SESSION_IDX",
+    "DROP INDEX IF EXISTS METRICS_ENV_IDX",
+    "DROP INDEX IF EXISTS METRICS_START_TIME_IDX",
+    "ALTER TABLE METRICS RENAME TO METRICS_V1",
+    "ALTER TABLE TEST_SESSIONS ADD COLUMN RUN_TS float",
+    "UPDATE TEST_SESSIONS SET RUN_TS = PYMON_EPOCH(RUN_DATE)",
+)
+SQLITE_MIGRATION_V1 = (
+    "INSERT INTO METRICS(SESSION_ID, ENV_ID, ITEM_ID, COMPONENT_ID, ITEM_START_TS,"
+    " TOTAL_TIME, USER_TIME, KERNEL_TIME, CPU_USAGE, MEM_USAGE, TEST_PASSED, WORKER_ID)"
+    " SELECT SESSION_ID, ENV_ID, ITEM_ID, COMPONENT_ID, PYMON_EPOCH(ITEM_START_TIME),"
+    " TOTAL_TIME, USER_TIME, KERNEL_TIME, CPU_USAGE, MEM_USAGE, TEST_PASSED, WORKER_ID"
+    " FROM METRICS_V1 ORDER BY rowid",
+    "DROP TABLE METRICS_V1",
+)
+
+
+def _import_psycopg():
+    # Imported only when PostgreSQL is used: the driver is slow to load.
+    try:
+        import psycopg
+    except ImportError:
+        import psycopg2 as psycopg
+    return psycopg
+
+
+def iso_to_epoch(date):
+    """Convert a date formatted by datetime.isoformat() to seconds since the epoch."""
+    try:
+        return datetime.datetime.fromisoformat(date).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def epoch_to_iso(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp).isoformat()
+
+
+def _copy_value(value):
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def copy_rows(rows):
+    """Encode rows in the text format read by PostgreSQL's COPY ... FROM STDIN."""
+    return "".join("\t".join(_copy_value(v) for v in row) + "\n" for row in rows)
 
 
 class SqliteDBHandler:
-    def __init__(self, db_path):
+    def __init__(self, db_path, batch_size=1, flush_interval=None, pragmas=None):
         self.__db = db_path
-        self.__cnx = sqlite3.connect(self.__db) if db_path else None
+        # Metrics are written from the monitor session's writer thread.
+        self.__cnx = (
+            sqlite3.connect(self.__db, check_same_thread=False) if db_path else None
+        )
+        self.__pragmas = dict(SQLITE_PRAGMAS)
+        self.__pragmas.update(pragmas or {})
+        self.set_pragmas()
+        # Metrics are buffered and written in a single transaction once
+        # batch_size rows are pending or flush_interval seconds have elapsed.
+        self.__batch_size = batch_size
+        self.__flush_interval = flush_interval
+        self.__metrics = []
+        self.__fixtures = []
+        self.__last_flush = time.monotonic()
+        # Surrogate keys of the sessions, contexts, items and components
+        # already known, by table.
+        self.__keys = {}
         self.prepare()
-        # check if new table column is existent, if not create it
-        self.check_create_test_passed_column()
+
+    def set_pragmas(self):
+        for name, value in self.__pragmas.items():
+            if not (name.isidentifier() and str(value).lstrip("-").isalnum()):
+                raise ValueError(f"Invalid SQLite pragma: {name}={value}")
+            self.__cnx.execute(f"PRAGMA {name}={value}")
 
     def check_create_test_passed_column(self):
         cursor = self.__cnx.cursor()
@@ -29,8 +404,18 @@ class SqliteDBHandler:
             )
             self.__cnx.commit()
 
+    def check_create_worker_id_column(self):
+        cursor = self.__cnx.cursor()
+        cursor.execute("PRAGMA table_info(TEST_METRICS)")
+        if not any(column[1] == "WORKER_ID" for column in cursor.fetchall()):
+            cursor.execute("ALTER TABLE TEST_METRICS ADD COLUMN WORKER_ID varchar(64);")
+            self.__cnx.commit()
+
     def close(self):
-        self.__cnx.close()
+        try:
+            self.flush()
+        finally:
+            self.__cnx.close()
 
     def __del__(self):
         self.__cnx.close()
@@ -40,11 +425,82 @@ class SqliteDBHandler:
         cursor.execute(what, bind_to)
         return cursor.fetchall() if many else cursor.fetchone()
 
+    def flush(self):
+        """Write all buffered metrics in a single transaction."""
+        self.__last_flush = time.monotonic()
+        if not self.__metrics and not self.__fixtures:
+            return
+        new_keys = {}
+        with self.__cnx:
+            rows = [self.__metric_row(metric, new_keys) for metric in self.__metrics]
+            self.__cnx.executemany(
+                "insert into METRICS(SESSION_ID,ENV_ID,ITEM_ID,COMPONENT_ID,"
+                "ITEM_START_TS,TOTAL_TIME,USER_TIME,KERNEL_TIME,CPU_USAGE,MEM_USAGE,"
+                f"TEST_PASSED,WORKER_ID,{','.join(MEASURE_NAMES)})"
+                f" values ({','.join('?' * (12 + len(MEASURE_NAMES)))})",
+                rows,
+            )
+            rows = [
+                (
+                    self.__key("TEST_SESSIONS", (fixture[0],), new_keys),
+                    self.__key("EXECUTION_CONTEXTS", (fixture[1],), new_keys),
+                )
+                + tuple(fixture[2:])
+                for fixture in self.__fixtures
+            ]
+            self.__cnx.executemany(
+                "insert into FIXTURE_METRICS(SESSION_ID,ENV_ID,"
+                f"{','.join(FIXTURE_METRICS_COLUMNS)})"
+                f" values ({','.join('?' * (2 + len(FIXTURE_METRICS_COLUMNS)))})",
+                rows,
+            )
+        # Keys are only known for sure once the transaction is committed.
+        for table, keys in new_keys.items():
+            self.__keys.setdefault(table, {}).update(keys)
+        self.__metrics = []
+        self.__fixtures = []
+
+    def __metric_row(self, metric, new_keys):
+        session_h, env_h, start_date, item, path, variant, loc, kind = metric[:8]
+        component = metric[8]
+        return (
+            self.__key("TEST_SESSIONS", (session_h,), new_keys),
+            self.__key("EXECUTION_CONTEXTS", (env_h,), new_keys),
+            self.__key("TEST_ITEMS", (path, item, variant, kind, loc), new_keys, True),
+            self.__key("COMPONENTS", (component,), new_keys, True),
+            start_date,
+        ) + tuple(metric[9:])
+
+    def __key(self, table, values, new_keys, create=False):
+        """
+        Get the surrogate key of the row of a lookup table having the given
+        values, from the cache if possible. Rows are created if requested.
+        """
+        key = self.__keys.get(table, {}).get(values, new_keys.get(table, {}).get(values))
+        if key is not None:
+            return key
+        key_column, columns = SQLITE_LOOKUPS[table]
+        select = f"SELECT {key_column} FROM {table} WHERE " + " AND ".join(
+            f"{column} = ?" for column in columns
+        )
+        row = self.__cnx.execute(select, values).fetchone()
+        if row is None and create:
+            self.__cnx.execute(
+                f"INSERT OR IGNORE INTO {table}({','.join(columns)})"
+                f" values ({','.join('?' * len(columns))})",
+                values,
+            )
+            row = self.__cnx.execute(select, values).fetchone()
+        if row is None:
+            return None
+        new_keys.setdefault(table, {})[values] = row[0]
+        return row[0]
+
     def insert_session(self, h, run_date, scm_id, description):
         self.__cnx.execute(
-            "insert into TEST_SESSIONS(SESSION_H, RUN_DATE, SCM_ID, RUN_DESCRIPTION)"
-            " values (?,?,?,?)",
-            (h, run_date, scm_id, description),
+            "insert into TEST_SESSIONS(SESSION_H, RUN_DATE, SCM_ID, RUN_DESCRIPTION,"
+            " RUN_TS) values (?,?,?,?,?)",
+            (h, run_date, scm_id, description, iso_to_epoch(run_date)),
         )
         self.__cnx.commit()
 
@@ -65,12 +521,10 @@ class SqliteDBHandler:
         cpu_usage,
         mem_usage,
         passed: bool,
+        worker_id=None,
+        measures=None,
     ):
-        self.__cnx.execute(
-            "insert into TEST_METRICS(SESSION_H,ENV_H,ITEM_START_TIME,ITEM,"
-            "ITEM_PATH,ITEM_VARIANT,ITEM_FS_LOC,KIND,COMPONENT,TOTAL_TIME,"
-            "USER_TIME,KERNEL_TIME,CPU_USAGE,MEM_USAGE,TEST_PASSED) "
-            "values (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)",
+        self.__metrics.append(
             (
                 session_id,
                 env_id,
@@ -87,9 +541,27 @@ class SqliteDBHandler:
                 cpu_usage,
                 mem_usage,
                 passed,
-            ),
+                worker_id,
+            )
+            + measure_values(measures)
         )
-        self.__cnx.commit()
+        if len(self.__metrics) >= self.__batch_size or (
+            self.__flush_interval is not None
+            and time.monotonic() - self.__last_flush >= self.__flush_interval
+        ):
+            self.flush()
+
+    def insert_fixture_metric(self, session_id, env_id, *fixture, worker_id=None):
+        """
+        Buffer the costs of a fixture instance, given in the order of
+        FIXTURE_METRICS_COLUMNS (worker id excepted).
+        """
+        self.__fixtures.append((session_id, env_id) + fixture + (worker_id,))
+        if len(self.__metrics) + len(self.__fixtures) >= self.__batch_size or (
+            self.__flush_interval is not None
+            and time.monotonic() - self.__last_flush >= self.__flush_interval
+        ):
+            self.flush()
 
     def insert_execution_context(self, exc_context):
         env_h = exc_context.compute_hash()
@@ -117,55 +589,60 @@ class SqliteDBHandler:
 
     def prepare(self):
         cursor = self.__cnx.cursor()
-        cursor.execute(
-            """
-CREATE TABLE IF NOT EXISTS TEST_SESSIONS(
-    SESSION_H varchar(64) primary key not null unique, -- Session identifier
-    RUN_DATE varchar(64), -- Date of test run
-    SCM_ID varchar(128), -- SCM change id
-    RUN_DESCRIPTION json
-);"""
-        )
-        cursor.execute(
-            """
-CREATE TABLE IF NOT EXISTS TEST_METRICS (
-    SESSION_H varchar(64), -- Session identifier
-    ENV_H varchar(64), -- Environment description identifier
-    ITEM_START_TIME varchar(64), -- Effective start time of the test
-    ITEM_PATH varchar(4096), -- Path of the item, following Python import specification
-    ITEM varchar(2048), -- Name of the item
-    ITEM_VARIANT varchar(2048), -- Optional parametrization of an item.
-    ITEM_FS_LOC varchar(2048), -- Relative path from pytest invocation directory to the item's module.
-    KIND varchar(64), -- Package, Module or function
-    COMPONENT varchar(512) NULL, -- Tested component if any
-    TOTAL_TIME float, -- Total time spent running the item
-    USER_TIME float, -- time spent in user space
-    KERNEL_TIME float, -- time spent in kernel space
-    CPU_USAGE float, -- cpu usage
-    MEM_USAGE float, -- Max resident memory used.
-    TEST_PASSED boolean, -- boolean indicating if test passed
-    FOREIGN KEY (ENV_H) REFERENCES EXECUTION_CONTEXTS(ENV_H),
-    FOREIGN KEY (SESSION_H) REFERENCES TEST_SESSIONS(SESSION_H)
-);"""
-        )
-        cursor.execute(
-            """
-CREATE TABLE IF NOT EXISTS EXECUTION_CONTEXTS (
-   ENV_H varchar(64) primary key not null unique,
-   CPU_COUNT integer,
-   CPU_FREQUENCY_MHZ integer,
-   CPU_TYPE varchar(64),
-   CPU_VENDOR varchar(256),
-   RAM_TOTAL_MB integer,
-   MACHINE_NODE varchar(512),
-   MACHINE_TYPE varchar(32),
-   MACHINE_ARCH varchar(16),
-   SYSTEM_INFO varchar(256),
-   PYTHON_INFO varchar(512)
-);
-"""
+        if self.schema_version >= SQLITE_SCHEMA_VERSION:
+            return
+        if self.__has_legacy_layout():
+            # Databases created by former versions may lack some columns.
+            self.check_create_test_passed_column()
+            self.check_create_worker_id_column()
+        self.__cnx.create_function("PYMON_EPOCH", 1, iso_to_epoch)
+        # Concurrent sessions may open the same database: the first one to
+        # lock it creates or upgrades the tables.
+        cursor.execute("BEGIN IMMEDIATE")
+        migration = ()
+        try:
+            version = self.schema_version
+            if version < SQLITE_SCHEMA_VERSION:
+                if version == 0 and self.__has_legacy_layout():
+                    for table in ("TEST_SESSIONS", "EXECUTION_CONTEXTS", "TEST_METRICS"):
+                        cursor.execute(f"ALTER TABLE {table} RENAME TO LEGACY_{table}")
+                    migration = SQLITE_MIGRATION
+                elif version == 1:
+                    for statement in SQLITE_UPGRADE_V1:
+                        cursor.execute(statement)
+                    migration = SQLITE_MIGRATION_V1
+                elif version >= 2:
+                    cursor.execute("DROP VIEW IF EXISTS TEST_METRICS")
+                for statement in SQLITE_SCHEMA[:5]:  # tables
+                    cursor.execute(statement)
+                self.__add_measure_columns(cursor)
+                for statement in SQLITE_SCHEMA[5:] + migration:
+                    cursor.execute(statement)
+                cursor.execute(f"PRAGMA user_version = {SQLITE_SCHEMA_VERSION}")
+            self.__cnx.commit()
+        except BaseException:
+            self.__cnx.rollback()
+            raise
+        if migration:
+            cursor.execute("VACUUM")  # give the space of the former tables back
+
+    @staticmethod
+    def __add_measure_columns(cursor):
+        cursor.execute("PRAGMA table_info(METRICS)")
+        columns = {column[1] for column in cursor.fetchall()}
+        for name, kind in METRIC_MEASURES:
+            if name not in columns:
+                cursor.execute(f"ALTER TABLE METRICS ADD COLUMN {name} {kind}")
+
+    @property
+    def schema_version(self):
+        return self.query("PRAGMA user_version", ())[0]
+
+    def __has_legacy_layout(self):
+        return self.query(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'TEST_METRICS'",
+            (),
         )
-        self.__cnx.commit()
 
     def get_env_id(self, env_hash):
         query_result = self.query(
@@ -175,7 +652,16 @@ CREATE TABLE IF NOT EXISTS EXECUTION_CONTEXTS (
 
 
 class PostgresDBHandler:
-    def __init__(self):
+    def __init__(self, batch_size=1, flush_interval=None, spool=None, connect=True):
+        self.__batch_size = batch_size
+        self.__flush_interval = flush_interval
+        self.__metrics = []
+        self.__fixtures = []
+        self.__last_flush = time.monotonic()
+        # Metrics that cannot be written are spooled, if possible, and
+        # written again once the database is reachable.
+        self.__spool = spool
+        self.__backoff = Backoff()
         self.__db = os.getenv("PYTEST_MONITOR_DB_NAME")
         if not self.__db:
             raise Exception(
@@ -201,9 +687,33 @@ class PostgresDBHandler:
             raise Exception(
                 "Please provide the postgres port using the PYTEST_MONITOR_DB_PORT environment variable."
             )
+        self.__psycopg = _import_psycopg()
+        self.__cnx = None
+        self.__opened = False
+        if connect:
+            self.open()
+
+    @property
+    def spooling(self):
+        """Tell whether records can be spooled while the database is unreachable."""
+        return self.__spool is not None
+
+    def open(self):
+        """
+        Connect to the database and bring its schema up to date. Until this
+        succeeds, the execution context, the session and the metrics are spooled
+        (if possible) and opening is attempted again on the next flush.
+        """
+        if self.__cnx is not None:
+            self.__cnx.close()
         self.__cnx = self.connect()
         self.prepare()
         self.check_create_test_passed_column()
+        self.check_create_worker_id_column()
+        self.check_create_timestamp_columns()
+        self.check_create_measure_columns()
+        self.create_indexes()
+        self.__opened = True
 
     def check_create_test_passed_column(self):
         cursor = self.__cnx.cursor()
@@ -220,31 +730,248 @@ class PostgresDBHandler:
             )
             self.__cnx.commit()
 
+    def check_create_worker_id_column(self):
+        cursor = self.__cnx.cursor()
+        cursor.execute(
+            "ALTER TABLE TEST_METRICS ADD COLUMN IF NOT EXISTS WORKER_ID varchar(64);"
+        )
+        self.__cnx.commit()
+
+    def check_create_timestamp_columns(self):
+        cursor = self.__cnx.cursor()
+        cursor.execute(
+            "SELECT column_name FROM information_schema.columns"
+            " WHERE table_name = 'test_metrics' AND column_name = 'item_start_ts'"
+        )
+        if cursor.fetchone():
+            return
+        # Backfill times of former metrics, which ISO 8601 dates are read in
+        # the time zone of the server.
+        cursor.execute("ALTER TABLE TEST_METRICS ADD COLUMN ITEM_START_TS float8;")
+        cursor.execute(
+            "UPDATE TEST_METRICS SET ITEM_START_TS ="
+            " extract(epoch from ITEM_START_TIME::timestamptz)"
+            " WHERE ITEM_START_TIME ~ '^\\d{4}-\\d\\d-\\d\\dT'"
+        )
+        cursor.execute("ALTER TABLE TEST_SESSIONS ADD COLUMN IF NOT EXISTS RUN_TS float8;")
+        cursor.execute(
+            "UPDATE TEST_SESSIONS SET RUN_TS = extract(epoch from RUN_DATE::timestamptz)"
+            " WHERE RUN_DATE ~ '^\\d{4}-\\d\\d-\\d\\dT'"
+        )
+        self.__cnx.commit()
+
+    def check_create_measure_columns(self):
+        cursor = self.__cnx.cursor()
+        for name, kind in METRIC_MEASURES:
+            cursor.execute(
+                f"ALTER TABLE TEST_METRICS ADD COLUMN IF NOT EXISTS {name} {kind};"
+            )
+        self.__cnx.commit()
+
+    def create_indexes(self):
+        cursor = self.__cnx.cursor()
+        for statement in METRICS_INDEXES:
+            cursor.execute(statement)
+        self.__cnx.commit()
+
     def close(self):
-        self.__cnx.close()
+        if self.__cnx is None and self.__spool is None:
+            return  # never opened
+        try:
+            self.__backoff.reset()  # last chance to write spooled metrics
+            self.flush()
+            if self.__spool is not None and self.__spool.pending:
+                warnings.warn(
+                    "pytest-monitor: some metrics could not be written to PostgreSQL."
+                    " Run 'pytest-monitor replay' to write them later."
+                )
+        finally:
+            if self.__cnx is not None:
+                self.__cnx.close()
 
     def __del__(self):
-        self.__cnx.close()
+        if self.__cnx is not None:
+            self.__cnx.close()
 
     def connect(self):
         connection_string = (
             f"dbname='{self.__db}' user='{self.__user}' password='{self.__password}' "
             + f"host='{self.__host}' port='{self.__port}'"
         )
-        return psycopg.connect(connection_string)
+        return self.__psycopg.connect(connection_string)
 
     def query(self, what, bind_to, many=False):
         cursor = self.__cnx.cursor()
         cursor.execute(what, bind_to)
         return cursor.fetchall() if many else cursor.fetchone()
 
+    def flush(self):
+        """Write all buffered metrics in a single transaction."""
+        self.__last_flush = time.monotonic()
+        if self.__spool is None:
+            if self.__metrics:
+                deliver(self.__write, "metrics", self.__metrics)
+                self.__metrics = []
+            if self.__fixtures:
+                deliver(self.__write, "fixtures", self.__fixtures)
+                self.__fixtures = []
+            return
+        if not self.__metrics and not self.__fixtures and not self.__spool.pending:
+            return
+        metrics, self.__metrics = self.__metrics, []
+        fixtures, self.__fixtures = self.__fixtures, []
+        if self.__backoff.ready():
+            try:
+                if not self.__opened:
+                    self.open()
+                elif self.__cnx.closed or getattr(self.__cnx, "broken", False):
+                    self.__cnx = self.connect()
+                self.__spool.replay(self.replay)
+                if metrics:
+                    deliver(self.__write, "metrics", metrics)
+                    metrics = []
+                if fixtures:
+                    deliver(self.__write, "fixtures", fixtures)
+                self.__backoff.reset()
+                return
+            except self.__psycopg.Error as e:
+                self.__backoff.failed()
+                warnings.warn(f"pytest-monitor: cannot write metrics to PostgreSQL ({e}).")
+        if metrics:
+            self.__spool.append("metrics", metrics)
+        if fixtures:
+            self.__spool.append("fixtures", fixtures)
+
+    def __write(self, kind, records):
+        if kind == "metrics":
+            self.__insert_metrics(records)
+        else:
+            self.__insert_fixtures(records)
+
+    def __rejected(self, e):
+        """Tell whether an error is due to the records themselves, which are then rejected."""
+        return isinstance(e, (self.__psycopg.DataError, self.__psycopg.IntegrityError))
+
+    def __insert_metrics(self, metrics, idempotent=False):
+        # Start times are kept both as seconds since the epoch and, for
+        # former readers, as ISO 8601 dates.
+        metrics = [
+            (m[0], m[1], epoch_to_iso(m[2])) + tuple(m[3:16]) + (m[2],) + tuple(m[16:])
+            if isinstance(m[2], (int, float))
+            # Spooled by former versions
+            else tuple(m[:16]) + (iso_to_epoch(m[2]),) + tuple(m[16:])
+            for m in metrics
+        ]
+        columns = ",".join(METRICS_COLUMNS)
+        try:
+            cursor = self.__cnx.cursor()
+            if idempotent:
+                # Metrics are staged first, then only those not written yet are
+                # inserted. A metric is identified by its session, item and
+                # start time, compared as the number of seconds written with it
+                # (and indexed) rather than its ISO 8601 rendering.
+                cursor.execute(
+                    "CREATE TEMPORARY TABLE IF NOT EXISTS PYMON_METRICS_STAGING"
+                    " (LIKE TEST_METRICS) ON COMMIT DELETE ROWS"
+                )
+                self.__copy(cursor, "PYMON_METRICS_STAGING", metrics)
+                cursor.execute(
+                    f"INSERT INTO TEST_METRICS({columns}) SELECT {columns}"
+                    " FROM PYMON_METRICS_STAGING S WHERE NOT EXISTS"
+                    " (SELECT 1 FROM TEST_METRICS M WHERE M.SESSION_H = S.SESSION_H"
+                    " AND M.ITEM_START_TS = S.ITEM_START_TS AND M.ITEM = S.ITEM"
+                    " AND M.ITEM_PATH = S.ITEM_PATH AND M.ITEM_VARIANT = S.ITEM_VARIANT"
+                    " AND M.KIND = S.KIND)"
+                )
+            else:
+                self.__copy(cursor, "TEST_METRICS", metrics)
+            self.__cnx.commit()
+        except self.__psycopg.Error as e:
+            if not self.__cnx.closed:
+                self.__cnx.rollback()
+            if self.__rejected(e):
+                raise RejectedError(str(e)) from e
+            raise
+
+    def __insert_fixtures(self, fixtures, idempotent=False):
+        columns = ("SESSION_H", "ENV_H") + FIXTURE_METRICS_COLUMNS
+        values = ",".join(["%s"] * len(columns))
+        statement = f"INSERT INTO FIXTURE_METRICS({','.join(columns)})"
+        if idempotent:
+            # A fixture instance is identified by its session, name and
+            # setup start time.
+            statement += (
+                f" SELECT {values} WHERE NOT EXISTS (SELECT 1 FROM FIXTURE_METRICS"
+                " WHERE SESSION_H = %s AND FIXTURE = %s AND SETUP_START_TS = %s)"
+            )
+            fixtures = [tuple(f) + (f[0], f[2], f[5]) for f in fixtures]
+        else:
+            statement += f" VALUES ({values})"
+        try:
+            self.__cnx.cursor().executemany(statement, fixtures)
+            self.__cnx.commit()
+        except self.__psycopg.Error as e:
+            if not self.__cnx.closed:
+                self.__cnx.rollback()
+            if self.__rejected(e):
+                raise RejectedError(str(e)) from e
+            raise
+
+    @staticmethod
+    def __copy(cursor, table, metrics):
+        """Stream metrics to a table with a single COPY statement."""
+        statement = f"COPY {table}({','.join(METRICS_COLUMNS)}) FROM STDIN"
+        if hasattr(cursor, "copy"):  # psycopg 3
+            with cursor.copy(statement) as copy:
+                for metric in metrics:
+                    copy.write_row(metric)
+        else:
+            cursor.copy_expert(statement, io.StringIO(copy_rows(metrics)))
+
+    def replay(self, kind, records):
+        """
+        Write records read back from a spool. Records already written are skipped.
+        Raises RejectedError if the database refuses them for good.
+        """
+        if kind == "metrics":
+            # Metrics spooled by former versions have no worker id, nor some
+            # of the optional measures.
+            size = 16 + len(METRIC_MEASURES)
+            records = [tuple(r) + (None,) * (size - len(r)) for r in records]
+            self.__insert_metrics(records, idempotent=True)
+        elif kind == "fixtures":
+            self.__insert_fixtures(records, idempotent=True)
+        elif kind == "contexts":
+            for record in records:
+                self.__write_context(record)
+        elif kind == "sessions":
+            for record in records:
+                self.__write_session(record)
+
     def insert_session(self, h, run_date, scm_id, description):
-        self.__cnx.cursor().execute(
-            "insert into TEST_SESSIONS(SESSION_H, RUN_DATE, SCM_ID, RUN_DESCRIPTION)"
-            " values (%s,%s,%s,%s)",
-            (h, run_date, scm_id, description),
+        session = {
+            "session_h": h,
+            "run_date": run_date,
+            "scm_ref": scm_id,
+            "description": description,
+        }
+        if not self.__opened:
+            self.__spool.append("sessions", [session])  # written once opened
+            return
+        self.__write_session(session)
+
+    def __write_session(self, session):
+        self.__execute(
+            "insert into TEST_SESSIONS(SESSION_H, RUN_DATE, SCM_ID, RUN_DESCRIPTION,"
+            " RUN_TS) values (%s,%s,%s,%s,%s) ON CONFLICT (SESSION_H) DO NOTHING",
+            (
+                session["session_h"],
+                session["run_date"],
+                session["scm_ref"],
+                session["description"],
+                iso_to_epoch(session["run_date"]),
+            ),
         )
-        self.__cnx.commit()
 
     def insert_metric(
         self,
@@ -263,12 +990,10 @@ class PostgresDBHandler:
         cpu_usage,
         mem_usage,
         passed: bool,
+        worker_id=None,
+        measures=None,
     ):
-        self.__cnx.cursor().execute(
-            "insert into TEST_METRICS(SESSION_H,ENV_H,ITEM_START_TIME,ITEM,"
-            "ITEM_PATH,ITEM_VARIANT,ITEM_FS_LOC,KIND,COMPONENT,TOTAL_TIME,"
-            "USER_TIME,KERNEL_TIME,CPU_USAGE,MEM_USAGE,TEST_PASSED) "
-            "values (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)",
+        self.__metrics.append(
             (
                 session_id,
                 env_id,
@@ -285,33 +1010,66 @@ class PostgresDBHandler:
                 cpu_usage,
                 mem_usage,
                 passed,
-            ),
+                worker_id,
+            )
+            + measure_values(measures)
         )
-        self.__cnx.commit()
+        if len(self.__metrics) >= self.__batch_size or (
+            self.__flush_interval is not None
+            and time.monotonic() - self.__last_flush >= self.__flush_interval
+        ):
+            self.flush()
+
+    def insert_fixture_metric(self, session_id, env_id, *fixture, worker_id=None):
+        """
+        Buffer the costs of a fixture instance, given in the order of
+        FIXTURE_METRICS_COLUMNS (worker id excepted).
+        """
+        self.__fixtures.append((session_id, env_id) + fixture + (worker_id,))
+        if len(self.__metrics) + len(self.__fixtures) >= self.__batch_size or (
+            self.__flush_interval is not None
+            and time.monotonic() - self.__last_flush >= self.__flush_interval
+        ):
+            self.flush()
 
     def insert_execution_context(self, exc_context):
-        env_h = exc_context.compute_hash()
-        self.__cnx.cursor().execute(
+        if not self.__opened:
+            self.__spool.append("contexts", [exc_context.to_dict()])  # written once opened
+            return
+        self.__write_context(exc_context.to_dict())
+
+    def __write_context(self, context):
+        self.__execute(
             "insert into EXECUTION_CONTEXTS(CPU_COUNT,CPU_FREQUENCY_MHZ,CPU_TYPE,CPU_VENDOR,"
             "RAM_TOTAL_MB,MACHINE_NODE,MACHINE_TYPE,MACHINE_ARCH,SYSTEM_INFO,"
             "PYTHON_INFO,ENV_H) SELECT %s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s"
             " WHERE NOT EXISTS (SELECT 1 FROM EXECUTION_CONTEXTS WHERE ENV_H = %s)",
             (
-                exc_context.cpu_count,
-                exc_context.cpu_frequency,
-                exc_context.cpu_type,
-                exc_context.cpu_vendor,
-                exc_context.ram_total,
-                exc_context.fqdn,
-                exc_context.machine,
-                exc_context.architecture,
-                exc_context.system_info,
-                exc_context.python_info,
-                env_h,
-                env_h,
+                context["cpu_count"],
+                context["cpu_frequency"],
+                context["cpu_type"],
+                context["cpu_vendor"],
+                context["ram_total"],
+                context["machine_node"],
+                context["machine_type"],
+                context["machine_arch"],
+                context["system_info"],
+                context["python_info"],
+                context["h"],
+                context["h"],
             ),
         )
-        self.__cnx.commit()
+
+    def __execute(self, statement, params):
+        try:
+            self.__cnx.cursor().execute(statement, params)
+            self.__cnx.commit()
+        except self.__psycopg.Error as e:
+            if not self.__cnx.closed:
+                self.__cnx.rollback()
+            if self.__rejected(e):
+                raise RejectedError(str(e)) from e
+            raise
 
     def prepare(self):
         cursor = self.__cnx.cursor()
@@ -321,7 +1079,8 @@ CREATE TABLE IF NOT EXISTS TEST_SESSIONS(
     SESSION_H varchar(64) primary key not null unique, -- Session identifier
     RUN_DATE varchar(64), -- Date of test run
     SCM_ID varchar(128), -- SCM change id
-    RUN_DESCRIPTION json
+    RUN_DESCRIPTION json,
+    RUN_TS float8 -- Date of test run, in seconds since the epoch
 );"""
         )
         cursor.execute(
@@ -359,6 +1118,32 @@ CREATE TABLE IF NOT EXISTS TEST_METRICS (
     CPU_USAGE float, -- cpu usage
     MEM_USAGE float, -- Max resident memory used.
     TEST_PASSED boolean, -- boolean indicating if test passed
+    WORKER_ID varchar(64) NULL, -- pytest-xdist worker which ran the item, if any
+    ITEM_START_TS float8, -- Effective start time of the test, in seconds since the epoch
+    FOREIGN KEY (ENV_H) REFERENCES EXECUTION_CONTEXTS(ENV_H),
+    FOREIGN KEY (SESSION_H) REFERENCES TEST_SESSIONS(SESSION_H)
+);"""
+        )
+        cursor.execute(
+            """
+CREATE TABLE IF NOT EXISTS FIXTURE_METRICS (
+    SESSION_H varchar(64), -- Session identifier
+    ENV_H varchar(64), -- Environment description identifier
+    FIXTURE varchar(2048), -- Name of the fixture
+    FIXTURE_PATH varchar(4096), -- Module defining the fixture
+    SCOPE varchar(16), -- Scope of the fixture (function, class, module, package or session)
+    SETUP_START_TS float8, -- Start time of the setup, in seconds since the epoch
+    SETUP_TIME float, -- Time spent setting the fixture up
+    SETUP_USER_TIME float, -- time spent in user space by the setup
+    SETUP_KERNEL_TIME float, -- time spent in kernel space by the setup
+    SETUP_MEM_DELTA float, -- Change of the resident memory during the setup
+    TEARDOWN_TIME float, -- Time spent tearing the fixture down
+    TEARDOWN_USER_TIME float, -- time spent in user space by the teardown
+    TEARDOWN_KERNEL_TIME float, -- time spent in kernel space by the teardown
+    TEARDOWN_MEM_DELTA float, -- Change of the resident memory during the teardown
+    USERS integer, -- Number of tests which used the fixture instance
+    AMORTIZED_TIME float, -- Setup and teardown wall time per test using the fixture instance
+    WORKER_ID varchar(64) NULL, -- pytest-xdist worker which set the fixture up, if any
     FOREIGN KEY (ENV_H) REFERENCES EXECUTION_CONTEXTS(ENV_H),
     FOREIGN KEY (SESSION_H) REFERENCES TEST_SESSIONS(SESSION_H)
 );"""
@@ -371,3 +1156,143 @@ CREATE TABLE IF NOT EXISTS TEST_METRICS (
             "select ENV_H from EXECUTION_CONTEXTS where ENV_H = %s", (env_hash,)
         )
         return query_result[0] if query_result else None
+
+
+class RemoteError(Exception):
+    """Raised when the remote server cannot take what is sent to it for now."""
+
+
+class RemoteHandler:
+    def __init__(self, url, batch_size=1, flush_interval=None, spool=None):
+        import requests  # only loaded when a remote server is used
+
+        self.__url = url
+        # Keep-alive connections to the remote server are pooled by the session.
+        self.__http = requests.Session()
+        self.__errors = (RemoteError, requests.RequestException)
+        self.__bulk = True
+        self.__batch_size = batch_size
+        self.__flush_interval = flush_interval
+        self.__metrics = []
+        self.__last_flush = time.monotonic()
+        # Whatever cannot be sent is spooled, if possible, and sent again
+        # once the server is reachable.
+        self.__spool = spool
+        self.__backoff = Backoff()
+
+    @property
+    def url(self):
+        return self.__url
+
+    @property
+    def errors(self):
+        """Exceptions raised when the server cannot be reached or refuses a request."""
+        return self.__errors
+
+    def close(self):
+        try:
+            self.__backoff.reset()  # last chance to send spooled records
+            self.flush()
+            if self.__spool is not None and self.__spool.pending:
+                warnings.warn(
+                    "pytest-monitor: some records could not be sent to the remote"
+                    " server. Run 'pytest-monitor replay' to send them later."
+                )
+        finally:
+            self.__http.close()
+
+    def get_env_id(self, env_hash):
+        r = self.__http.get(f"{self.__url}/contexts/{env_hash}")
+        if r.status_code == HTTPStatus.OK:
+            remote = json.loads(r.text)
+            if remote["contexts"]:
+                return remote["contexts"][0]["h"]
+        return None
+
+    def insert_session(self, h, run_date, scm_id, description):
+        self.__send(
+            "sessions",
+            [
+                {
+                    "session_h": h,
+                    "run_date": run_date,
+                    "scm_ref": scm_id,
+                    "description": json.loads(description),
+                }
+            ],
+        )
+
+    def insert_execution_context(self, exc_context):
+        self.__send("contexts", [exc_context.to_dict()])
+
+    def insert_metric(self, metric):
+        self.__metrics.append(metric)
+        if len(self.__metrics) >= self.__batch_size or (
+            self.__flush_interval is not None
+            and time.monotonic() - self.__last_flush >= self.__flush_interval
+        ):
+            self.flush()
+
+    def flush(self):
+        """Send all buffered metrics."""
+        metrics, self.__metrics = self.__metrics, []
+        self.__last_flush = time.monotonic()
+        if metrics or (self.__spool is not None and self.__spool.pending):
+            self.__send("metrics", metrics)
+
+    def __send(self, kind, records):
+        if self.__spool is None:
+            deliver(self.replay, kind, records)
+            return
+        if self.__backoff.ready():
+            try:
+                self.__spool.replay(self.replay)
+                if records:
+                    deliver(self.replay, kind, records)
+                self.__backoff.reset()
+                return
+            except self.__errors as e:
+                self.__backoff.failed()
+                warnings.warn(f"pytest-monitor: cannot reach the remote server ({e}).")
+        if records:
+            self.__spool.append(kind, records)
+
+    def replay(self, kind, records):
+        """
+        Send records of the given kind (contexts, sessions or metrics).
+        Metrics are sent all at once, gzip-compressed, to the bulk route. Servers
+        which do not provide that route get them one by one instead.
+        Raises RemoteError if the server cannot take them for now, RejectedError
+        if it refuses them for good.
+        """
+        if kind == "metrics" and self.__bulk and records:
+            r = self.__http.post(
+                f"{self.__url}/metrics/bulk",
+                data=gzip.compress(json.dumps(records).encode()),
+                headers={
+                    "Content-Type": "application/json",
+                    "Content-Encoding": "gzip",
+                },
+            )
+            if r.status_code not in (
+                HTTPStatus.NOT_FOUND,
+                HTTPStatus.METHOD_NOT_ALLOWED,
+                HTTPStatus.NOT_IMPLEMENTED,
+            ):
+                self.__check_created(kind, r)
+                return
+            self.__bulk = False
+        for record in records:
+            headers = {"Idempotency-Key": record["metric_h"]} if kind == "metrics" else {}
+            r = self.__http.post(f"{self.__url}/{kind}/", json=record, headers=headers)
+            self.__check_created(kind, r)
+
+    def __check_created(self, kind, r):
+        # CONFLICT means that an earlier (replayed) attempt already got through.
+        if r.status_code in (HTTPStatus.CREATED, HTTPStatus.CONFLICT):
+            return
+        # Servers busy or failing may take the records later, other client
+        # errors will never accept them.
+        if r.status_code == HTTPStatus.TOO_MANY_REQUESTS or r.status_code >= 500:
+            raise RemoteError(f"cannot insert {kind} ({r.status_code})")
+        raise RejectedError(f"{kind} refused ({r.status_code})")
@@ -0,0 +1,648 @@
+# -*- coding: utf-8 -*-
+"""
+Hooks and fixtures measuring the tests. They are registered by the plugin
+(see pytest_monitor.pytest_monitor) only when monitoring is enabled.
+"""
+import gc
+import os
+import time
+import warnings
+
+import pytest
+
+from pytest_monitor.benchmark import run_repeated
+from pytest_monitor.profiler import memory_usage
+from pytest_monitor.session import PyTestMonitorSession
+
+# These dictionaries are used to compute members set on each items.
+# KEY is the marker set on a test function
+# value is a tuple:
+#  expected argument: name of the argument, given by position or keyword, or None
+#  internal marker attribute name: str
+#  callable that set member's value
+#  default value
+PYTEST_MONITOR_VALID_MARKERS = {
+    "monitor_skip_test": (None, "monitor_skip_test", lambda x: True, False),
+    "monitor_skip_test_if": ("cond", "monitor_skip_test", lambda x: bool(x), False),
+    "monitor_test": (None, "monitor_force_test", lambda x: True, False),
+    "monitor_test_if": ("cond", "monitor_force_test", lambda x: bool(x), False),
+    "monitor_repeat": ("n", "monitor_repeat", lambda x: int(x), None),
+}
+PYTEST_MONITOR_DEPRECATED_MARKERS = {}
+# Kinds of items which can be monitored (see --restrict-scope-to)
+PYTEST_MONITOR_SCOPES = ("function", "class", "module", "package", "session")
+PYTEST_MONITOR_ITEM_LOC_MEMBER = (
+    "_location" if tuple(pytest.__version__.split(".")) < ("5", "3") else "location"
+)
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_setup(item):
+    """
+    Validate marker setup and print warnings if usage of deprecated marker is identified.
+    Setting marker attribute to the discovered item is done after the above described verification.
+    The setup phase of monitored tests is then measured.
+    :param item: Test item
+    """
+    setattr(item, "monitor_phases", {})  # Also read by the teardown if markers are invalid
+    item_markers = {
+        mark.name: mark
+        for mark in item.iter_markers()
+        if mark and mark.name.startswith("monitor_")
+    }
+    mark_to_del = []
+    for set_marker in item_markers.keys():
+        if set_marker not in PYTEST_MONITOR_VALID_MARKERS:
+            warnings.warn(
+                "Nothing known about marker {}. Marker will be dropped.".format(
+                    set_marker
+                )
+            )
+            mark_to_del.append(set_marker)
+        if set_marker in PYTEST_MONITOR_DEPRECATED_MARKERS:
+            warnings.warn(
+                f"Marker {set_marker} is deprecated. Consider upgrading your tests"
+            )
+
+    for marker in mark_to_del:
+        del item_markers[marker]
+
+    all_valid_markers = PYTEST_MONITOR_VALID_MARKERS
+    all_valid_markers.update(PYTEST_MONITOR_DEPRECATED_MARKERS)
+    # Setting instantiated markers
+    for marker, mark in item_markers.items():
+        arg, attr, fun_val, _ = all_valid_markers[marker]
+        if arg is None:
+            attr_val = fun_val(None)
+        elif mark.args:
+            attr_val = fun_val(mark.args[0])
+        elif arg in mark.kwargs:
+            attr_val = fun_val(mark.kwargs[arg])
+        else:
+            raise pytest.UsageError(
+                f"Invalid usage: marker {marker} of {item.nodeid} expects"
+                f" its argument {arg}, by position or keyword!"
+            )
+        setattr(item, attr, attr_val)
+
+    # Setting other markers to default values
+    for marker, marker_value in all_valid_markers.items():
+        _, attr, _, default = marker_value
+        if not hasattr(item, attr):
+            setattr(item, attr, default)
+
+    # Finalize marker processing by enforcing some marker's value
+    if item.monitor_force_test:
+        # This test has been explicitly flagged as 'to be monitored'.
+        item.monitor_skip_test = False
+    if not item.session.pytest_monitor.monitors("function"):
+        # Only coarser scopes are monitored: tests are run as is.
+        item.monitor_skip_test = True
+
+    _open_packages(item)
+    phase = _start_phase(item)
+    yield
+    _stop_phase(item, "setup", phase)
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_teardown(item, nextitem):
+    phase = _start_phase(item)
+    yield
+    _stop_phase(item, "teardown", phase)
+    _close_packages(item, nextitem)
+
+
+def _start_phase(item):
+    """Start measuring a phase (setup or teardown) of a monitored test."""
+    if getattr(item, "monitor_skip_test", False):
+        return None
+    monitor = item.session.pytest_monitor
+    rss = monitor.sampler.resident()
+    # The session sampler also measures the call phase: phases never overlap.
+    monitor.sampler.start_measure()
+    return monitor.process.cpu_times(), rss
+
+
+def _stop_phase(item, phase, start):
+    """Store the CPU times and memory peak of a phase; its duration is reported later."""
+    if start is None:
+        return
+    cpu_times, rss = start
+    monitor = item.session.pytest_monitor
+    peak, _ = monitor.sampler.stop_measure()
+    times = monitor.process.cpu_times()
+    item.monitor_phases.update(
+        {
+            f"{phase}_user_time": times.user - cpu_times.user,
+            f"{phase}_kernel_time": times.system - cpu_times.system,
+            f"{phase}_mem_usage": max(peak - rss, 0.0),
+        }
+    )
+
+
+@pytest.hookimpl(tryfirst=True, hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+    """
+    Used to identify the current call to add times. Metrics of a test are stored
+    once it is torn down, along with the measures of its setup and teardown.
+    :param item: Test item
+    :param call: call instance associated to the given item
+    """
+    outcome = yield
+    rep = outcome.get_result()
+
+    if rep.when == "call":
+        setattr(item, "test_run_duration", call.stop - call.start)
+        setattr(item, "test_effective_start_time", call.start)
+    elif hasattr(item, "monitor_phases"):
+        item.monitor_phases[f"{rep.when}_time"] = call.stop - call.start
+    if rep.when == "teardown" and getattr(item, "monitor_metric", None):
+        args, measures = item.monitor_metric
+        setattr(item, "monitor_metric", None)
+        measures = dict(measures or {}, **item.monitor_phases)
+        item.session.pytest_monitor.add_test_info(*args, measures)
+    if rep.when == "teardown" and hasattr(item.config, "workeroutput"):
+        # pytest-xdist worker: what was collected goes to the controller along
+        # with the report (see pytest_runtest_logreport), rather than when the
+        # worker finishes, so that it is not lost if the worker crashes.
+        metrics, fixtures = item.session.pytest_monitor.hand_over_collected()
+        if metrics or fixtures:
+            setattr(rep, "pytest_monitor", (metrics, fixtures))
+
+
+def pytest_runtest_call(item):
+    setattr(item, "monitor_results", False)
+    # Count the tests using each fixture instance, to amortize its cost.
+    fixtureinfo = getattr(item, "_fixtureinfo", None)
+    if fixtureinfo is not None:
+        for name in item.fixturenames:
+            fixturedefs = fixtureinfo.name2fixturedefs.get(name)
+            if fixturedefs and getattr(fixturedefs[-1], "monitor_fixture", None):
+                fixturedefs[-1].monitor_fixture.users += 1
+    if hasattr(item, "module"):
+        setattr(
+            item,
+            "monitor_component",
+            getattr(item.module, "pytest_monitor_component", ""),
+        )
+    else:
+        setattr(item, "monitor_skip_test", True)
+
+
+@pytest.hookimpl
+def pytest_pyfunc_call(pyfuncitem):
+    """
+    Core sniffer logic. We encapsulate the test function in a sniffer function to collect
+    memory results. Tests which are not monitored are left to pytest.
+    """
+    if getattr(pyfuncitem, "monitor_skip_test", False):
+        return None
+
+    def wrapped_function():
+        try:
+            funcargs = pyfuncitem.funcargs
+            testargs = {arg: funcargs[arg] for arg in pyfuncitem._fixtureinfo.argnames}
+            pyfuncitem.obj(**testargs)
+        except Exception:
+            raise
+        except BaseException:
+            raise
+
+    def prof():
+        process = pyfuncitem.session.pytest_monitor.process
+        sampler = pyfuncitem.session.pytest_monitor.sampler
+        rss_a = sampler.resident()
+        ptimes_a = process.cpu_times()
+        (memuse, exception) = memory_usage((wrapped_function, ()), sampler=sampler)
+        ptimes_b = process.cpu_times()
+        rss_b = sampler.resident()
+        # Peak and retained memory over what the process held before the test.
+        setattr(pyfuncitem, "mem_usage", max(memuse - rss_a, 0.0))
+        setattr(pyfuncitem, "mem_retained", rss_b - rss_a)
+        setattr(
+            pyfuncitem,
+            "monitor_cpu_times",
+            (ptimes_b.user - ptimes_a.user, ptimes_b.system - ptimes_a.system),
+        )
+        setattr(pyfuncitem, "monitor_results", True)
+
+        if isinstance(exception, BaseException):  # Do we have any outcome?
+            if pyfuncitem.session.config.option.mtr_disable_monitoring_failed:
+                setattr(pyfuncitem, "monitor_results", False)
+            setattr(pyfuncitem, "passed", False)
+            raise exception
+
+        setattr(pyfuncitem, "passed", True)
+
+    def prof_repeated(repeat, warmup, ci, budget):
+        monitor = pyfuncitem.session.pytest_monitor
+        samples, exception = run_repeated(
+            wrapped_function,
+            monitor.process,
+            monitor.sampler,
+            repeat,
+            warmup,
+            ci,
+            budget,
+            pyfuncitem.config.option.mtr_max_repeat,
+        )
+        setattr(pyfuncitem, "monitor_samples", samples)
+        setattr(pyfuncitem, "monitor_results", len(samples) > 0)
+
+        if exception is not None:
+            if pyfuncitem.session.config.option.mtr_disable_monitoring_failed:
+                setattr(pyfuncitem, "monitor_results", False)
+            setattr(pyfuncitem, "passed", False)
+            raise exception
+
+        setattr(pyfuncitem, "passed", True)
+
+    if not pyfuncitem.session.config.option.mtr_disable_gc:
+        gc.collect()
+    repeat, warmup, ci, budget = _repetitions(pyfuncitem)
+    if repeat == 1 and not warmup and ci is None:
+        prof()
+    else:
+        prof_repeated(repeat, warmup, ci, budget)
+    return True
+
+
+def _repetitions(item):
+    """
+    Number of measured and warmup runs of a test, target confidence interval
+    and time budget of adaptive runs, given by its monitor_repeat marker or
+    else by the --monitor-repeat, --monitor-warmup, --monitor-ci and
+    --monitor-budget options. Unmonitored tests are run once.
+    """
+    if getattr(item, "monitor_skip_test", False):
+        return 1, 0, None, None
+    option = item.config.option
+    marker = item.get_closest_marker("monitor_repeat")
+    if marker is not None and getattr(item, "monitor_repeat", None) is not None:
+        repeat, warmup = item.monitor_repeat, int(marker.kwargs.get("warmup", 0))
+        ci = marker.kwargs.get("ci")
+        budget = marker.kwargs.get("budget", option.mtr_budget)
+        budget = None if budget is None else float(budget)  # None: no time limit
+    else:
+        repeat, warmup = option.mtr_repeat, option.mtr_warmup
+        ci, budget = option.mtr_ci, option.mtr_budget
+    if repeat < 1 or warmup < 0:
+        raise pytest.UsageError(
+            f"Invalid usage: {item.nodeid} must be run at least once"
+            f" with a positive number of warmup runs (got {repeat} and {warmup})!"
+        )
+    if ci is not None and (float(ci) <= 0 or (budget is not None and budget <= 0)):
+        raise pytest.UsageError(
+            f"Invalid usage: the confidence interval and time budget of {item.nodeid}"
+            f" must be positive (got {ci} and {budget})!"
+        )
+    return repeat, warmup, None if ci is None else float(ci), budget
+
+
+class _FixtureCost:
+    """Setup and teardown costs of a fixture instance, and number of tests using it."""
+
+    def __init__(self, fixturedef, monitor):
+        self.users = 0
+        self.__fixturedef = fixturedef
+        self.__monitor = monitor
+        self.__setup = None
+        self.__start_time = time.time()
+        self.__start = self.__snapshot()
+
+    def __snapshot(self):
+        monitor = self.__monitor
+        return time.perf_counter(), monitor.process.cpu_times(), monitor.sampler.resident()
+
+    def __elapsed(self):
+        """Wall time, user time, kernel time and memory delta since the last snapshot."""
+        start, end = self.__start, self.__snapshot()
+        return (
+            end[0] - start[0],
+            end[1].user - start[1].user,
+            end[1].system - start[1].system,
+            end[2] - start[2],
+        )
+
+    def setup_done(self):
+        self.__setup = self.__elapsed()
+        setattr(self.__fixturedef, "monitor_fixture", self)
+
+    def teardown_started(self):
+        self.__start = self.__snapshot()
+
+    def teardown_done(self):
+        if self.__setup is None:  # The setup failed
+            return
+        teardown = self.__elapsed()
+        setattr(self.__fixturedef, "monitor_fixture", None)
+        self.__monitor.add_fixture_info(
+            self.__fixturedef.argname,
+            getattr(self.__fixturedef.func, "__module__", ""),
+            self.__fixturedef.scope,
+            self.__start_time,
+            *self.__setup,
+            *teardown,
+            self.users,
+        )
+
+
+def _is_direct_param(fixturedef):
+    # Its module moved from _pytest.fixtures to _pytest.python with pytest 8.
+    name = getattr(fixturedef.func, "__name__", "")
+    module = getattr(fixturedef.func, "__module__", "")
+    return name == "get_direct_param_fixture_func" and module.startswith("_pytest.")
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_fixture_setup(fixturedef, request):
+    """
+    Measure the setup of fixtures and, once they are finalized, their teardown.
+    The fixtures of pytest-monitor itself are not measured, nor those made by
+    pytest for the arguments of parametrize.
+    """
+    monitor = getattr(request.session, "pytest_monitor", None)
+    if monitor is None or fixturedef.argname.startswith("_prf_") or _is_direct_param(fixturedef):
+        yield
+        return
+    cost = _FixtureCost(fixturedef, monitor)
+    # Finalizers are run last in, first out: this one is run once the fixture
+    # is torn down...
+    fixturedef.addfinalizer(cost.teardown_done)
+    outcome = yield
+    if outcome.excinfo is None:
+        cost.setup_done()
+    # ... and this one before its own finalizers.
+    fixturedef.addfinalizer(cost.teardown_started)
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_sessionstart(session):
+    """
+    Instantiate a monitor session to save collected metrics.
+    We yield at the end to let pytest pursue the execution.
+    """
+    if (
+        session.config.option.mtr_force_component
+        and session.config.option.mtr_component_prefix
+    ):
+        raise pytest.UsageError(
+            "Invalid usage: --force-component and --component-prefix are incompatible options!"
+        )
+    component = (
+        session.config.option.mtr_force_component
+        or session.config.option.mtr_component_prefix
+    )
+    if session.config.option.mtr_component_prefix:
+        component += ".{user_component}"
+    if not component:
+        component = "{user_component}"
+    db = (
+        None
+        if (
+            session.config.option.mtr_none
+            or session.config.option.mtr_no_db
+            or session.config.option.mtr_use_postgres
+        )
+        else session.config.option.mtr_db_out
+    )
+    remote = (
+        None if session.config.option.mtr_none else session.config.option.mtr_remote
+    )
+    scope = [
+        kind.strip() for kind in session.config.option.mtr_scope.split(",") if kind.strip()
+    ]
+    for kind in scope:
+        if kind not in PYTEST_MONITOR_SCOPES:
+            raise pytest.UsageError(
+                f"Invalid usage: unknown scope '{kind}' given to --restrict-scope-to"
+                f" (expected {', '.join(PYTEST_MONITOR_SCOPES)})!"
+            )
+    db_pragmas = {}
+    for pragma in session.config.option.mtr_db_pragmas:
+        name, sep, value = pragma.partition("=")
+        if not sep:
+            raise pytest.UsageError(
+                f"Invalid usage: --db-pragma expects NAME=VALUE, got '{pragma}'!"
+            )
+        db_pragmas[name.strip()] = value.strip()
+    # Under pytest-xdist, workers hand their metrics over to the controller
+    # which is the only one to store them.
+    worker = hasattr(session.config, "workerinput")
+    session.pytest_monitor = PyTestMonitorSession(
+        db=None if worker else db,
+        use_postgres=session.config.option.mtr_use_postgres and not worker,
+        remote=None if worker else remote,
+        component=component,
+        scope=scope,
+        tracing=not session.config.option.mtr_none,
+        sampler=session.config.option.mtr_sampler,
+        db_batch_size=session.config.option.mtr_db_batch_size,
+        db_flush_interval=session.config.option.mtr_db_flush_interval,
+        queue_size=session.config.option.mtr_queue_size,
+        remote_batch_size=session.config.option.mtr_remote_batch_size,
+        spool_dir=session.config.option.mtr_spool_dir,
+        collect=worker,
+        db_pragmas=db_pragmas,
+        refresh_context=session.config.option.mtr_refresh_context,
+    )
+    # Reachable from pytest-xdist hooks, which only get the configuration.
+    session.config.pytest_monitor = session.pytest_monitor
+    if worker:
+        session.pytest_monitor.prepare()
+    else:
+        session.pytest_monitor.compute_info(
+            session.config.option.mtr_description, session.config.option.mtr_tags
+        )
+    yield
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_sessionfinish(session):
+    # Also reached on interruption or internal error: closing the monitor
+    # session writes metrics still buffered.
+    if getattr(session, "pytest_monitor", None) is not None:
+        session.pytest_monitor.close()
+        if hasattr(session.config, "workeroutput"):
+            session.config.workeroutput[
+                "pytest_monitor"
+            ] = session.pytest_monitor.collected_metrics
+            session.config.workeroutput[
+                "pytest_monitor_fixtures"
+            ] = session.pytest_monitor.collected_fixtures
+    yield
+
+
+def pytest_terminal_summary(terminalreporter):
+    """Report the metrics which could not be stored."""
+    monitor = getattr(terminalreporter.config, "pytest_monitor", None)
+    if monitor is not None and monitor.dropped_metrics:
+        terminalreporter.write_sep("=", "pytest-monitor")
+        terminalreporter.write_line(
+            f"{monitor.dropped_metrics} metric(s) could not be stored.", yellow=True
+        )
+
+
+def pytest_runtest_logreport(report):
+    """Store the metrics sent by a pytest-xdist worker along with a test report."""
+    node = getattr(report, "node", None)  # Worker which sent the report, if any
+    payload = getattr(report, "pytest_monitor", None)
+    monitor = getattr(getattr(node, "config", None), "pytest_monitor", None)
+    if payload and monitor is not None:
+        metrics, fixtures = payload
+        monitor.add_worker_metrics(node.workerinput["workerid"], metrics, fixtures)
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_testnodedown(node, error):
+    """Store the metrics left by a pytest-xdist worker that has finished."""
+    output = getattr(node, "workeroutput", {})
+    metrics = output.get("pytest_monitor")
+    fixtures = output.get("pytest_monitor_fixtures") or ()
+    monitor = getattr(node.config, "pytest_monitor", None)
+    if (metrics or fixtures) and monitor is not None:
+        monitor.add_worker_metrics(node.workerinput["workerid"], metrics or (), fixtures)
+
+
+@pytest.fixture(autouse=True, scope="module")
+def _prf_module_tracer(request):
+    item = request.node.name[:-3]
+    yield from _trace_scope(
+        request,
+        "module",
+        item,
+        request.module.__name__[: -len(item) - 1],
+        getattr(request.module, "pytest_monitor_component", ""),
+    )
+
+
+def _open_scope(monitor):
+    """Start measuring a scope spanning several tests."""
+    rss = monitor.sampler.resident()
+    return time.time(), monitor.process.cpu_times(), rss, monitor.sampler.open_scope()
+
+
+def _close_scope(monitor, state, item, item_path, item_loc, kind, component=""):
+    """Store the measures of a scope opened by _open_scope."""
+    t_a, ptimes_a, rss_a, scope = state
+    peak = monitor.sampler.close_scope(scope)
+    ptimes_b = monitor.process.cpu_times()
+    t_z = time.time()
+    rss_b = monitor.sampler.resident()
+    monitor.add_test_info(
+        item,
+        item_path,
+        "",
+        item_loc,
+        kind,
+        component,
+        t_a,
+        t_z - t_a,
+        ptimes_b.user - ptimes_a.user,
+        ptimes_b.system - ptimes_a.system,
+        max(peak - rss_a, 0.0),
+        True,
+        {"mem_retained": rss_b - rss_a},
+    )
+
+
+def _trace_scope(request, kind, item, item_path, component=""):
+    """
+    Measure a scope spanning several tests (module, class or session). Its
+    peak memory is tracked by the session sampler along with the tests.
+    """
+    monitor = request.session.pytest_monitor
+    if not monitor.monitors(kind):
+        yield
+        return
+    state = _open_scope(monitor)
+    yield
+    _close_scope(monitor, state, item, item_path, request.node.nodeid, kind, component)
+
+
+@pytest.fixture(autouse=True, scope="class")
+def _prf_class_tracer(request):
+    if request.cls is None:  # Test functions out of any class
+        yield
+        return
+    yield from _trace_scope(
+        request,
+        "class",
+        request.cls.__name__,
+        request.module.__name__,
+        getattr(request.module, "pytest_monitor_component", ""),
+    )
+
+
+@pytest.fixture(autouse=True, scope="session")
+def _prf_session_tracer(request):
+    name = os.path.basename(str(request.config.rootdir))
+    yield from _trace_scope(request, "session", name, "")
+
+
+def _open_packages(item):
+    """
+    Start measuring the packages entered by a test, before it is set up.
+    Packages are not traced by a fixture: fixtures of plugins scoped to a
+    package are set up once for the whole session.
+    """
+    monitor = item.session.pytest_monitor
+    if not monitor.monitors("package"):
+        return
+    packages = getattr(item.session, "monitor_packages", {})
+    for node in item.listchain():
+        if isinstance(node, pytest.Package) and node.nodeid not in packages:
+            packages[node.nodeid] = _open_scope(monitor)
+    setattr(item.session, "monitor_packages", packages)
+
+
+def _close_packages(item, nextitem):
+    """Store the measures of the packages left once a test is torn down."""
+    packages = getattr(item.session, "monitor_packages", None)
+    if not packages:
+        return
+    monitor = item.session.pytest_monitor
+    remaining = {node.nodeid for node in nextitem.listchain()} if nextitem else set()
+    for node in reversed(item.listchain()):
+        if node.nodeid not in packages or node.nodeid in remaining:
+            continue
+        pypath, _, name = node.nodeid.replace("/", ".").rpartition(".")
+        _close_scope(monitor, packages.pop(node.nodeid), name, pypath, node.nodeid, "package")
+
+
+@pytest.fixture(autouse=True)
+def _prf_tracer(request):
+    yield
+    # Metrics are only stored once the test is torn down, along with the
+    # measures of its setup and teardown (see pytest_runtest_makereport).
+    if not request.node.monitor_skip_test and getattr(
+        request.node, "monitor_results", False
+    ):
+        item_name = request.node.originalname or request.node.name
+        item_loc = getattr(request.node, PYTEST_MONITOR_ITEM_LOC_MEMBER)[0]
+        samples = getattr(request.node, "monitor_samples", None)
+        if samples:
+            # Repeated runs: medians of the measured runs.
+            total_time, user_time, kernel_time, mem_usage = samples.medians()
+            measures = samples.measures()
+        else:
+            total_time = request.node.test_run_duration
+            user_time, kernel_time = request.node.monitor_cpu_times
+            mem_usage = request.node.mem_usage
+            measures = {"mem_retained": request.node.mem_retained}
+        args = (
+            item_name,
+            request.module.__name__,
+            request.node.name,
+            item_loc,
+            "function",
+            request.node.monitor_component,
+            request.node.test_effective_start_time,
+            total_time,
+            user_time,
+            kernel_time,
+            mem_usage,
+            getattr(request.node, "passed", False),
+        )
+        setattr(request.node, "monitor_metric", (args, measures))
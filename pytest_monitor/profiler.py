@@ -36,12 +36,17 @@
 # DAMAGE.
 
 import os
+import threading
+import warnings
 from signal import SIGKILL
 from typing import Any, Callable, Tuple
 
 import psutil
 
+from pytest_monitor.samplers import SAMPLERS  # noqa: F401
+
 _TWO_20 = float(2**20)
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
 
 try:
     from multiprocessing import Pipe, Process
@@ -50,7 +55,7 @@ except ImportError:
     raise
 
 
-def memory_usage(proc: Tuple[Callable, Any, Any], retval=False):
+def memory_usage(proc: Tuple[Callable, Any, Any], retval=False, sampler=None):
     """
     Return the memory usage of a process or piece of code
 
@@ -68,6 +73,10 @@ def memory_usage(proc: Tuple[Callable, Any, Any], retval=False):
         function. Return value of memory_usage becomes a tuple:
         (mem_usage, retval)
 
+    sampler : MemSampler, optional
+        A running MemSampler to drive instead of spawning a dedicated
+        MemTimer process for this single measure.
+
     Returns
     -------
     mem_usage : list of floating-point values
@@ -95,6 +104,9 @@ def memory_usage(proc: Tuple[Callable, Any, Any], retval=False):
         else:
             raise ValueError
 
+        if sampler is not None:
+            return _sampled_usage(sampler, f, args, kw, retval)
+
         current_iter = 0
         while True:
             current_iter += 1
@@ -140,6 +152,22 @@ def memory_usage(proc: Tuple[Callable, Any, Any], retval=False):
     return ret
 
 
+def _sampled_usage(sampler, f, args, kw, retval):
+    # The sampler outlives the measure: whatever happens in f, it only has to
+    # be told to stop sampling. Nothing is left to be killed here.
+    sampler.start_measure()
+    try:
+        returned = f(*args, **kw)
+    except BaseException as e:
+        mem_usage, _ = sampler.stop_measure()
+        return mem_usage, e
+    mem_usage, _ = sampler.stop_measure()
+    ret = mem_usage, None
+    if retval:
+        ret = ret, returned
+    return ret
+
+
 class MemTimer(Process):
     """
     Fetch memory consumption from over a time interval
@@ -172,6 +200,307 @@ class MemTimer(Process):
         self.pipe.send(self.n_measurements)
 
 
+_SAMPLER_START = 1
+_SAMPLER_STOP = 2
+_SAMPLER_EXIT = 3
+
+
+class MemSampler(Process):
+    """
+    Fetch memory consumption over successive time intervals using a single
+    long-lived process.
+
+    Unlike MemTimer, the sampler is started once (usually for the whole pytest
+    session) and then driven through its pipe: each measure is bracketed by
+    start_measure() and stop_measure(), the latter returning the peak memory
+    observed since the former along with the number of measurements done.
+    """
+
+    def __init__(self, monitor_pid, interval=0.1, *args, **kw):
+        self.monitor_pid = monitor_pid
+        self.interval = interval
+        self.pipe, self.child_pipe = Pipe()
+        super(MemSampler, self).__init__(*args, **kw)
+        self.daemon = True
+
+    def run(self):
+        # Only the monitored process holds the other end: if it dies without
+        # closing the sampler (e.g. a crashed pytest-xdist worker), the pipe is
+        # closed and the sampler exits instead of holding the inherited stdio.
+        self.pipe.close()
+        try:
+            self.__sample()
+        except (EOFError, OSError):
+            pass
+
+    def __sample(self):
+        get_memory = _MemoryReader(self.monitor_pid)
+        while self.child_pipe.recv() == _SAMPLER_START:
+            # get baseline memory usage
+            mem_usage = get_memory()
+            n_measurements = 1
+            self.child_pipe.send(0)  # we're ready
+            stop = False
+            while True:
+                cur_mem = get_memory()
+                mem_usage = max(cur_mem, mem_usage)
+                n_measurements += 1
+                if stop:
+                    break
+                stop = self.child_pipe.poll(self.interval)
+                # do one more iteration
+
+            self.child_pipe.recv()  # consume the stop request
+            self.child_pipe.send((mem_usage, n_measurements))
+        get_memory.close()
+
+    def start_measure(self):
+        self.pipe.send(_SAMPLER_START)
+        self.pipe.recv()  # wait until we start getting memory
+
+    def stop_measure(self):
+        self.pipe.send(_SAMPLER_STOP)
+        return self.pipe.recv()
+
+    def close(self):
+        if self.is_alive():
+            self.pipe.send(_SAMPLER_EXIT)
+            self.join(5 * self.interval)
+        if self.is_alive():
+            self.kill()
+            self.join()
+
+
+class ThreadSampler(threading.Thread):
+    """
+    Fetch memory consumption of the current process from a daemon thread.
+
+    This is the in-process counterpart of MemSampler: no process is forked and
+    each sample is a single read of /proc/self/statm (when available). It shares
+    MemSampler's interface so that both can be handed to memory_usage.
+    """
+
+    def __init__(self, interval=0.1):
+        super(ThreadSampler, self).__init__(name="pytest-monitor-sampler")
+        self.daemon = True
+        self.interval = interval
+        self.get_memory = _MemoryReader(os.getpid())
+        self.mem_usage = 0.0
+        self.n_measurements = 0
+        self.__cond = threading.Condition()
+        self.__measuring = False
+        self.__exit = False
+
+    def run(self):
+        with self.__cond:
+            while not self.__exit:
+                if self.__measuring:
+                    self.__sample()
+                    self.__cond.wait(self.interval)
+                else:
+                    self.__cond.wait()
+
+    def __sample(self):
+        self.mem_usage = max(self.get_memory(), self.mem_usage)
+        self.n_measurements += 1
+
+    def start_measure(self):
+        with self.__cond:
+            # get baseline memory usage
+            self.mem_usage = self.get_memory()
+            self.n_measurements = 1
+            self.__measuring = True
+            self.__cond.notify()
+
+    def stop_measure(self):
+        with self.__cond:
+            self.__measuring = False
+            self.__sample()  # do one more iteration
+            return self.mem_usage, self.n_measurements
+
+    def close(self):
+        with self.__cond:
+            self.__exit = True
+            self.__cond.notify()
+        if self.is_alive():
+            self.join()
+        self.get_memory.close()
+
+
+class HWMSampler:
+    """
+    Fetch the peak memory consumption of the current process as tracked by the
+    Linux kernel.
+
+    Starting a measure resets the resident set high water mark by writing 5 to
+    /proc/self/clear_refs; stopping it reads VmHWM back from /proc/self/status.
+    No polling is involved, so even the shortest allocation spikes are caught.
+    Raises OSError if the kernel does not allow resetting the high water mark.
+    """
+
+    def __init__(self):
+        self.__clear_refs = None
+        self.__status = None
+        try:
+            self.__clear_refs = os.open("/proc/self/clear_refs", os.O_WRONLY)
+            self.__status = os.open("/proc/self/status", os.O_RDONLY)
+            self.start_measure()
+            self.stop_measure()
+        except (OSError, AttributeError, ValueError) as e:
+            self.close()
+            raise OSError(f"Cannot reset resident memory peak: {e}") from e
+
+    def __read_hwm(self):
+        status = os.pread(self.__status, 8192, 0)
+        start = status.index(b"VmHWM:")
+        hwm = status[start:].split(maxsplit=2)[1]
+        return int(hwm) / 1024.0  # kB to MiB
+
+    def start_measure(self):
+        os.write(self.__clear_refs, b"5")
+
+    def stop_measure(self):
+        return self.__read_hwm(), 1
+
+    def close(self):
+        for fd in (self.__clear_refs, self.__status):
+            if fd is not None:
+                os.close(fd)
+        self.__clear_refs = self.__status = None
+
+
+class PeakTracker:
+    """
+    Share a sampler between measures, which never overlap (a test and each of
+    its phases), and scopes, which span many of them (classes, modules...).
+
+    The sampler only measures one interval at a time: it is stopped and
+    restarted whenever a measure or a scope starts or ends, and the peak of
+    each interval is given to the measure and to every scope in progress.
+    While scopes are open, the sampler keeps measuring between measures.
+    Without open scopes, measures drive the sampler directly. PeakTracker
+    shares the samplers' interface so that it can be handed to memory_usage.
+    Peaks are absolute: resident() gives the baseline they are compared to.
+    """
+
+    def __init__(self, sampler):
+        self.sampler = sampler
+        self.__reader = _MemoryReader(os.getpid())
+        self.__running = False
+        self.__measure = None  # peak of the measure in progress
+        self.__scopes = {}  # peak of each open scope, by token
+        self.__next_token = 0
+
+    def __checkpoint(self):
+        if not self.__running:
+            return
+        peak, _ = self.sampler.stop_measure()
+        self.__running = False
+        if self.__measure is not None:
+            self.__measure = max(self.__measure, peak)
+        for token, value in self.__scopes.items():
+            self.__scopes[token] = max(value, peak)
+
+    def __resume(self):
+        if self.__measure is not None or self.__scopes:
+            self.sampler.start_measure()
+            self.__running = True
+
+    def start_measure(self):
+        self.__checkpoint()
+        self.__measure = 0.0
+        self.__resume()
+
+    def stop_measure(self):
+        self.__checkpoint()
+        peak, self.__measure = self.__measure, None
+        self.__resume()
+        return peak, 1
+
+    def open_scope(self):
+        """Start tracking the peak of a scope, identified by the returned token."""
+        self.__checkpoint()
+        token = self.__next_token
+        self.__next_token += 1
+        self.__scopes[token] = 0.0
+        self.__resume()
+        return token
+
+    def close_scope(self, token):
+        """Return the peak memory usage (in MiB) since the scope was opened."""
+        self.__checkpoint()
+        peak = self.__scopes.pop(token)
+        self.__resume()
+        return peak
+
+    def resident(self):
+        """Return the current resident memory (in MiB) of the process."""
+        return self.__reader()
+
+    def close(self):
+        self.__checkpoint()
+        self.sampler.close()
+        self.__reader.close()
+
+
+def create_sampler(kind="process", interval=0.1):
+    """
+    Build and start a sampler monitoring the current process.
+
+    :param kind: either 'process' (MemSampler), 'thread' (ThreadSampler) or
+                 'hwm' (HWMSampler, falls back to 'process' when unavailable).
+    :param interval: time in seconds between two successive samples.
+    """
+    if kind == "hwm":
+        try:
+            return HWMSampler()
+        except OSError as e:
+            warnings.warn(f"{e}. Falling back to the process memory sampler.")
+            kind = "process"
+    if kind == "thread":
+        sampler = ThreadSampler(interval)
+    elif kind == "process":
+        sampler = MemSampler(os.getpid(), interval)
+    else:
+        raise ValueError(f"Unknown memory sampler {kind!r}")
+    sampler.start()
+    return sampler
+
+
+class _MemoryReader:
+    """
+    Callable returning the resident memory (in MiB) of a given process.
+
+    On Linux, statm is opened once and read again in place for each sample,
+    which spares the allocations and syscalls of a psutil.Process query.
+    Other platforms go through a single, reused psutil.Process.
+    """
+
+    def __init__(self, pid):
+        statm = "/proc/self/statm" if pid == os.getpid() else f"/proc/{pid}/statm"
+        self.__fd = None
+        self.__process = None
+        try:
+            self.__fd = os.open(statm, os.O_RDONLY)
+            self.__read_statm()
+        except (OSError, AttributeError, ValueError, IndexError):
+            self.close()
+            self.__process = psutil.Process(pid)
+
+    def __read_statm(self):
+        return int(os.pread(self.__fd, 128, 0).split()[1]) * _PAGE_SIZE / _TWO_20
+
+    def __call__(self):
+        if self.__process is not None:
+            return self.__process.memory_info()[0] / _TWO_20
+        return self.__read_statm()
+
+    def close(self):
+        if self.__fd is not None:
+            os.close(self.__fd)
+            self.__fd = None
+
+
 def _get_memory(pid):
     # .. low function to get memory consumption ..
     if pid == -1:
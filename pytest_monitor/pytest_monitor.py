@@ -1,33 +1,7 @@
 # -*- coding: utf-8 -*-
-import gc
-import time
 import warnings
 
-import pytest
-
-from pytest_monitor.session import PyTestMonitorSession
-
-from .profiler import memory_usage
-
-# These dictionaries are used to compute members set on each items.
-# KEY is the marker set on a test function
-# value is a tuple:
-#  expect_args: boolean
-#  internal marker attribute name: str
-#  callable that set member's value
-#  default value
-PYTEST_MONITOR_VALID_MARKERS = {
-    "monitor_skip_test": (False, "monitor_skip_test", lambda x: True, False),
-    "monitor_skip_test_if": (True, "monitor_skip_test", lambda x: bool(x), False),
-    "monitor_test": (False, "monitor_force_test", lambda x: True, False),
-    "monitor_test_if": (True, "monitor_force_test", lambda x: bool(x), False),
-}
-PYTEST_MONITOR_DEPRECATED_MARKERS = {}
-PYTEST_MONITOR_ITEM_LOC_MEMBER = (
-    "_location" if tuple(pytest.__version__.split(".")) < ("5", "3") else "location"
-)
-
-PYTEST_MONITORING_ENABLED = True
+from pytest_monitor.samplers import SAMPLERS
 
 
 def pytest_addoption(parser):
@@ -36,9 +10,9 @@ def pytest_addoption(parser):
         "--restrict-scope-to",
         dest="mtr_scope",
         default="function",
-        help="Select the scope to monitor. By default, only function is monitored."
-        "Values are function, class, module, session. You can set one or more of these"
-        "by listing them using a comma separated list",
+        help="Select the scope to monitor. By default, only function is monitored. "
+        "Values are function, class, module, package, session. You can set one or "
+        "more of these by listing them using a comma separated list",
     )
     group.addoption(
         "--parametrization-explicit",
@@ -56,6 +30,26 @@ def pytest_addoption(parser):
         dest="mtr_remote",
         help="Remote server to send the results to. Format is <ADRESS>:<PORT>",
     )
+    group.addoption(
+        "--remote-batch-size",
+        action="store",
+        type=int,
+        dest="mtr_remote_batch_size",
+        default=200,
+        help="Number of metrics sent at once to the remote server (default: 200)."
+        " Metrics are also sent when the --db-flush-interval delay is elapsed and at the"
+        " end of the session.",
+    )
+    group.addoption(
+        "--spool-dir",
+        action="store",
+        dest="mtr_spool_dir",
+        default=".pymon-spool",
+        help="Directory where metrics that cannot be sent to the remote server or"
+        " written to PostgreSQL are kept until they can be (default: .pymon-spool)."
+        " Use 'pytest-monitor replay' to deliver what is left after a session."
+        " Set it to an empty value to drop such metrics instead.",
+    )
     group.addoption(
         "--db",
         action="store",
@@ -69,6 +63,45 @@ def pytest_addoption(parser):
         dest="mtr_no_db",
         help="Do not store results in local db.",
     )
+    group.addoption(
+        "--db-pragma",
+        action="append",
+        dest="mtr_db_pragmas",
+        default=[],
+        metavar="NAME=VALUE",
+        help="Set a pragma on the sqlite database connection, overriding the defaults:"
+        " journal_mode=WAL, synchronous=NORMAL, busy_timeout=10000 (ms) and"
+        " cache_size=-16384 (KiB). Can be repeated. Use for instance"
+        " --db-pragma synchronous=FULL to favor durability over throughput.",
+    )
+    group.addoption(
+        "--db-batch-size",
+        action="store",
+        type=int,
+        dest="mtr_db_batch_size",
+        default=100,
+        help="Number of metrics buffered before being written to the database in a"
+        " single transaction (default: 100). Pending metrics are always written at the"
+        " end of the session.",
+    )
+    group.addoption(
+        "--db-flush-interval",
+        action="store",
+        type=float,
+        dest="mtr_db_flush_interval",
+        default=5.0,
+        help="Maximum time in seconds metrics stay buffered before being written to the"
+        " database (default: 5).",
+    )
+    group.addoption(
+        "--monitor-queue-size",
+        action="store",
+        type=int,
+        dest="mtr_queue_size",
+        default=10000,
+        help="Maximum number of metrics waiting to be stored or sent (default: 10000)."
+        " Tests are held back when the limit is reached.",
+    )
     group.addoption(
         "--use-postgres",
         action="store_true",
@@ -96,6 +129,75 @@ def pytest_addoption(parser):
         dest="mtr_disable_monitoring_failed",
         help="Disable monitoring of failed tests and only monitor successful tests",
     )
+    group.addoption(
+        "--monitor-sampler",
+        action="store",
+        dest="mtr_sampler",
+        default="process",
+        choices=SAMPLERS,
+        help="Select how memory is sampled during tests: 'process' (default) polls the"
+        " memory from a dedicated process, 'thread' reads it from a thread of the"
+        " pytest process itself, which avoids forking. 'hwm' reads the peak tracked by"
+        " the Linux kernel without any polling (falls back to 'process' if unavailable).",
+    )
+    group.addoption(
+        "--monitor-refresh-context",
+        action="store_true",
+        dest="mtr_refresh_context",
+        help="Compute the execution context again instead of reusing the one cached by a"
+        " former session (cached until reboot or change of the Python interpreter).",
+    )
+    group.addoption(
+        "--monitor-repeat",
+        action="store",
+        type=int,
+        default=1,
+        dest="mtr_repeat",
+        metavar="N",
+        help="Run each monitored test N times and store the median, minimum and standard"
+        " deviation of its measures instead of a single sample. Overridden by the"
+        " monitor_repeat marker.",
+    )
+    group.addoption(
+        "--monitor-warmup",
+        action="store",
+        type=int,
+        default=0,
+        dest="mtr_warmup",
+        metavar="K",
+        help="Run each repeated test K more times beforehand, without measuring them.",
+    )
+    group.addoption(
+        "--monitor-ci",
+        action="store",
+        type=float,
+        default=None,
+        dest="mtr_ci",
+        metavar="PERCENT",
+        help="Repeat each monitored test until the 95%% confidence interval of its run"
+        " time is within PERCENT of the mean (at least --monitor-repeat times, 2 at"
+        " least), or until its time budget is spent.",
+    )
+    group.addoption(
+        "--monitor-budget",
+        action="store",
+        type=float,
+        default=10.0,
+        dest="mtr_budget",
+        metavar="SECONDS",
+        help="Time after which the runs of a test repeated until --monitor-ci is met"
+        " stop anyway (default: 10 seconds).",
+    )
+    group.addoption(
+        "--monitor-max-repeat",
+        action="store",
+        type=int,
+        default=1000,
+        dest="mtr_max_repeat",
+        metavar="N",
+        help="Number of runs after which a test repeated until --monitor-ci is met"
+        " stops anyway, whatever its time budget (default: 1000).",
+    )
     group.addoption(
         "--no-gc",
         action="store_true",
@@ -139,253 +241,33 @@ def pytest_configure(config):
         " is verified. This can help you in whitelisting tests to be monitored"
         " depending on some external conditions.",
     )
-
-
-def pytest_runtest_setup(item):
-    """
-    Validate marker setup and print warnings if usage of deprecated marker is identified.
-    Setting marker attribute to the discovered item is done after the above described verification.
-    :param item: Test item
-    """
-    if not PYTEST_MONITORING_ENABLED:
-        return
-    item_markers = {
-        mark.name: mark
-        for mark in item.iter_markers()
-        if mark and mark.name.startswith("monitor_")
-    }
-    mark_to_del = []
-    for set_marker in item_markers.keys():
-        if set_marker not in PYTEST_MONITOR_VALID_MARKERS:
-            warnings.warn(
-                "Nothing known about marker {}. Marker will be dropped.".format(
-                    set_marker
-                )
-            )
-            mark_to_del.append(set_marker)
-        if set_marker in PYTEST_MONITOR_DEPRECATED_MARKERS:
-            warnings.warn(
-                f"Marker {set_marker} is deprecated. Consider upgrading your tests"
-            )
-
-    for marker in mark_to_del:
-        del item_markers[marker]
-
-    all_valid_markers = PYTEST_MONITOR_VALID_MARKERS
-    all_valid_markers.update(PYTEST_MONITOR_DEPRECATED_MARKERS)
-    # Setting instantiated markers
-    for marker, _ in item_markers.items():
-        with_args, attr, fun_val, _ = all_valid_markers[marker]
-        attr_val = fun_val(item_markers[marker].args[0]) if with_args else fun_val(None)
-        setattr(item, attr, attr_val)
-
-    # Setting other markers to default values
-    for marker, marker_value in all_valid_markers.items():
-        with_args, attr, _, default = marker_value
-        if not hasattr(item, attr):
-            setattr(item, attr, default)
-
-    # Finalize marker processing by enforcing some marker's value
-    if item.monitor_force_test:
-        # This test has been explicitly flagged as 'to be monitored'.
-        item.monitor_skip_test = False
-
-
-@pytest.hookimpl(tryfirst=True, hookwrapper=True)
-def pytest_runtest_makereport(item, call):
-    """
-    Used to identify the current call to add times.
-    :param item: Test item
-    :param call: call instance associated to the given item
-    """
-    outcome = yield
-    rep = outcome.get_result()
-
-    if rep.when == "call":
-        setattr(item, "test_run_duration", call.stop - call.start)
-        setattr(item, "test_effective_start_time", call.start)
-
-
-def pytest_runtest_call(item):
-    if not PYTEST_MONITORING_ENABLED:
-        return
-    setattr(item, "monitor_results", False)
-    if hasattr(item, "module"):
-        setattr(
-            item,
-            "monitor_component",
-            getattr(item.module, "pytest_monitor_component", ""),
-        )
-    else:
-        setattr(item, "monitor_skip_test", True)
-
-
-@pytest.hookimpl
-def pytest_pyfunc_call(pyfuncitem):
-    """
-    Core sniffer logic. We encapsulate the test function in a sniffer function to collect
-    memory results.
-    """
-
-    def wrapped_function():
-        try:
-            funcargs = pyfuncitem.funcargs
-            testargs = {arg: funcargs[arg] for arg in pyfuncitem._fixtureinfo.argnames}
-            pyfuncitem.obj(**testargs)
-        except Exception:
-            raise
-        except BaseException:
-            raise
-
-    def prof():
-        (memuse, exception) = memory_usage((wrapped_function, ()))
-        setattr(pyfuncitem, "mem_usage", memuse)
-        setattr(pyfuncitem, "monitor_results", True)
-
-        if isinstance(exception, BaseException):  # Do we have any outcome?
-            if pyfuncitem.session.config.option.mtr_disable_monitoring_failed:
-                setattr(pyfuncitem, "monitor_results", False)
-            setattr(pyfuncitem, "passed", False)
-            raise exception
-
-        setattr(pyfuncitem, "passed", True)
-
-    if not PYTEST_MONITORING_ENABLED:
-        try:
-                wrapped_function()
-        except BaseException:
-                raise
-    else:
-        if not pyfuncitem.session.config.option.mtr_disable_gc:
-            gc.collect()
-        prof()
-    return True
-
-
-def pytest_make_parametrize_id(config, val, argname):
-    if config.option.mtr_want_explicit_ids:
-        return f"{argname}={val}"
-    return None
-
-
-@pytest.hookimpl(hookwrapper=True)
-def pytest_sessionstart(session):
-    """
-    Instantiate a monitor session to save collected metrics.
-    We yield at the end to let pytest pursue the execution.
-    """
-    if (
-        session.config.option.mtr_force_component
-        and session.config.option.mtr_component_prefix
-    ):
-        raise pytest.UsageError(
-            "Invalid usage: --force-component and --component-prefix are incompatible options!"
-        )
+    config.addinivalue_line(
+        "markers",
+        "monitor_repeat(n, warmup=0, ci=None, budget=None): run the test warmup times"
+        " without measuring it, then n times, storing the median, minimum and standard"
+        " deviation of its measures. If ci is given, runs go on until the confidence"
+        " interval of the run time is within ci percent of the mean, or until budget"
+        " seconds are spent.",
+    )
     if (
-        session.config.option.mtr_no_db
-        and not session.config.option.mtr_remote
-        and not session.config.option.mtr_none
+        config.option.mtr_no_db
+        and not config.option.mtr_remote
+        and not config.option.mtr_none
     ):
         warnings.warn(
             "pytest-monitor: No storage specified but monitoring is requested. Disabling monitoring."
         )
-        session.config.option.mtr_none = True
-    component = (
-        session.config.option.mtr_force_component
-        or session.config.option.mtr_component_prefix
-    )
-    if session.config.option.mtr_component_prefix:
-        component += ".{user_component}"
-    if not component:
-        component = "{user_component}"
-    db = (
-        None
-        if (
-            session.config.option.mtr_none
-            or session.config.option.mtr_no_db
-            or session.config.option.mtr_use_postgres
-        )
-        else session.config.option.mtr_db_out
-    )
-    remote = (
-        None if session.config.option.mtr_none else session.config.option.mtr_remote
-    )
-    session.pytest_monitor = PyTestMonitorSession(
-        db=db,
-        use_postgres=session.config.option.mtr_use_postgres,
-        remote=remote,
-        component=component,
-        scope=session.config.option.mtr_scope,
-    )
-    global PYTEST_MONITORING_ENABLED
-    PYTEST_MONITORING_ENABLED = not session.config.option.mtr_none
-    session.pytest_monitor.compute_info(
-        session.config.option.mtr_description, session.config.option.mtr_tags
-    )
-    yield
+        config.option.mtr_none = True
+    if not config.option.mtr_none:
+        # Hooks and fixtures measuring the tests are only registered (and their
+        # dependencies imported) when monitoring is enabled: --no-monitor
+        # leaves pytest as if the plugin was not installed.
+        from pytest_monitor import hooks
 
+        config.pluginmanager.register(hooks, "pytest_monitor.hooks")
 
-@pytest.hookimpl(hookwrapper=True)
-def pytest_sessionfinish(session):
-    if session.pytest_monitor is not None:
-        session.pytest_monitor.close()
-    yield
-
-
-@pytest.fixture(autouse=True, scope="module")
-def _prf_module_tracer(request):
-    if not PYTEST_MONITORING_ENABLED:
-        yield
-    else:
-        t_a = time.time()
-        ptimes_a = request.session.pytest_monitor.process.cpu_times()
-        yield
-        ptimes_b = request.session.pytest_monitor.process.cpu_times()
-        t_z = time.time()
-        rss = request.session.pytest_monitor.process.memory_info().rss / 1024**2
-        component = getattr(request.module, "pytest_monitor_component", "")
-        item = request.node.name[:-3]
-        pypath = request.module.__name__[: -len(item) - 1]
-        request.session.pytest_monitor.add_test_info(
-            item,
-            pypath,
-            "",
-            request.node._nodeid,
-            "module",
-            component,
-            t_a,
-            t_z - t_a,
-            ptimes_b.user - ptimes_a.user,
-            ptimes_b.system - ptimes_a.system,
-            rss,
-            True,
-        )
 
-
-@pytest.fixture(autouse=True)
-def _prf_tracer(request):
-    if not PYTEST_MONITORING_ENABLED:
-        yield
-    else:
-        ptimes_a = request.session.pytest_monitor.process.cpu_times()
-        yield
-        ptimes_b = request.session.pytest_monitor.process.cpu_times()
-        if not request.node.monitor_skip_test and getattr(
-            request.node, "monitor_results", False
-        ):
-            item_name = request.node.originalname or request.node.name
-            item_loc = getattr(request.node, PYTEST_MONITOR_ITEM_LOC_MEMBER)[0]
-            request.session.pytest_monitor.add_test_info(
-                item_name,
-                request.module.__name__,
-                request.node.name,
-                item_loc,
-                "function",
-                request.node.monitor_component,
-                request.node.test_effective_start_time,
-                request.node.test_run_duration,
-                ptimes_b.user - ptimes_a.user,
-                ptimes_b.system - ptimes_a.system,
-                request.node.mem_usage,
-                getattr(request.node, "passed", False),
-            )
+def pytest_make_parametrize_id(config, val, argname):
+    if config.option.mtr_want_explicit_ids:
+        return f"{argname}={val}"
+    return None
@@ -0,0 +1,105 @@
+import sqlite3
+
+from pytest_monitor.handler import SqliteDBHandler
+
+TEST_HISTORY = """
+SELECT S.SESSION_H, S.RUN_DATE, S.SCM_ID, E.ENV_H, M.ITEM_START_TS, I.ITEM_VARIANT,
+       M.TOTAL_TIME, M.USER_TIME, M.KERNEL_TIME, M.CPU_USAGE, M.MEM_USAGE,
+       M.TEST_PASSED
+FROM TEST_ITEMS I
+JOIN METRICS M ON M.ITEM_ID = I.ITEM_ID
+LEFT JOIN TEST_SESSIONS S ON S.SESSION_ID = M.SESSION_ID
+LEFT JOIN EXECUTION_CONTEXTS E ON E.ENV_ID = M.ENV_ID
+WHERE I.ITEM_PATH = :item_path AND I.ITEM = :item AND I.KIND = :kind {variant}
+  AND M.ITEM_START_TS >= :since AND M.ITEM_START_TS < :until
+ORDER BY M.ITEM_START_TS DESC
+LIMIT :limit
+"""
+
+SESSION_SUMMARIES = """
+SELECT S.SESSION_H, S.RUN_DATE, S.RUN_TS, S.SCM_ID, S.RUN_DESCRIPTION,
+       COUNT(M.SESSION_ID) AS ITEMS, SUM(NOT M.TEST_PASSED) AS FAILED,
+       SUM(M.TOTAL_TIME) AS TOTAL_TIME, MAX(M.MEM_USAGE) AS MAX_MEM_USAGE
+FROM (SELECT * FROM TEST_SESSIONS ORDER BY RUN_TS DESC LIMIT :limit) S
+LEFT JOIN METRICS M ON M.SESSION_ID = S.SESSION_ID
+ AND M.ITEM_ID IN (SELECT ITEM_ID FROM TEST_ITEMS WHERE KIND = 'function')
+GROUP BY S.SESSION_ID
+ORDER BY S.RUN_TS DESC
+"""
+
+COMPONENT_ROLLUP = """
+SELECT C.COMPONENT, COUNT(*) AS ITEMS, SUM(NOT M.TEST_PASSED) AS FAILED,
+       SUM(M.TOTAL_TIME) AS TOTAL_TIME, AVG(M.TOTAL_TIME) AS AVG_TIME,
+       AVG(M.CPU_USAGE) AS AVG_CPU_USAGE, MAX(M.MEM_USAGE) AS MAX_MEM_USAGE
+FROM METRICS M
+JOIN TEST_ITEMS I ON I.ITEM_ID = M.ITEM_ID
+LEFT JOIN COMPONENTS C ON C.COMPONENT_ID = M.COMPONENT_ID
+WHERE M.SESSION_ID = (SELECT SESSION_ID FROM TEST_SESSIONS WHERE SESSION_H = :session_h)
+  AND I.KIND = 'function'
+GROUP BY C.COMPONENT
+ORDER BY C.COMPONENT
+"""
+
+
+class MetricsQuery:
+    """
+    Look up the history stored in a pytest-monitor SQLite database.
+    Results are lists of dictionaries keyed by column name. Dates are given in
+    seconds since the epoch (ITEM_START_TS, RUN_TS) and, for sessions, as ISO
+    8601 strings too (RUN_DATE). Databases created by former versions are
+    upgraded first.
+    """
+
+    def __init__(self, db_path):
+        SqliteDBHandler(db_path).close()
+        self.__cnx = sqlite3.connect(db_path)
+        self.__cnx.row_factory = sqlite3.Row
+
+    def close(self):
+        self.__cnx.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __query(self, what, bind_to):
+        return [dict(row) for row in self.__cnx.execute(what, bind_to)]
+
+    def test_history(
+        self,
+        item_path,
+        item,
+        item_variant=None,
+        kind="function",
+        limit=-1,
+        since=float("-inf"),
+        until=float("inf"),
+    ):
+        """
+        Return the metrics of an item, most recent first. Without item_variant,
+        all variants of a parametrized test are returned. since and until
+        restrict the start times to a range, in seconds since the epoch.
+        """
+        variant = "" if item_variant is None else "AND I.ITEM_VARIANT = :item_variant"
+        return self.__query(
+            TEST_HISTORY.format(variant=variant),
+            {
+                "item_path": item_path,
+                "item": item,
+                "item_variant": item_variant,
+                "kind": kind,
+                "limit": limit,
+                "since": since,
+                "until": until,
+            },
+        )
+
+    def session_summaries(self, limit=10):
+        """Summarize the last sessions: number of tests, failures, time and peak memory."""
+        return self.__query(SESSION_SUMMARIES, {"limit": limit})
+
+    def component_rollup(self, session_h):
+        """Aggregate the tests of a session by component."""
+        return self.__query(COMPONENT_ROLLUP, {"session_h": session_h})
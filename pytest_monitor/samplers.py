@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""
+Kinds of memory samplers (see pytest_monitor.profiler.create_sampler). They
+are kept apart, without dependencies, so that the plugin offers them as
+choices of --monitor-sampler without importing the profiler.
+"""
+SAMPLERS = ("process", "thread", "hwm")
@@ -2,19 +2,25 @@ import datetime
 import hashlib
 import json
 import os
+import threading
 import warnings
-from http import HTTPStatus
 
 import psutil
-import requests
 
-from pytest_monitor.handler import PostgresDBHandler, SqliteDBHandler
-from pytest_monitor.profiler import memory_usage
+from pytest_monitor.handler import (
+    PostgresDBHandler,
+    RemoteHandler,
+    SqliteDBHandler,
+    epoch_to_iso,
+)
+from pytest_monitor.profiler import PeakTracker, create_sampler, memory_usage
+from pytest_monitor.spool import Spool
 from pytest_monitor.sys_utils import (
     ExecutionContext,
     collect_ci_info,
     determine_scm_revision,
 )
+from pytest_monitor.writer import MetricWriter
 
 
 class PyTestMonitorSession:
@@ -26,24 +32,89 @@ class PyTestMonitorSession:
         component="",
         scope=None,
         tracing=True,
+        sampler="process",
+        db_batch_size=1,
+        db_flush_interval=None,
+        queue_size=10000,
+        remote_batch_size=1,
+        spool_dir=None,
+        collect=False,
+        db_pragmas=None,
+        refresh_context=False,
     ):
         self.__db = None
+        self.__use_postgres = use_postgres
         if use_postgres:
-            self.__db = PostgresDBHandler()
+            # Connected along with the session registration, see compute_info().
+            self.__db = PostgresDBHandler(
+                db_batch_size,
+                db_flush_interval,
+                Spool(spool_dir, "postgres") if spool_dir else None,
+                connect=False,
+            )
         elif db:
-            self.__db = SqliteDBHandler(db)
+            self.__db = SqliteDBHandler(
+                db, db_batch_size, db_flush_interval, db_pragmas
+            )
         self.__monitor_enabled = tracing
-        self.__remote = remote
+        self.__refresh_context = refresh_context
+        self.__remote = None
+        self.__remote_errors = ()
+        if remote:
+            self.__remote = RemoteHandler(
+                remote,
+                remote_batch_size,
+                db_flush_interval,
+                Spool(spool_dir, remote) if spool_dir else None,
+            )
+            self.__remote_errors = self.__remote.errors
         self.__component = component
         self.__session = ""
         self.__scope = scope or []
-        self.__eid = (None, None)
-        self.__mem_usage_base = None
+        self.__db_eid = None
+        self.__remote_eid = None
+        # Metrics that a deactivated backend could not take.
+        self.__lost = 0
+        self.__deactivated = False
         self.__process = psutil.Process(os.getpid())
+        self.__sampler_kind = sampler
+        self.__sampler = None
+        self.__writer = None
+        self.__ready = threading.Event()
+        # pytest-xdist workers only collect their metrics: the controller
+        # stores them all at once, under its own session.
+        self.__collected = [] if collect else None
+        self.__collected_fixtures = [] if collect else None
+        if tracing and not collect:
+            self.__writer = MetricWriter(
+                self.__write_metric,
+                flush=self.flush,
+                max_size=queue_size,
+                flush_interval=db_flush_interval,
+            )
+            self.__writer.start()
 
     def close(self):
-        if self.__db is not None:
-            self.__db.close()
+        # Closing the database flushes pending metrics: make sure it happens
+        # whatever occurs while shutting down the sampler.
+        try:
+            if self.__sampler is not None:
+                self.__sampler.close()
+                self.__sampler = None
+        finally:
+            if self.__writer is not None:
+                self.__writer.close()  # drain all queued metrics
+                if self.dropped_metrics:
+                    warnings.warn(
+                        f"pytest-monitor: {self.dropped_metrics} metric(s) could not"
+                        " be written."
+                    )
+            try:
+                if self.__remote is not None:
+                    self.__remote.close()
+            finally:
+                if self.__db is not None:
+                    self.__db.close()
 
     @property
     def monitoring_enabled(self):
@@ -51,40 +122,50 @@ class PyTestMonitorSession:
 
     @property
     def remote_env_id(self):
-        return self.__eid[1]
+        return self.__remote_eid
 
     @property
     def db_env_id(self):
-        return self.__eid[0]
+        return self.__db_eid
 
     @property
     def process(self):
         return self.__process
 
-    def get_env_id(self, env):
-        db, remote = None, None
-        if self.__db:
-            row = self.__db.get_env_id(env.compute_hash())
-            db = row[0] if row else None
-        if self.__remote:
-            r = requests.get(f"{self.__remote}/contexts/{env.compute_hash()}")
-            remote = None
-            if r.status_code == HTTPStatus.OK:
-                remote = json.loads(r.text)
-                if remote["contexts"]:
-                    remote = remote["contexts"][0]["h"]
-                else:
-                    remote = None
-        return db, remote
+    @property
+    def sampler(self):
+        return self.__sampler
+
+    def monitors(self, kind):
+        """Tell whether items of the given kind (function, class, module...) are monitored."""
+        return kind in self.__scope
+
+    @property
+    def collected_metrics(self):
+        return self.__collected
+
+    @property
+    def collected_fixtures(self):
+        return self.__collected_fixtures
+
+    def hand_over_collected(self):
+        """Return the metrics and fixture costs collected so far, and forget them."""
+        metrics, self.__collected = self.__collected, []
+        fixtures, self.__collected_fixtures = self.__collected_fixtures, []
+        return metrics, fixtures
+
+    @property
+    def queue_depth(self):
+        return self.__writer.queue_depth if self.__writer is not None else 0
+
+    @property
+    def dropped_metrics(self):
+        """Number of metrics lost, on a full queue or by a deactivated backend."""
+        dropped = self.__writer.dropped if self.__writer is not None else 0
+        return dropped + self.__lost
 
     def compute_info(self, description, tags):
         run_date = datetime.datetime.now().isoformat()
-        scm = determine_scm_revision()
-        h = hashlib.md5()
-        h.update(scm.encode())
-        h.update(run_date.encode())
-        h.update(description.encode())
-        self.__session = h.hexdigest()
         # From description + tags to JSON format
         d = collect_ci_info()
         if description:
@@ -97,51 +178,112 @@ class PyTestMonitorSession:
                 for sub_tag in tag:
                     _tag_info = sub_tag.split("=", 1)
                     d[_tag_info[0]] = _tag_info[1]
-        description = json.dumps(d)
-        # Now get memory usage base and create the database
+        # Now get memory usage base and register the session
         self.prepare()
-        self.set_environment_info(ExecutionContext())
-        if self.__db:
-            self.__db.insert_session(self.__session, run_date, scm, description)
-        if self.__remote:
-            r = requests.post(
-                f"{self.__remote}/sessions/",
-                json={
-                    "session_h": self.__session,
-                    "run_date": run_date,
-                    "scm_ref": scm,
-                    "description": json.loads(description),
-                },
+        if self.__writer is not None:
+            # Tests start right away: their metrics wait in the writer's queue
+            # until the backends are connected and the session is registered.
+            self.__writer.call(self.__register, run_date, description, json.dumps(d))
+        else:
+            self.__register(run_date, description, json.dumps(d))
+
+    def wait_until_ready(self, timeout=None):
+        """Wait for the backends to be connected and the session to be registered."""
+        return self.__ready.wait(timeout)
+
+    def __register(self, run_date, description, json_description):
+        try:
+            scm = determine_scm_revision()
+            h = hashlib.md5()
+            h.update(scm.encode())
+            h.update(run_date.encode())
+            h.update(description.encode())
+            self.__session = h.hexdigest()
+            env = ExecutionContext.load(refresh=self.__refresh_context)
+            # The remote server and the database are set up concurrently.
+            remote = threading.Thread(
+                target=self.__register_remote,
+                args=(env, run_date, scm, json_description),
+                name="pytest-monitor-remote-setup",
+                daemon=True,
             )
-            if r.status_code != HTTPStatus.CREATED:
-                self.__remote = ""
-                msg = f"Cannot insert session in remote monitor server ({r.status_code})! Deactivating...')"
-                warnings.warn(msg)
-
-    def set_environment_info(self, env):
-        self.__eid = self.get_env_id(env)
-        db_id, remote_id = self.__eid
-        if self.__db and db_id is None:
-            self.__db.insert_execution_context(env)
-            db_id = self.__db.get_env_id(env.compute_hash())
-        if self.__remote and remote_id is None:
-            # We must postpone that to be run at the end of the pytest session.
-            r = requests.post(f"{self.__remote}/contexts/", json=env.to_dict())
-            if r.status_code != HTTPStatus.CREATED:
+            if self.__remote:
+                remote.start()
+            try:
+                self.__register_db(env, run_date, scm, json_description)
+            finally:
+                if remote.is_alive():
+                    remote.join()
+        finally:
+            self.__ready.set()
+
+    def __register_db(self, env, run_date, scm, description):
+        if not self.__db:
+            return
+        if self.__use_postgres:
+            try:
+                self.__db.open()
+            except Exception as e:
+                if self.__db.spooling:
+                    # Keep everything until the database is reachable: the
+                    # handler opens it again on flush.
+                    warnings.warn(
+                        f"pytest-monitor: cannot connect to PostgreSQL ({e})!"
+                        " Records are spooled until it is reachable."
+                    )
+                    self.__db.insert_execution_context(env)
+                    self.__db_eid = env.compute_hash()  # ENV_H in PostgreSQL
+                    self.__db.insert_session(self.__session, run_date, scm, description)
+                    return
+                self.__db.close()
+                self.__db = None
+                self.__deactivated = True
                 warnings.warn(
-                    f"Cannot insert execution context in remote server (rc={r.status_code}! Deactivating..."
+                    f"pytest-monitor: cannot connect to PostgreSQL ({e})! Deactivating..."
                 )
-                self.__remote = ""
-            else:
-                remote_id = json.loads(r.text)["h"]
-        self.__eid = db_id, remote_id
+                return
+        db_id = self.__db.get_env_id(env.compute_hash())
+        if db_id is None:
+            self.__db.insert_execution_context(env)
+            db_id = self.__db.get_env_id(env.compute_hash())
+        self.__db_eid = db_id
+        self.__db.insert_session(self.__session, run_date, scm, description)
+
+    def __register_remote(self, env, run_date, scm, description):
+        try:
+            try:
+                remote_id = self.__remote.get_env_id(env.compute_hash())
+            except self.__remote_errors:
+                remote_id = None  # Will be inserted (or spooled) as unknown
+            if remote_id is None:
+                self.__remote.insert_execution_context(env)
+                remote_id = env.compute_hash()
+        except self.__remote_errors as e:
+            warnings.warn(
+                f"Cannot insert execution context in remote server ({e})! Deactivating..."
+            )
+            self.__remote = None
+            self.__deactivated = True
+            return
+        self.__remote_eid = remote_id
+        try:
+            self.__remote.insert_session(self.__session, run_date, scm, description)
+        except self.__remote_errors as e:
+            self.__remote = None
+            self.__deactivated = True
+            msg = f"Cannot insert session in remote monitor server ({e})! Deactivating...')"
+            warnings.warn(msg)
 
     def prepare(self):
         def dummy():
             return True
 
-        (memuse, exception) = memory_usage((dummy,))
-        self.__mem_usage_base = memuse
+        if self.__monitor_enabled and self.__sampler is None:
+            # A single sampler process serves every measure of the session,
+            # and the peaks of the monitored scopes.
+            self.__sampler = PeakTracker(create_sampler(self.__sampler_kind))
+        # A first measure starts the sampler before the first test.
+        (_, exception) = memory_usage((dummy,), sampler=self.__sampler)
         if isinstance(exception, BaseException):
             raise
 
@@ -159,16 +301,125 @@ class PyTestMonitorSession:
         kernel_time,
         mem_usage,
         passed: bool,
+        measures=None,
     ):
         if kind not in self.__scope:
             return
-        mem_usage = float(mem_usage) - self.__mem_usage_base
+        mem_usage = float(mem_usage)
         cpu_usage = (user_time + kernel_time) / total_time
-        item_start_time = datetime.datetime.fromtimestamp(item_start_time).isoformat()
         final_component = self.__component.format(user_component=component)
         if final_component.endswith("."):
             final_component = final_component[:-1]
         item_variant = item_variant.replace("-", ", ")  # No choice
+        metric = (
+            item_start_time,
+            item,
+            item_path,
+            item_variant,
+            item_loc,
+            kind,
+            final_component,
+            total_time,
+            user_time,
+            kernel_time,
+            cpu_usage,
+            mem_usage,
+            passed,
+            measures,
+        )
+        if self.__collected is not None:
+            self.__collected.append(metric)
+        elif self.__writer is not None:
+            self.__writer.submit(*metric)
+        else:
+            self.__write_metric(*metric)
+
+    def add_worker_metrics(self, worker_id, metrics, fixtures=()):
+        """Store metrics and fixture costs collected by a pytest-xdist worker."""
+        for metric in metrics:
+            if self.__writer is not None:
+                self.__writer.submit(*metric, worker_id)
+            else:
+                self.__write_metric(*metric, worker_id)
+        for fixture in fixtures:
+            self.__store_fixture(tuple(fixture) + (worker_id,))
+
+    def add_fixture_info(
+        self,
+        fixture,
+        fixture_path,
+        scope,
+        setup_start_time,
+        setup_time,
+        setup_user_time,
+        setup_kernel_time,
+        setup_mem_delta,
+        teardown_time,
+        teardown_user_time,
+        teardown_kernel_time,
+        teardown_mem_delta,
+        users,
+    ):
+        """
+        Record the setup and teardown costs of a fixture instance. Their wall
+        time is also amortized across the tests which used the instance.
+        """
+        cost = setup_time + teardown_time
+        fixture = (
+            fixture,
+            fixture_path,
+            scope,
+            setup_start_time,
+            setup_time,
+            setup_user_time,
+            setup_kernel_time,
+            setup_mem_delta,
+            teardown_time,
+            teardown_user_time,
+            teardown_kernel_time,
+            teardown_mem_delta,
+            users,
+            cost / users if users else None,
+        )
+        if self.__collected_fixtures is not None:
+            self.__collected_fixtures.append(fixture)
+        else:
+            self.__store_fixture(fixture + (None,))
+
+    def __store_fixture(self, fixture):
+        # Written in order with the metrics, once the session is registered.
+        # Fixtures torn down after the session is closed (on interruption)
+        # are not recorded.
+        if self.__writer is not None and self.__writer.is_alive():
+            self.__writer.call(self.__write_fixture, *fixture)
+
+    def __write_fixture(self, *fixture):
+        *fixture, worker_id = fixture
+        if self.__db and self.db_env_id is not None:
+            self.__db.insert_fixture_metric(
+                self.__session, self.db_env_id, *fixture, worker_id=worker_id
+            )
+
+    def __write_metric(
+        self,
+        item_start_time,
+        item,
+        item_path,
+        item_variant,
+        item_loc,
+        kind,
+        final_component,
+        total_time,
+        user_time,
+        kernel_time,
+        cpu_usage,
+        mem_usage,
+        passed,
+        measures=None,
+        worker_id=None,
+    ):
+        if self.__deactivated:
+            self.__lost += 1
         if self.__db and self.db_env_id is not None:
             self.__db.insert_metric(
                 self.__session,
@@ -186,29 +437,54 @@ class PyTestMonitorSession:
                 cpu_usage,
                 mem_usage,
                 passed,
+                worker_id,
+                measures,
             )
         if self.__remote and self.remote_env_id is not None:
-            r = requests.post(
-                f"{self.__remote}/metrics/",
-                json={
-                    "session_h": self.__session,
-                    "context_h": self.remote_env_id,
-                    "item_start_time": item_start_time,
-                    "item_path": item_path,
-                    "item": item,
-                    "item_variant": item_variant,
-                    "item_fs_loc": item_loc,
-                    "kind": kind,
-                    "component": final_component,
-                    "total_time": total_time,
-                    "user_time": user_time,
-                    "kernel_time": kernel_time,
-                    "cpu_usage": cpu_usage,
-                    "mem_usage": mem_usage,
-                    "test_passed": passed,
-                },
-            )
-            if r.status_code != HTTPStatus.CREATED:
-                self.__remote = ""
-                msg = f"Cannot insert values in remote monitor server ({r.status_code})! Deactivating...')"
-                warnings.warn(msg)
+            metric = {
+                "session_h": self.__session,
+                "context_h": self.remote_env_id,
+                "item_start_time": epoch_to_iso(item_start_time),
+                "item_path": item_path,
+                "item": item,
+                "item_variant": item_variant,
+                "item_fs_loc": item_loc,
+                "kind": kind,
+                "component": final_component,
+                "total_time": total_time,
+                "user_time": user_time,
+                "kernel_time": kernel_time,
+                "cpu_usage": cpu_usage,
+                "mem_usage": mem_usage,
+                "test_passed": passed,
+                "worker_id": worker_id,
+            }
+            if measures:
+                metric.update(measures)
+            # Idempotency key, letting the server ignore metrics sent twice.
+            h = hashlib.md5()
+            for key in ("session_h", "item_start_time", "item_path", "item"):
+                h.update(metric[key].encode())
+            h.update(item_variant.encode())
+            h.update(kind.encode())
+            metric["metric_h"] = h.hexdigest()
+            try:
+                self.__remote.insert_metric(metric)
+            except self.__remote_errors as e:
+                self.__deactivate_remote(e)
+
+    def flush(self):
+        """Write buffered metrics to the database and send them to the remote server."""
+        if self.__db is not None:
+            self.__db.flush()
+        if self.__remote is not None:
+            try:
+                self.__remote.flush()
+            except self.__remote_errors as e:
+                self.__deactivate_remote(e)
+
+    def __deactivate_remote(self, e):
+        self.__remote = None
+        self.__deactivated = True
+        msg = f"Cannot insert values in remote monitor server ({e})! Deactivating...')"
+        warnings.warn(msg)
@@ -0,0 +1,194 @@
+import glob
+import hashlib
+import json
+import os
+import time
+import warnings
+
+import psutil
+
+
+def spool_key(target):
+    """Compute the file name prefix used to spool records for a target."""
+    if target == "postgres":
+        return target
+    return "remote-" + hashlib.md5(target.encode()).hexdigest()[:12]
+
+
+class RejectedError(Exception):
+    """
+    Raised by senders when a target refuses records for good (invalid data,
+    constraint violation...): they are dropped instead of being retried.
+    """
+
+
+def deliver(send, kind, records):
+    """
+    Send records by calling send(kind, records). If the target rejects them,
+    they are sent again one by one so that only the rejected records are
+    dropped, with a warning. Other errors are propagated: the records can be
+    spooled and retried. Returns the number of dropped records.
+    """
+    try:
+        send(kind, records)
+        return 0
+    except RejectedError as e:
+        if len(records) == 1:
+            warnings.warn(f"pytest-monitor: dropping {kind} record refused by its target ({e}).")
+            return 1
+    dropped = 0
+    for record in records:
+        try:
+            send(kind, [record])
+        except RejectedError as e:
+            warnings.warn(f"pytest-monitor: dropping {kind} record refused by its target ({e}).")
+            dropped += 1
+    return dropped
+
+
+class Spool:
+    """
+    Append-only storage for records that could not be delivered to a target
+    (a remote server url or 'postgres').
+
+    Records are appended as JSON lines to segment files of the spool directory,
+    a new segment being started every segment_size records. Each line holds the
+    target, the kind of record (contexts, sessions, metrics or fixtures) and the
+    record itself. Segments are replayed oldest first and removed once delivered.
+
+    A process only replays its own segments and those left by processes which
+    are gone. A segment is claimed before being replayed by renaming it after
+    the replaying process, so that a single process replays it.
+    """
+
+    def __init__(self, directory, target, segment_size=1000):
+        self.__dir = directory
+        self.__target = target
+        self.__prefix = spool_key(target)
+        self.__segment_size = segment_size
+        self.__segment = None
+        self.__segment_count = 0
+        self.__pending = bool(self.segments())
+
+    @property
+    def target(self):
+        return self.__target
+
+    @property
+    def pending(self):
+        return self.__pending
+
+    def segments(self):
+        return sorted(glob.glob(os.path.join(self.__dir, f"{self.__prefix}-*.ndjson*")))
+
+    def append(self, kind, records):
+        os.makedirs(self.__dir, exist_ok=True)
+        with open(self.__next_segment(len(records)), "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(
+                    json.dumps({"target": self.__target, "kind": kind, "data": record})
+                )
+                f.write("\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.__pending = True
+
+    def __next_segment(self, n_records):
+        if self.__segment is None or self.__segment_count >= self.__segment_size:
+            name = f"{self.__prefix}-{time.time_ns():020d}-{os.getpid()}.ndjson"
+            self.__segment = os.path.join(self.__dir, name)
+            self.__segment_count = 0
+        self.__segment_count += n_records
+        return self.__segment
+
+    def replay(self, send):
+        """
+        Deliver spooled records, segment after segment, by calling
+        send(kind, records) for each run of records of the same kind (see deliver).
+        A segment is removed once all of its records have been sent or rejected.
+        Other errors raised by send are propagated and leave the failing segment
+        claimed by this process, to be retried: senders are expected to be
+        idempotent so that records are never stored twice.
+        """
+        pid = os.getpid()
+        for segment in self.segments():
+            owner = _owner(segment)
+            if owner != pid and psutil.pid_exists(owner):
+                continue  # still written, or replayed, by another process
+            if segment == self.__segment:
+                self.__segment = None  # do not append to a segment being replayed
+            claimed = f"{_base(segment)}.{pid}.replaying"
+            if segment != claimed:
+                try:
+                    os.rename(segment, claimed)
+                except OSError:
+                    continue  # claimed by another process first
+            for kind, records in _read_segment(claimed):
+                deliver(send, kind, records)
+            os.remove(claimed)
+        self.__pending = bool(self.segments())
+
+
+def _base(segment):
+    return segment[: segment.index(".ndjson") + len(".ndjson")]
+
+
+def _owner(segment):
+    """Give the pid of the process writing a segment, or replaying it once claimed."""
+    if segment.endswith(".replaying"):
+        return int(segment.rsplit(".", 2)[1])
+    return int(_base(segment)[: -len(".ndjson")].rsplit("-", 1)[1])
+
+
+def _read_segment(segment):
+    batches = []
+    with open(segment, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # truncated by a crash while appending
+            if batches and batches[-1][0] == entry["kind"]:
+                batches[-1][1].append(entry["data"])
+            else:
+                batches.append((entry["kind"], [entry["data"]]))
+    return batches
+
+
+def spooled_targets(directory):
+    """List the targets having records spooled in the given directory."""
+    targets = []
+    for segment in sorted(glob.glob(os.path.join(directory, "*.ndjson*"))):
+        with open(segment, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    target = json.loads(line)["target"]
+                except ValueError:
+                    continue
+                if target not in targets:
+                    targets.append(target)
+                break
+    return targets
+
+
+class Backoff:
+    """Exponential backoff between two delivery attempts."""
+
+    def __init__(self, initial=1.0, maximum=60.0):
+        self.__initial = initial
+        self.__maximum = maximum
+        self.__delay = initial
+        self.__next_try = 0.0
+
+    def ready(self):
+        return time.monotonic() >= self.__next_try
+
+    def failed(self):
+        self.__next_try = time.monotonic() + self.__delay
+        self.__delay = min(self.__delay * 2, self.__maximum)
+
+    def reset(self):
+        self.__delay = self.__initial
+        self.__next_try = 0.0
@@ -1,10 +1,12 @@
 import hashlib
+import json
 import multiprocessing
 import os
 import platform
 import socket
 import subprocess
 import sys
+import tempfile
 import warnings
 
 import psutil
@@ -57,9 +59,90 @@ def collect_ci_info():
     return {}
 
 
+def _find_git_dir(path):
+    """Locate the git directory of the repository holding path, following .git files (worktrees, submodules)."""
+    if os.environ.get("GIT_DIR"):
+        return os.path.abspath(os.environ["GIT_DIR"])
+    path = os.path.abspath(path)
+    while True:
+        dot_git = os.path.join(path, ".git")
+        if os.path.isdir(dot_git):
+            return dot_git
+        if os.path.isfile(dot_git):
+            with open(dot_git, "r", encoding="utf-8") as f:
+                content = f.read().strip()
+            if content.startswith("gitdir:"):
+                return os.path.normpath(os.path.join(path, content.split(":", 1)[1].strip()))
+            return None
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+
+def _is_sha(value):
+    return len(value) in (40, 64) and all(c in "0123456789abcdef" for c in value)
+
+
+def _read_git_ref(git_dir, common_dir, ref):
+    # Loose refs override packed ones. HEAD and per-worktree refs are found in the git directory,
+    # other refs in the directory shared by all worktrees.
+    for _ in range(10):  # symbolic refs pointing to symbolic refs
+        content = None
+        for directory in (git_dir, common_dir):
+            try:
+                with open(os.path.join(directory, ref), "r", encoding="utf-8") as f:
+                    content = f.read().strip()
+                break
+            except OSError:
+                continue
+        if content is None:
+            return _read_packed_ref(common_dir, ref)
+        if not content.startswith("ref:"):
+            return content if _is_sha(content) else None
+        ref = content.split(":", 1)[1].strip()
+    return None
+
+
+def _read_packed_ref(common_dir, ref):
+    try:
+        with open(os.path.join(common_dir, "packed-refs"), "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith(("#", "^")):
+                    continue
+                sha, _, name = line.strip().partition(" ")
+                if name == ref:
+                    return sha if _is_sha(sha) else None
+    except OSError:
+        pass
+    return None
+
+
+def read_git_revision(path="."):
+    """Read the commit checked out in the git repository holding path, without running git. None if unknown."""
+    try:
+        git_dir = _find_git_dir(path)
+        if git_dir is None:
+            return None
+        common_dir = git_dir
+        if os.path.isfile(os.path.join(git_dir, "commondir")):
+            with open(os.path.join(git_dir, "commondir"), "r", encoding="utf-8") as f:
+                common_dir = os.path.normpath(os.path.join(git_dir, f.read().strip()))
+        return _read_git_ref(git_dir, common_dir, "HEAD")
+    except (OSError, UnicodeDecodeError):
+        return None
+
+
 def determine_scm_revision():
-    for scm, cmd in (("git", r"git rev-parse HEAD"), ("p4", r"p4 changes -m1 \#have")):
-        p = subprocess.Popen(cmd, shell=True, stderr=subprocess.PIPE, stdout=subprocess.PIPE)
+    revision = read_git_revision()
+    if revision:
+        return revision
+    # Repositories using a layout we cannot read (reftable for instance), or other SCMs.
+    for scm, cmd in (("git", ["git", "rev-parse", "HEAD"]), ("p4", ["p4", "changes", "-m1", "#have"])):
+        try:
+            p = subprocess.Popen(cmd, stderr=subprocess.PIPE, stdout=subprocess.PIPE)
+        except OSError:
+            continue  # not installed
         p_out, _ = p.communicate()
         if p.returncode == 0:
             scm_ref = p_out.decode(errors="ignore").split("\n", maxsplit=1)[0]
@@ -69,6 +152,45 @@ def determine_scm_revision():
     return ""
 
 
+def user_cache_dir():
+    """Locate the directory where pytest-monitor caches data for the current user."""
+    if os.environ.get("PYTEST_MONITOR_CACHE_DIR"):
+        return os.environ["PYTEST_MONITOR_CACHE_DIR"]
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "pytest-monitor")
+
+
+def _boot_id():
+    try:
+        with open("/proc/sys/kernel/random/boot_id", "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return str(psutil.boot_time())
+
+
+def _context_cache_key():
+    # An execution context holds until the machine reboots or the interpreter changes.
+    # The CPU frequency may also be given by the environment. Containers share the
+    # boot id of their host: the host name tells them apart when the cache is shared.
+    h = hashlib.md5()
+    for part in (
+        _boot_id(),
+        socket.gethostname(),
+        sys.executable,
+        os.stat(sys.executable).st_mtime_ns,
+        os.environ.get("PYTEST_MONITOR_FORCE_CPU_FREQ", ""),
+        os.environ.get("PYTEST_MONITOR_CPU_FREQ", ""),
+    ):
+        h.update(str(part).encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
 def _get_cpu_string():
     if platform.system().lower() == "darwin":
         old_path = os.environ["PATH"]
@@ -103,6 +225,51 @@ class ExecutionContext:
         self.__arch = platform.architecture()[0]
         self.__system = f"{platform.system()} - {platform.release()}"
         self.__py_ver = sys.version
+        self.__hash = None
+
+    @classmethod
+    def load(cls, cache_dir=None, refresh=False):
+        """
+        Get the execution context computed by a former session, if any, or compute it and cache it
+        for the next ones. Cached contexts are kept under the user cache directory, until reboot or
+        change of the Python interpreter. Use refresh to compute the context anyway.
+        """
+        try:
+            path = os.path.join(cache_dir or user_cache_dir(), f"context-{_context_cache_key()}.json")
+        except OSError:
+            return cls()
+        if not refresh:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    return cls.from_dict(json.load(f))
+            except (OSError, ValueError, KeyError, TypeError):
+                pass  # Not cached yet, or unreadable
+        context = cls()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(context.to_dict(), f)
+            os.replace(tmp, path)  # Concurrent sessions never read a partial file
+        except (OSError, TypeError, ValueError):
+            pass
+        return context
+
+    @classmethod
+    def from_dict(cls, d):
+        context = cls.__new__(cls)
+        context.__cpu_count = d["cpu_count"]
+        context.__cpu_freq_base = d["cpu_frequency"]
+        context.__proc_typ = d["cpu_type"]
+        context.__cpu_vendor = d["cpu_vendor"]
+        context.__tot_mem = d["ram_total"]
+        context.__fqdn = d["machine_node"]
+        context.__machine = d["machine_type"]
+        context.__arch = d["machine_arch"]
+        context.__system = d["system_info"]
+        context.__py_ver = d["python_info"]
+        context.__hash = d["h"]
+        return context
 
     def _read_cpu_freq_from_env(self):
         try:
@@ -167,6 +334,8 @@ class ExecutionContext:
         return self.__py_ver
 
     def compute_hash(self):
+        if self.__hash is not None:
+            return self.__hash
         hr = hashlib.md5()
         hr.update(str(self.__cpu_count).encode())
         hr.update(str(self.__cpu_freq_base).encode())
@@ -177,4 +346,5 @@ class ExecutionContext:
         hr.update(str(self.__arch).encode())
         hr.update(str(self.__system).encode())
         hr.update(str(self.__py_ver).encode())
-        return hr.hexdigest()
+        self.__hash = hr.hexdigest()
+        return self.__hash
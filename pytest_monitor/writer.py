@@ -0,0 +1,94 @@
+import queue
+import threading
+import warnings
+
+_STOP = object()
+_CALL = object()
+
+
+class MetricWriter(threading.Thread):
+    """
+    Hand metrics over to the storage backends from a dedicated thread.
+
+    Metrics are pushed in a bounded queue by submit() and written by calling
+    write(*metric) from the writer thread, so that tests never wait for the
+    databases or the remote server. When the queue is full, submit() blocks for
+    at most put_timeout seconds (back-pressure) before dropping the metric.
+    If given, flush() is called whenever no metric is received for
+    flush_interval seconds. close() only returns once every queued metric has
+    been written.
+    call() queues any other work for the writer thread (connecting to the
+    backends for instance): metrics submitted after it wait in the queue until
+    it is done.
+    """
+
+    def __init__(
+        self, write, flush=None, max_size=10000, put_timeout=10.0, flush_interval=None
+    ):
+        super(MetricWriter, self).__init__(name="pytest-monitor-writer")
+        self.daemon = True
+        self.__write = write
+        self.__flush = flush
+        self.__queue = queue.Queue(max_size)
+        self.__put_timeout = put_timeout
+        self.__flush_interval = flush_interval if flush is not None else None
+        self.__lock = threading.Lock()
+        self.__dropped = 0
+        self.__written = 0
+
+    @property
+    def queue_depth(self):
+        return self.__queue.qsize()
+
+    @property
+    def dropped(self):
+        return self.__dropped
+
+    @property
+    def written(self):
+        return self.__written
+
+    def submit(self, *metric):
+        try:
+            self.__queue.put(metric, timeout=self.__put_timeout)
+        except queue.Full:
+            self.__drop()
+            return False
+        return True
+
+    def call(self, fun, *args):
+        self.__queue.put((_CALL, fun, args))
+
+    def run(self):
+        while True:
+            try:
+                metric = self.__queue.get(timeout=self.__flush_interval)
+            except queue.Empty:
+                self.__call(self.__flush)
+                continue
+            if metric is _STOP:
+                break
+            if metric[:1] == (_CALL,):
+                self.__call(metric[1], *metric[2])
+                continue
+            if self.__call(self.__write, *metric):
+                self.__written += 1
+            else:
+                self.__drop()
+
+    def __drop(self):
+        with self.__lock:
+            self.__dropped += 1
+
+    def __call(self, fun, *args):
+        try:
+            fun(*args)
+        except Exception as e:
+            warnings.warn(f"pytest-monitor: unable to write metrics ({e}).")
+            return False
+        return True
+
+    def close(self):
+        if self.is_alive():
+            self.__queue.put(_STOP)
+            self.join()
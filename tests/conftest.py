@@ -1 +1,9 @@
+import pytest
+
 pytest_plugins = ["pytester"]
+
+
+@pytest.fixture(autouse=True)
+def _isolated_cache_dir(tmp_path_factory, monkeypatch):
+    """Keep execution contexts cached by a test from leaking into the next ones."""
+    monkeypatch.setenv("PYTEST_MONITOR_CACHE_DIR", str(tmp_path_factory.mktemp("cache")))
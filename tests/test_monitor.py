@@ -2,6 +2,7 @@
 import json
 import pathlib
 import sqlite3
+import textwrap
 
 import pytest
 
@@ -443,6 +444,40 @@ def test_monitor_with_doctest(testdir):
     assert not pymon_path.exists()
 
 
+def test_monitor_disabled_is_not_loaded(testdir):
+    """Make sure that --no-monitor neither registers the monitoring hooks nor imports their dependencies."""
+    testdir.makepyfile(
+        """
+        import sys
+
+        def test_it(request):
+            assert not request.config.pluginmanager.has_plugin("pytest_monitor.hooks")
+            assert "_prf_tracer" not in request.fixturenames
+            loaded = {"psutil", "requests", "psycopg", "psycopg2", "pytest_monitor.session"}
+            assert not loaded.intersection(sys.modules)
+    """
+    )
+
+    result = testdir.runpytest_subprocess("--no-monitor", "-p", "no:cacheprovider")
+    result.assert_outcomes(passed=1)
+    assert not (pathlib.Path(str(testdir)) / ".pymon").exists()
+
+
+def test_monitor_imports_only_used_backends(testdir):
+    """Make sure that HTTP and PostgreSQL libraries are only imported when their option is used."""
+    testdir.makepyfile(
+        """
+        import sys
+
+        def test_it():
+            assert not {"requests", "psycopg", "psycopg2"}.intersection(sys.modules)
+    """
+    )
+
+    result = testdir.runpytest_subprocess("-p", "no:cacheprovider")
+    result.assert_outcomes(passed=1)
+
+
 def test_monitor_monitor_failed_tests(testdir):
     """Check new standard behavior that monitors failed tests in database"""
     testdir.makepyfile(
@@ -502,3 +537,388 @@ def test_monitor_no_monitor_failed(testdir):
     # TEST_METRICS table is supposed to have 1 entry (2 tests, 1 successful)
     cursor.execute("SELECT * FROM TEST_METRICS")
     assert len(cursor.fetchall()) == 1
+
+
+def test_monitor_thread_sampler(testdir):
+    """Make sure that tests are monitored when memory is sampled from a thread."""
+    testdir.makepyfile(
+        """
+        def test_ok():
+            x = ['a' * i for i in range(100)]
+            assert len(x) == 100
+
+        def test_failing():
+            assert False
+        """
+    )
+
+    result = testdir.runpytest("--monitor-sampler", "thread")
+    result.assert_outcomes(passed=1, failed=1)
+
+    pymon_path = pathlib.Path(str(testdir)) / ".pymon"
+    db = sqlite3.connect(str(pymon_path))
+    cursor = db.cursor()
+    cursor.execute("SELECT ITEM, MEM_USAGE FROM TEST_METRICS ORDER BY ITEM;")
+    metrics = cursor.fetchall()
+    assert [item for item, _ in metrics] == ["test_failing", "test_ok"]
+    assert all(mem_usage is not None for _, mem_usage in metrics)
+
+
+def test_monitor_repeat(testdir):
+    """Make sure that repeated tests are run as requested and their spread is stored."""
+    testdir.makepyfile(
+        """
+        import pytest
+
+        RUNS = []
+
+
+        @pytest.mark.monitor_repeat(3, warmup=2)
+        def test_marked():
+            RUNS.append("marked")
+
+        def test_option():
+            RUNS.append("option")
+
+        def test_runs():
+            assert RUNS.count("marked") == 5
+            assert RUNS.count("option") == 2
+        """
+    )
+
+    result = testdir.runpytest("--monitor-repeat", "2")
+    result.assert_outcomes(passed=3)
+
+    pymon_path = pathlib.Path(str(testdir)) / ".pymon"
+    db = sqlite3.connect(str(pymon_path))
+    cursor = db.cursor()
+    cursor.execute(
+        "SELECT ITEM, ITERATIONS, TOTAL_TIME >= TOTAL_TIME_MIN, TOTAL_TIME_STDEV >= 0,"
+        " CPU_TIME_MIN IS NOT NULL, MEM_USAGE_MIN IS NOT NULL FROM TEST_METRICS"
+        " WHERE KIND = 'function' ORDER BY ITEM;"
+    )
+    assert cursor.fetchall() == [
+        ("test_marked", 3, 1, 1, 1, 1),
+        ("test_option", 2, 1, 1, 1, 1),
+        ("test_runs", 2, 1, 1, 1, 1),
+    ]
+
+
+def test_monitor_repeat_keyword(testdir):
+    """Make sure that the number of runs can be given by keyword, and must be given."""
+    testdir.makepyfile(
+        """
+        import pytest
+
+
+        @pytest.mark.monitor_repeat(n=3)
+        def test_keyword():
+            pass
+
+        @pytest.mark.monitor_repeat(warmup=1)
+        def test_missing():
+            pass
+        """
+    )
+
+    result = testdir.runpytest()
+    result.assert_outcomes(passed=1, errors=1)
+    result.stdout.fnmatch_lines(["*marker monitor_repeat of *test_missing expects its argument n*"])
+
+    pymon_path = pathlib.Path(str(testdir)) / ".pymon"
+    db = sqlite3.connect(str(pymon_path))
+    cursor = db.cursor()
+    cursor.execute("SELECT ITEM, ITERATIONS FROM TEST_METRICS WHERE KIND = 'function';")
+    assert cursor.fetchall() == [("test_keyword", 3)]
+
+
+def test_monitor_repeat_until_confidence_interval(testdir):
+    """Make sure that adaptive runs stop once precise enough, or once their budget is spent."""
+    testdir.makepyfile(
+        """
+        import time
+
+        import pytest
+
+        NOISE = iter([0.001, 0.05] * 1000)
+
+
+        @pytest.mark.monitor_repeat(3, ci=1000)
+        def test_stable():
+            pass
+
+        @pytest.mark.monitor_repeat(3, ci=0.001, budget=0.5)
+        def test_noisy():
+            time.sleep(next(NOISE))
+
+        @pytest.mark.monitor_repeat(3, ci=1000, budget=None)
+        def test_unbounded():
+            pass
+        """
+    )
+
+    result = testdir.runpytest()
+    result.assert_outcomes(passed=3)
+
+    pymon_path = pathlib.Path(str(testdir)) / ".pymon"
+    db = sqlite3.connect(str(pymon_path))
+    cursor = db.cursor()
+    cursor.execute(
+        "SELECT ITEM, ITERATIONS, TOTAL_TIME_CI FROM TEST_METRICS"
+        " WHERE KIND = 'function' ORDER BY ITEM;"
+    )
+    noisy, stable, unbounded = cursor.fetchall()
+    assert (noisy[0], stable[0], unbounded[0]) == ("test_noisy", "test_stable", "test_unbounded")
+    (_, noisy_runs, noisy_ci), (_, stable_runs, stable_ci) = noisy, stable
+    assert stable_runs == 3 and stable_ci <= 1000
+    assert unbounded[1] == 3 and unbounded[2] <= 1000
+    assert 3 < noisy_runs < 100 and noisy_ci > 0.001
+
+
+def test_monitor_fixtures(testdir):
+    """Make sure that fixture costs are recorded and amortized across the tests using them."""
+    testdir.makepyfile(
+        """
+        import time
+
+        import pytest
+
+
+        @pytest.fixture(scope="session")
+        def database():
+            time.sleep(0.2)
+            yield
+            time.sleep(0.1)
+
+        @pytest.fixture
+        def table(database):
+            return []
+
+        def test_one(database, table):
+            pass
+
+        def test_two(database):
+            pass
+
+        def test_three(table):
+            pass
+        """
+    )
+
+    result = testdir.runpytest()
+    result.assert_outcomes(passed=3)
+
+    pymon_path = pathlib.Path(str(testdir)) / ".pymon"
+    db = sqlite3.connect(str(pymon_path))
+    cursor = db.cursor()
+    cursor.execute(
+        "SELECT FIXTURE, SCOPE, SETUP_TIME, TEARDOWN_TIME, USERS, AMORTIZED_TIME"
+        " FROM FIXTURE_METRICS F JOIN TEST_SESSIONS S ON S.SESSION_ID = F.SESSION_ID"
+        " ORDER BY FIXTURE, SETUP_START_TS;"
+    )
+    fixtures = cursor.fetchall()
+    assert [(name, scope, users) for name, scope, _, _, users, _ in fixtures] == [
+        ("database", "session", 3),
+        ("table", "function", 1),
+        ("table", "function", 1),
+    ]
+    _, _, setup, teardown, _, amortized = fixtures[0]
+    assert setup >= 0.2 and teardown >= 0.1
+    assert amortized == pytest.approx((setup + teardown) / 3)
+
+
+def test_monitor_fixtures_parametrize(testdir):
+    """Make sure that arguments of parametrize are not recorded as fixtures."""
+    testdir.makepyfile(
+        """
+        import pytest
+
+
+        @pytest.mark.parametrize("x", [1, 2, 3])
+        def test_param(x):
+            pass
+        """
+    )
+
+    result = testdir.runpytest()
+    result.assert_outcomes(passed=3)
+
+    pymon_path = pathlib.Path(str(testdir)) / ".pymon"
+    db = sqlite3.connect(str(pymon_path))
+    cursor = db.cursor()
+    cursor.execute("SELECT count(*) FROM FIXTURE_METRICS;")
+    assert cursor.fetchone() == (0,)
+
+
+def test_monitor_phases(testdir):
+    """Make sure that setup and teardown are measured apart from the test function."""
+    testdir.makepyfile(
+        """
+        import time
+
+        import pytest
+
+
+        @pytest.fixture(autouse=True)
+        def slow():
+            time.sleep(0.2)
+            yield
+            time.sleep(0.1)
+
+        def test_ok():
+            pass
+        """
+    )
+
+    result = testdir.runpytest()
+    result.assert_outcomes(passed=1)
+
+    pymon_path = pathlib.Path(str(testdir)) / ".pymon"
+    db = sqlite3.connect(str(pymon_path))
+    cursor = db.cursor()
+    cursor.execute(
+        "SELECT TOTAL_TIME, SETUP_TIME, TEARDOWN_TIME, SETUP_USER_TIME, TEARDOWN_KERNEL_TIME,"
+        " SETUP_MEM_USAGE, TEARDOWN_MEM_USAGE FROM TEST_METRICS WHERE ITEM = 'test_ok';"
+    )
+    total, setup, teardown, *measures = cursor.fetchone()
+    assert total < 0.1 and setup >= 0.2 and teardown >= 0.1
+    assert all(measure is not None for measure in measures)
+
+
+def test_monitor_coarse_scopes(testdir):
+    """Make sure that classes, packages and the session are monitored without their tests."""
+    pkg = testdir.mkpydir("pkg")
+    pkg.join("test_a.py").write(
+        textwrap.dedent(
+            """
+            import time
+
+
+            class TestBig:
+                def test_alloc(self):
+                    data = bytearray(100 * 1024 * 1024)
+                    time.sleep(0.3)
+                    assert data is not None
+
+                def test_ok(self):
+                    pass
+            """
+        )
+    )
+    testdir.makepyfile(test_root="def test_root():\n    pass\n")
+
+    result = testdir.runpytest("--restrict-scope-to", "class,package,session")
+    result.assert_outcomes(passed=3)
+
+    pymon_path = pathlib.Path(str(testdir)) / ".pymon"
+    db = sqlite3.connect(str(pymon_path))
+    cursor = db.cursor()
+    cursor.execute("SELECT KIND, ITEM, MEM_USAGE FROM TEST_METRICS;")
+    rows = {kind: (item, mem_usage) for kind, item, mem_usage in cursor.fetchall()}
+    assert set(rows) == {"class", "package", "session"}
+    assert rows["class"][0] == "TestBig" and rows["package"][0] == "pkg"
+    assert all(mem_usage >= 50 for _, mem_usage in rows.values())
+
+
+def test_monitor_module_peak_and_retained_memory(testdir):
+    """Make sure that modules record their peak memory usage and the memory they retain."""
+    testdir.makepyfile(
+        test_freed="""
+            import time
+
+
+            def test_spike():
+                data = bytearray(100 * 1024 * 1024)
+                time.sleep(0.3)
+                assert data is not None
+            """,
+        test_kept="""
+            KEPT = []
+
+
+            def test_leak():
+                KEPT.append(bytearray(100 * 1024 * 1024))
+            """,
+    )
+
+    result = testdir.runpytest("--restrict-scope-to", "module")
+    result.assert_outcomes(passed=2)
+
+    pymon_path = pathlib.Path(str(testdir)) / ".pymon"
+    db = sqlite3.connect(str(pymon_path))
+    cursor = db.cursor()
+    cursor.execute("SELECT ITEM, MEM_USAGE, MEM_RETAINED FROM TEST_METRICS ORDER BY ITEM;")
+    (_, freed_peak, freed_retained), (_, _, kept_retained) = cursor.fetchall()
+    assert freed_peak >= 50 and freed_retained < 50
+    assert kept_retained >= 50
+
+
+def test_monitor_memory_over_test_baseline(testdir):
+    """Make sure that tests are measured over the memory held when they start."""
+    testdir.makepyfile(
+        """
+        KEPT = []
+
+
+        def test_1_leak():
+            KEPT.append(bytearray(100 * 1024 * 1024))
+
+        def test_2_light():
+            pass
+        """
+    )
+
+    result = testdir.runpytest()
+    result.assert_outcomes(passed=2)
+
+    pymon_path = pathlib.Path(str(testdir)) / ".pymon"
+    db = sqlite3.connect(str(pymon_path))
+    cursor = db.cursor()
+    cursor.execute("SELECT ITEM, MEM_USAGE, MEM_RETAINED FROM TEST_METRICS ORDER BY ITEM;")
+    (_, _, leak_retained), (_, light_usage, light_retained) = cursor.fetchall()
+    assert leak_retained >= 50
+    assert light_usage < 50 and abs(light_retained) < 50
+
+
+def test_monitor_interrupted_session_flushes_metrics(testdir):
+    """Make sure that metrics still buffered are written when the session is interrupted."""
+    testdir.makepyfile(
+        """
+        def test_first():
+            assert True
+
+        def test_second():
+            assert True
+
+        def test_interrupt():
+            raise KeyboardInterrupt
+        """
+    )
+
+    testdir.runpytest("--db-batch-size", "1000")
+
+    pymon_path = pathlib.Path(str(testdir)) / ".pymon"
+    db = sqlite3.connect(str(pymon_path))
+    cursor = db.cursor()
+    cursor.execute("SELECT ITEM FROM TEST_METRICS WHERE ITEM != 'test_interrupt';")
+    assert len(cursor.fetchall()) == 2
+
+
+def test_monitor_known_execution_context(testdir):
+    """Make sure metrics of a known execution context refer to its full hash."""
+    testdir.makepyfile(
+        """
+    def test_ok():
+        assert True
+"""
+    )
+    for _ in range(2):
+        result = testdir.runpytest()
+        result.assert_outcomes(passed=1)
+
+    db = sqlite3.connect(str(pathlib.Path(str(testdir)) / ".pymon"))
+    cursor = db.cursor()
+    cursor.execute("SELECT ENV_H FROM EXECUTION_CONTEXTS;")
+    (env_h,) = cursor.fetchone()
+    cursor.execute("SELECT ENV_H FROM TEST_METRICS;")
+    assert cursor.fetchall() == [(env_h,), (env_h,)]
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import collections
+import itertools
+
+import pytest
+
+from pytest_monitor.benchmark import relative_confidence_interval, run_repeated
+
+
+def test_relative_confidence_interval():
+    """Check the confidence interval against Student's t distribution."""
+    # mean 2, standard deviation 1, t(0.975, 2) = 4.303
+    assert relative_confidence_interval([1, 2, 3]) == pytest.approx(
+        100 * 4.303 / 3**0.5 / 2, 1e-3
+    )
+    assert relative_confidence_interval([1] * 100) == 0
+    # Normal quantile beyond 30 degrees of freedom, corrected
+    assert relative_confidence_interval([1, 3] * 50) == pytest.approx(
+        100 * 1.984 * (100 / 99) ** 0.5 / 10 / 2, 1e-3
+    )
+
+
+@pytest.mark.parametrize("values", [[], [1], [0, 0]])
+def test_relative_confidence_interval_undefined(values):
+    """Check that no confidence interval is given without enough runs or for null times."""
+    assert relative_confidence_interval(values) is None
+
+
+class _NullSampler:
+    """Sampler reporting no memory at all."""
+
+    def start_measure(self):
+        pass
+
+    def stop_measure(self):
+        return 0.0, 1
+
+    def resident(self):
+        return 0.0
+
+
+def test_run_repeated_stops_after_max_runs(monkeypatch):
+    """Check that adaptive runs without time budget stop when the interval never narrows."""
+    clock = [0.0]
+    # Each odd run lasts ten times longer than the last one: the variance is unbounded.
+    durations = (10.0 ** (i % 2 * i) for i in itertools.count())
+
+    def run():
+        clock[0] += next(durations)
+
+    times = collections.namedtuple("times", "user system")
+    process = collections.namedtuple("process", "cpu_times")(lambda: times(0.0, 0.0))
+    monkeypatch.setattr("pytest_monitor.benchmark.time.perf_counter", lambda: clock[0])
+    samples, exception = run_repeated(run, process, _NullSampler(), 3, ci=1, budget=None, max_runs=50)
+    assert exception is None
+    assert len(samples) == 50
@@ -5,6 +5,8 @@ import sqlite3
 import mock
 import pytest
 
+from pytest_monitor.sys_utils import ExecutionContext
+
 CPU_FREQ_PATH = "pytest_monitor.sys_utils.psutil.cpu_freq"
 
 TEST_CONTENT = """
@@ -141,3 +143,44 @@ def test_when_cpu_freq_cannot_fetch_frequency(cpu_freq_mock, testdir):
     nb_metrics, cpu_freq = get_nb_metrics_with_cpu_freq(pathlib.Path(str(testdir)))
 
     assert (nb_metrics, cpu_freq) == (1, 0)
+
+
+def test_execution_context_is_cached(testdir):
+    """Make sure that the execution context is computed once, unless a refresh is requested."""
+    testdir.makepyfile(TEST_CONTENT)
+
+    result = testdir.runpytest()
+    result.assert_outcomes(passed=1)
+    with mock.patch(CPU_FREQ_PATH, return_value=mock.Mock(current=1234)) as cpu_freq_mock:
+        result = testdir.runpytest()
+        result.assert_outcomes(passed=1)
+        cpu_freq_mock.assert_not_called()
+
+        result = testdir.runpytest("--monitor-refresh-context")
+        result.assert_outcomes(passed=1)
+        cpu_freq_mock.assert_called()
+
+    db = sqlite3.connect((pathlib.Path(str(testdir)) / ".pymon").as_posix())
+    assert len(db.execute("SELECT ITEM FROM TEST_METRICS").fetchall()) == 3
+    # The refreshed context gets its own entry since its frequency is now mocked.
+    assert len(db.execute("SELECT ENV_H FROM EXECUTION_CONTEXTS").fetchall()) == 2
+
+
+def test_execution_context_cache_round_trip(tmp_path):
+    """Ensure a cached execution context is identical to the computed one."""
+    computed = ExecutionContext.load(cache_dir=str(tmp_path))
+    assert len(list(tmp_path.iterdir())) == 1
+    with mock.patch(CPU_FREQ_PATH) as cpu_freq_mock:
+        cached = ExecutionContext.load(cache_dir=str(tmp_path))
+        cpu_freq_mock.assert_not_called()
+    assert cached.to_dict() == computed.to_dict()
+    assert cached.compute_hash() == ExecutionContext.from_dict(computed.to_dict()).compute_hash()
+
+
+def test_execution_context_cache_per_host(tmp_path):
+    """Ensure hosts sharing a boot id (containers) and a cache directory do not share contexts."""
+    with mock.patch("socket.gethostname", return_value="container-a"):
+        ExecutionContext.load(cache_dir=str(tmp_path))
+    with mock.patch("socket.gethostname", return_value="container-b"):
+        ExecutionContext.load(cache_dir=str(tmp_path))
+    assert len(list(tmp_path.iterdir())) == 2
@@ -15,7 +15,7 @@ except ImportError:
     import psycopg2 as psycopg
     from psycopg2.extensions import cursor as PostgresCursor
 
-from pytest_monitor.handler import PostgresDBHandler, SqliteDBHandler
+from pytest_monitor.handler import PostgresDBHandler, SqliteDBHandler, copy_rows
 from pytest_monitor.sys_utils import determine_scm_revision
 
 
@@ -317,12 +317,19 @@ def test_sqlite_handler():
     """Ensure the Sqlite DB Handler works as expected"""
     # db handler
     db = SqliteDBHandler(":memory:")
-    session, metrics, exc_context = db.query(
+    session, exc_context, items, components, metrics, fixtures = db.query(
         "SELECT name FROM sqlite_master where type='table'", (), many=True
     )
     assert session[0] == "TEST_SESSIONS"
-    assert metrics[0] == "TEST_METRICS"
     assert exc_context[0] == "EXECUTION_CONTEXTS"
+    assert items[0] == "TEST_ITEMS"
+    assert components[0] == "COMPONENTS"
+    assert metrics[0] == "METRICS"
+    assert fixtures[0] == "FIXTURE_METRICS"
+    assert db.query("SELECT name FROM sqlite_master where type='view'", ()) == (
+        "TEST_METRICS",
+    )
+    assert db.schema_version == 7
 
 
 def test_sqlite_handler_check_new_db_setup():
@@ -369,3 +376,195 @@ def test_sqlite_handler_check_create_test_passed_column(
 
     except Exception:
         raise
+
+
+def test_sqlite_handler_migrates_former_layout(prepared_mocked_SqliteDBHandler):
+    """Check the migration from the former layout to the normalized one."""
+    db = prepared_mocked_SqliteDBHandler
+    cnx = db._SqliteDBHandler__cnx
+    # Former versions referenced known contexts by the first character of their hash
+    cnx.execute("insert into EXECUTION_CONTEXTS(ENV_H) values ('abcdef')")
+    cnx.execute(
+        "insert into TEST_METRICS(SESSION_H,ENV_H,ITEM_START_TIME,ITEM,ITEM_PATH,"
+        "ITEM_VARIANT,ITEM_FS_LOC,KIND,COMPONENT,TOTAL_TIME,USER_TIME,KERNEL_TIME,"
+        "CPU_USAGE,MEM_USAGE) values ('1','a','2023-05-06T10:20:30.123456','item',"
+        "'path','variant','loc','function','comp',1,2,3,4,5)"
+    )
+    former = cnx.execute("SELECT * FROM TEST_METRICS").fetchall()
+
+    db.prepare()
+    assert db.schema_version == 7
+    # Start times are converted to seconds since the epoch ('Startdate' cannot be)
+    start = datetime.datetime(2023, 5, 6, 10, 20, 30, 123456).timestamp()
+    assert cnx.execute("SELECT * FROM TEST_METRICS ORDER BY ITEM_START_TS").fetchall() == [
+        former[0][:2] + (None,) + former[0][3:] + (1, None, None) + (None,) * 17,
+        ("1", "abcdef", "2023-05-06T10:20:30.123456", "path", "item", "variant", "loc",
+         "function", "comp", 1, 2, 3, 4, 5, 1, None, start) + (None,) * 17,
+    ]  # fmt: skip
+    assert not cnx.execute(
+        "SELECT name FROM sqlite_master WHERE name LIKE 'LEGACY%'"
+    ).fetchall()
+
+    insert_dummy_metric(db)
+    insert_dummy_metric(db)
+    db.flush()
+    assert cnx.execute("SELECT count(*) FROM TEST_ITEMS").fetchone() == (3,)
+    assert cnx.execute("SELECT count(*) FROM TEST_METRICS").fetchone() == (4,)
+
+
+def test_sqlite_handler_upgrades_version_1(sqlite_empty_mock_db):
+    """Check that ISO 8601 start times of version 1 databases are converted."""
+    mockdb = sqlite_empty_mock_db
+    mockdb.executescript(
+        """
+CREATE TABLE TEST_SESSIONS(SESSION_ID integer primary key, SESSION_H varchar(64),
+    RUN_DATE varchar(64), SCM_ID varchar(128), RUN_DESCRIPTION json);
+CREATE TABLE METRICS (SESSION_ID integer, ENV_ID integer, ITEM_ID integer,
+    COMPONENT_ID integer, ITEM_START_TIME varchar(64), TOTAL_TIME float,
+    USER_TIME float, KERNEL_TIME float, CPU_USAGE float, MEM_USAGE float,
+    TEST_PASSED boolean, WORKER_ID varchar(64));
+CREATE INDEX METRICS_ITEM_IDX ON METRICS(ITEM_ID, ITEM_START_TIME);
+INSERT INTO TEST_SESSIONS VALUES (1, 'h', '2023-05-06T10:00:00', 'scm', '{}');
+INSERT INTO METRICS VALUES (1, 1, 1, 1, '2023-05-06T10:20:30.5', 1, 2, 3, 4, 5, 1, NULL);
+PRAGMA user_version = 1;
+"""
+    )
+    db = SqliteDBHandler(":memory:")
+    db._SqliteDBHandler__cnx = mockdb
+    db.prepare()
+    assert db.schema_version == 7
+    assert db.query("SELECT RUN_TS FROM TEST_SESSIONS", ()) == (
+        datetime.datetime(2023, 5, 6, 10).timestamp(),
+    )
+    assert db.query("SELECT ITEM_START_TS, TOTAL_TIME FROM METRICS", ()) == (
+        datetime.datetime(2023, 5, 6, 10, 20, 30, 500000).timestamp(),
+        1,
+    )
+
+
+@pytest.mark.parametrize(
+    "version, measures",
+    [
+        (2, ""),
+        (3, ", ITERATIONS, TOTAL_TIME_MIN, TOTAL_TIME_STDEV, CPU_TIME_MIN, CPU_TIME_STDEV,"
+            " MEM_USAGE_MIN, MEM_USAGE_STDEV"),
+    ],
+)  # fmt: skip
+def test_sqlite_handler_adds_measure_columns(tmp_path, version, measures):
+    """Check that measure columns are added to databases of former versions."""
+    db_path = str(tmp_path / ".pymon")
+    SqliteDBHandler(db_path).close()
+    cnx = sqlite3.connect(db_path)
+    cnx.executescript(
+        f"""
+DROP VIEW TEST_METRICS;
+CREATE TABLE FORMER_METRICS AS SELECT SESSION_ID, ENV_ID, ITEM_ID, COMPONENT_ID,
+    ITEM_START_TS, TOTAL_TIME, USER_TIME, KERNEL_TIME, CPU_USAGE, MEM_USAGE,
+    TEST_PASSED, WORKER_ID{measures} FROM METRICS;
+DROP TABLE METRICS;
+ALTER TABLE FORMER_METRICS RENAME TO METRICS;
+CREATE VIEW TEST_METRICS AS SELECT * FROM METRICS;
+PRAGMA user_version = {version};
+"""
+    )
+    cnx.close()
+
+    db = SqliteDBHandler(db_path)
+    assert db.schema_version == 7
+    db.insert_metric(
+        "1", "1", 1683368430.5, "item", "path", "", "loc", "function", "",
+        4, 2, 1, 0.75, 10, True, None, {"iterations": 5, "total_time_ci": 3},
+    )  # fmt: skip
+    db.flush()
+    assert db.query(
+        "SELECT TOTAL_TIME, ITERATIONS, TOTAL_TIME_CI, MEM_USAGE_STDEV FROM TEST_METRICS", ()
+    ) == (4, 5, 3, None)
+    db.close()
+
+
+def test_sqlite_handler_formats_start_times():
+    """Ensure start times read from TEST_METRICS are formatted like datetime does."""
+    db = SqliteDBHandler(":memory:")
+    starts = [1683368430.123456, 1683368430.9999996, 1683368430.0]
+    for start in starts:
+        insert_dummy_metric(db, start=start)
+    db.flush()
+    assert db.query("SELECT ITEM_START_TIME FROM TEST_METRICS", (), many=True) == [
+        (datetime.datetime.fromtimestamp(start).strftime("%Y-%m-%dT%H:%M:%S.%f"),)
+        for start in starts
+    ]
+
+
+def insert_dummy_metric(db, item="name of item", start=1683368430.5):
+    db.insert_metric(
+        "1",
+        "1",
+        start,
+        item,
+        "Item path",
+        "Optional Param",
+        "relative path",
+        "function",
+        "",
+        42,
+        42,
+        42,
+        42,
+        42,
+        True,
+    )
+
+
+def test_sqlite_handler_batches_metrics(tmp_path):
+    """Ensure metrics are written once the batch size is reached, and at close."""
+    db_path = tmp_path / ".pymon"
+    db = SqliteDBHandler(str(db_path), batch_size=2)
+    reader = sqlite3.connect(str(db_path))
+
+    insert_dummy_metric(db, "first")
+    assert reader.execute("SELECT count(*) FROM TEST_METRICS").fetchone()[0] == 0
+    insert_dummy_metric(db, "second")
+    assert reader.execute("SELECT count(*) FROM TEST_METRICS").fetchone()[0] == 2
+    insert_dummy_metric(db, "third")
+    assert reader.execute("SELECT count(*) FROM TEST_METRICS").fetchone()[0] == 2
+
+    db.close()
+    items = reader.execute("SELECT ITEM FROM TEST_METRICS ORDER BY ITEM").fetchall()
+    assert items == [("first",), ("second",), ("third",)]
+    reader.close()
+
+
+def test_sqlite_handler_flush_interval(tmp_path):
+    """Ensure buffered metrics are written once the flush interval is elapsed."""
+    db_path = tmp_path / ".pymon"
+    db = SqliteDBHandler(str(db_path), batch_size=1000, flush_interval=0)
+    insert_dummy_metric(db)
+    reader = sqlite3.connect(str(db_path))
+    assert reader.execute("SELECT count(*) FROM TEST_METRICS").fetchone()[0] == 1
+    reader.close()
+    db.close()
+
+
+def test_sqlite_handler_pragmas(tmp_path):
+    """Ensure the database uses WAL journaling and that pragmas can be overridden."""
+    db = SqliteDBHandler(str(tmp_path / ".pymon"), pragmas={"synchronous": "FULL"})
+    assert db.query("PRAGMA journal_mode", ()) == ("wal",)
+    assert db.query("PRAGMA synchronous", ()) == (2,)
+    assert db.query("PRAGMA busy_timeout", ()) == (10000,)
+    assert db.query("PRAGMA cache_size", ()) == (-16384,)
+    db.close()
+
+    with pytest.raises(ValueError, match="Invalid SQLite pragma"):
+        SqliteDBHandler(":memory:", pragmas={"synchronous": "OFF; DROP TABLE X"})
+
+
+def test_copy_rows():
+    """Ensure metrics are encoded as expected by PostgreSQL's COPY text format."""
+    rows = [
+        ("1", None, 1.5, True, False),
+        ("tab\there", "line\nbreak\r", "back\\slash", 0, -2),
+    ]
+    assert copy_rows(rows) == (
+        "1\t\\N\t1.5\tt\tf\n"
+        "tab\\there\tline\\nbreak\\r\tback\\\\slash\t0\t-2\n"
+    )
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+
+import psutil
+import pytest
+
+from pytest_monitor.profiler import (
+    SAMPLERS,
+    HWMSampler,
+    MemSampler,
+    _MemoryReader,
+    create_sampler,
+    memory_usage,
+)
+
+
+@pytest.fixture(params=SAMPLERS)
+def mem_sampler(request):
+    """Provide a running memory sampler monitoring the current process."""
+    sampler = create_sampler(request.param, interval=0.01)
+    yield sampler
+    sampler.close()
+
+
+def test_mem_sampler_is_reused_across_measures():
+    """Ensure several measures are served by the very same sampler process."""
+    sampler = create_sampler("process", interval=0.01)
+    pid = sampler.pid
+    for _ in range(5):
+        memuse, exception = memory_usage((lambda: True,), sampler=sampler)
+        assert memuse > 0
+        assert exception is None
+    assert sampler.is_alive()
+    assert sampler.pid == pid
+    sampler.close()
+
+
+def test_thread_sampler_does_not_fork():
+    """Ensure the thread sampler measures without spawning any process."""
+    children = psutil.Process(os.getpid()).children()
+    sampler = create_sampler("thread", interval=0.01)
+    memuse, exception = memory_usage((lambda: True,), sampler=sampler)
+    assert psutil.Process(os.getpid()).children() == children
+    sampler.close()
+    assert memuse > 0
+    assert exception is None
+    assert not sampler.is_alive()
+
+
+def test_memory_reader_matches_psutil():
+    """Ensure reading statm gives the resident memory reported by psutil."""
+    reader = _MemoryReader(os.getpid())
+    rss = psutil.Process(os.getpid()).memory_info().rss / 2**20
+    assert reader() == pytest.approx(rss, abs=1)
+    reader.close()
+
+
+def test_mem_sampler_measures_peak(mem_sampler):
+    """Ensure the sampler reports the peak memory, not what is left after the call."""
+    baseline, _ = memory_usage((lambda: True,), sampler=mem_sampler)
+
+    def allocate():
+        x = bytearray(64 * 1024**2)
+        for i in range(0, len(x), 4096):
+            x[i] = 1
+        time.sleep(0.1)
+        return len(x)
+
+    (memuse, exception), returned = memory_usage(
+        (allocate,), retval=True, sampler=mem_sampler
+    )
+    assert exception is None
+    assert returned == 64 * 1024**2
+    assert memuse - baseline >= 32
+
+
+def test_mem_sampler_survives_exception(mem_sampler):
+    """Ensure a failing function does not leave the sampler in a broken state."""
+
+    def fail():
+        raise ValueError("expected")
+
+    memuse, exception = memory_usage((fail,), sampler=mem_sampler)
+    assert isinstance(exception, ValueError)
+    assert memuse > 0
+    memuse, exception = memory_usage((lambda: True,), sampler=mem_sampler)
+    assert exception is None
+
+
+def test_mem_sampler_close():
+    """Ensure the sampler process ends when closed."""
+    sampler = MemSampler(os.getpid(), interval=0.01)
+    sampler.start()
+    sampler.close()
+    assert not sampler.is_alive()
+
+
+def test_hwm_sampler_catches_short_spikes():
+    """Ensure the kernel tracked peak sees allocations freed before any poll could."""
+    try:
+        sampler = HWMSampler()
+    except OSError:
+        pytest.skip("Resetting the resident memory peak is not supported here.")
+    baseline, _ = memory_usage((lambda: True,), sampler=sampler)
+
+    def allocate():
+        x = bytearray(64 * 1024**2)
+        for i in range(0, len(x), 4096):
+            x[i] = 1
+
+    memuse, exception = memory_usage((allocate,), sampler=sampler)
+    sampler.close()
+    assert exception is None
+    assert memuse - baseline >= 60
+
+
+def test_hwm_sampler_fallback(monkeypatch):
+    """Ensure polling is used when the resident memory peak cannot be reset."""
+
+    def unavailable():
+        raise OSError("clear_refs is not writable")
+
+    monkeypatch.setattr("pytest_monitor.profiler.HWMSampler", unavailable)
+    with pytest.warns(UserWarning, match="Falling back to the process memory sampler"):
+        sampler = create_sampler("hwm", interval=0.01)
+    assert isinstance(sampler, MemSampler)
+    sampler.close()
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+
+from pytest_monitor.query import COMPONENT_ROLLUP, TEST_HISTORY, MetricsQuery
+
+TEST_CONTENT = """
+import pytest
+
+pytest_monitor_component = "{component}"
+
+@pytest.mark.parametrize("i", range(2))
+def test_ok(i):
+    assert True
+
+def test_ko():
+    assert False
+"""
+
+
+def test_query_history(testdir):
+    """Ensure the history of a test, sessions and components can be looked up."""
+    for component in ("first", "second"):
+        testdir.makepyfile(test_query=TEST_CONTENT.format(component=component))
+        result = testdir.runpytest("--db-batch-size", "1")
+        result.assert_outcomes(passed=2, failed=1)
+
+    with MetricsQuery(str(testdir.tmpdir / ".pymon")) as query:
+        history = query.test_history("test_query", "test_ok")
+        assert len(history) == 4
+        assert history[0]["ITEM_START_TS"] > history[-1]["ITEM_START_TS"]
+        history = query.test_history("test_query", "test_ok", "test_ok[0]", limit=1)
+        assert [row["ITEM_VARIANT"] for row in history] == ["test_ok[0]"]
+        since = history[0]["ITEM_START_TS"]
+        assert len(query.test_history("test_query", "test_ok", since=since)) == 2
+        assert len(query.test_history("test_query", "test_ok", until=since)) == 2
+
+        sessions = query.session_summaries()
+        assert [(s["ITEMS"], s["FAILED"]) for s in sessions] == [(3, 1), (3, 1)]
+        assert sessions[0]["RUN_TS"] > sessions[1]["RUN_TS"]
+
+        rollup = query.component_rollup(sessions[0]["SESSION_H"])
+        assert [(r["COMPONENT"], r["ITEMS"]) for r in rollup] == [("second", 3)]
+
+
+def test_query_uses_indexes(testdir):
+    """Ensure history lookups are not served by a full scan of TEST_METRICS."""
+    testdir.makepyfile(test_query=TEST_CONTENT.format(component=""))
+    testdir.runpytest()
+    MetricsQuery(str(testdir.tmpdir / ".pymon")).close()
+
+    cnx = sqlite3.connect(str(testdir.tmpdir / ".pymon"))
+    for statement, params in (
+        (TEST_HISTORY.format(variant="AND I.ITEM_VARIANT = :item_variant"), 7),
+        (COMPONENT_ROLLUP, 1),
+    ):
+        plan = " ".join(
+            row[-1]
+            for row in cnx.execute("EXPLAIN QUERY PLAN " + statement, (None,) * params)
+        )
+        assert "SCAN M " not in plan + " "
+        assert "SCAN I " not in plan + " "
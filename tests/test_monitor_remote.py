@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+import gzip
+import json
+import threading
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# Imported by pytest-monitor only once a remote server is used. Loading it here
+# keeps it across in-process pytest runs, which unload the modules they import.
+import requests  # noqa: F401
+
+from pytest_monitor.cli import main
+from pytest_monitor.handler import RemoteHandler, iso_to_epoch
+from pytest_monitor.spool import Spool
+
+
+class MonitorServer(ThreadingHTTPServer):
+    """Minimal monitor server recording what pytest-monitor sends to it."""
+
+    def __init__(self, bulk=True):
+        super().__init__(("127.0.0.1", 0), MonitorRequestHandler)
+        self.bulk = bulk
+        self.available = True
+        self.rejected = set()
+        self.requests = []
+        self.metrics = []
+        self.clients = set()
+        self.delay = 0.0
+        self.answered = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class MonitorRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, code, content=None):
+        body = json.dumps(content).encode() if content is not None else b""
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        return json.loads(body) if body else None
+
+    def do_GET(self):
+        self.server.clients.add(self.client_address)
+        self.server.requests.append(("GET", self.path))
+        time.sleep(self.server.delay)
+        self.server.answered = time.time()
+        self.reply(HTTPStatus.NO_CONTENT)
+
+    def do_POST(self):
+        self.server.clients.add(self.client_address)
+        self.server.requests.append(("POST", self.path))
+        content = self.read_json()
+        if self.path == "/metrics/bulk" and not self.server.bulk:
+            self.reply(HTTPStatus.NOT_FOUND)
+        elif self.path.startswith("/metrics/") and not self.server.available:
+            self.reply(HTTPStatus.SERVICE_UNAVAILABLE)
+        elif self.path.startswith("/metrics/") and any(
+            m["metric_h"] in self.server.rejected
+            for m in (content if self.path == "/metrics/bulk" else [content])
+        ):
+            self.reply(HTTPStatus.UNPROCESSABLE_ENTITY)
+        else:
+            # Metrics sent twice are recognized by their idempotency key.
+            known = {m["metric_h"] for m in self.server.metrics}
+            if self.path == "/metrics/bulk":
+                self.server.metrics.extend(
+                    m for m in content if m["metric_h"] not in known
+                )
+            elif self.path == "/metrics/" and content["metric_h"] not in known:
+                self.server.metrics.append(content)
+            self.reply(HTTPStatus.CREATED, content)
+
+
+@pytest.fixture(params=[True, False], ids=["bulk", "no-bulk"])
+def monitor_server(request):
+    """Provide a running monitor server, with or without the bulk metrics route."""
+    server = MonitorServer(bulk=request.param)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+TEST_CONTENT = """
+import pytest
+
+@pytest.mark.parametrize("i", range(5))
+def test_ok(i):
+    assert True
+"""
+
+
+def test_monitor_remote_server(monitor_server, testdir):
+    """Make sure that metrics reach the remote server over a single connection."""
+    testdir.makepyfile(TEST_CONTENT)
+
+    result = testdir.runpytest(
+        "--no-db", "--remote-server", monitor_server.url, "--remote-batch-size", "2"
+    )
+    result.assert_outcomes(passed=5)
+
+    assert sorted(m["item_variant"] for m in monitor_server.metrics) == [
+        f"test_ok[{i}]" for i in range(5)
+    ]
+    metric_routes = [path for _, path in monitor_server.requests if "metrics" in path]
+    if monitor_server.bulk:
+        assert metric_routes == ["/metrics/bulk"] * 3
+    else:
+        assert metric_routes == ["/metrics/bulk"] + ["/metrics/"] * 5
+    assert len(monitor_server.clients) == 1
+
+
+def test_monitor_remote_server_slow(monitor_server, testdir):
+    """Make sure that tests do not wait for the remote server to answer at session start."""
+    testdir.makepyfile(TEST_CONTENT)
+    monitor_server.delay = 1.0
+
+    result = testdir.runpytest("--no-db", "--remote-server", monitor_server.url)
+    result.assert_outcomes(passed=5)
+
+    assert len(monitor_server.metrics) == 5
+    first_start = min(iso_to_epoch(m["item_start_time"]) for m in monitor_server.metrics)
+    assert first_start < monitor_server.answered
+
+
+def test_monitor_remote_server_unavailable(monitor_server, testdir):
+    """Make sure that metrics are spooled while the server is down and replayed later."""
+    testdir.makepyfile(TEST_CONTENT)
+    monitor_server.available = False
+
+    wrn = "some records could not be sent to the remote server"
+    with pytest.warns(UserWarning, match=wrn):
+        result = testdir.runpytest("--no-db", "--remote-server", monitor_server.url)
+    result.assert_outcomes(passed=5)
+    assert not monitor_server.metrics
+
+    monitor_server.available = True
+    assert main(["replay", "--spool-dir", str(testdir.tmpdir / ".pymon-spool")]) == 0
+    assert len(monitor_server.metrics) == 5
+    assert not (testdir.tmpdir / ".pymon-spool").listdir()
+
+
+def test_remote_handler_replays_spool_once(monitor_server, tmp_path):
+    """Ensure spooled metrics are sent again once the server is back, only once."""
+    spool = Spool(str(tmp_path), monitor_server.url)
+    handler = RemoteHandler(monitor_server.url, spool=spool)
+    monitor_server.available = False
+    with pytest.warns(UserWarning, match="cannot reach the remote server"):
+        handler.insert_metric({"metric_h": "1"})
+    assert spool.pending
+
+    # Simulate a metric delivered before a failure: it is spooled all the same.
+    monitor_server.available = True
+    monitor_server.metrics.append({"metric_h": "1"})
+    handler.close()
+    assert not spool.pending
+    assert monitor_server.metrics == [{"metric_h": "1"}]
+
+
+def test_remote_handler_drops_rejected_metrics(monitor_server, tmp_path):
+    """Ensure a metric refused by the server neither blocks the next ones nor is spooled."""
+    spool = Spool(str(tmp_path), monitor_server.url)
+    handler = RemoteHandler(monitor_server.url, batch_size=3, spool=spool)
+    monitor_server.rejected.add("2")
+    with pytest.warns(UserWarning, match="dropping metrics record"):
+        for h in ("1", "2", "3"):
+            handler.insert_metric({"metric_h": h})
+    assert [m["metric_h"] for m in monitor_server.metrics] == ["1", "3"]
+    assert not spool.pending
+    handler.close()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import shutil
+import subprocess
+
+import pytest
+
+from pytest_monitor.sys_utils import determine_scm_revision, read_git_revision
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+
+
+def git(cwd, *args):
+    return subprocess.run(
+        ["git", *args], cwd=str(cwd), check=True, capture_output=True, text=True
+    ).stdout.strip()
+
+
+@pytest.fixture()
+def repo(tmp_path):
+    """Provide a git repository with two commits on the main branch."""
+    path = tmp_path / "repo"
+    path.mkdir()
+    git(path, "init", "-q", "-b", "main")
+    git(path, "config", "user.email", "monitor@example.com")
+    git(path, "config", "user.name", "monitor")
+    for i in range(2):
+        (path / "file.txt").write_text(str(i))
+        git(path, "add", "file.txt")
+        git(path, "commit", "-q", "-m", f"commit {i}")
+    (path / "sub" / "dir").mkdir(parents=True)
+    return path
+
+
+def test_read_git_revision_loose_ref(repo):
+    """Ensure the revision is read from a branch stored as a loose ref, from any subdirectory."""
+    assert read_git_revision(str(repo / "sub" / "dir")) == git(repo, "rev-parse", "HEAD")
+
+
+def test_read_git_revision_packed_ref(repo):
+    """Ensure the revision is read from packed-refs once loose refs are packed."""
+    git(repo, "pack-refs", "--all")
+    assert not (repo / ".git" / "refs" / "heads" / "main").exists()
+    assert read_git_revision(str(repo)) == git(repo, "rev-parse", "HEAD")
+
+
+def test_read_git_revision_detached_head(repo):
+    """Ensure a detached HEAD gives the commit it points to."""
+    git(repo, "checkout", "-q", "HEAD~1")
+    assert read_git_revision(str(repo)) == git(repo, "rev-parse", "HEAD")
+
+
+def test_read_git_revision_worktree(repo, tmp_path):
+    """Ensure the HEAD of a worktree is used, with refs shared with the main repository."""
+    git(repo, "worktree", "add", "-q", "-b", "other", str(tmp_path / "wt"), "HEAD~1")
+    git(repo, "pack-refs", "--all")
+    expected = git(tmp_path / "wt", "rev-parse", "HEAD")
+    assert expected != git(repo, "rev-parse", "HEAD")
+    assert read_git_revision(str(tmp_path / "wt")) == expected
+
+
+def test_read_git_revision_git_dir(repo, tmp_path, monkeypatch):
+    """Ensure GIT_DIR designates the repository whatever the directory."""
+    monkeypatch.setenv("GIT_DIR", str(repo / ".git"))
+    assert read_git_revision(str(tmp_path)) == git(repo, "rev-parse", "HEAD")
+
+
+def test_determine_scm_revision_falls_back_to_git(repo, monkeypatch):
+    """Ensure git is run when the repository cannot be read directly."""
+    monkeypatch.chdir(repo)
+    monkeypatch.setattr("pytest_monitor.sys_utils.read_git_revision", lambda: None)
+    assert determine_scm_revision() == git(repo, "rev-parse", "HEAD")
@@ -1,8 +1,10 @@
 import os
+import socket
 
 import pytest
 
 from pytest_monitor.session import PyTestMonitorSession
+from pytest_monitor.spool import Spool
 
 
 @pytest.fixture()
@@ -35,7 +37,55 @@ def test_pytestmonitorsession_close_connection():
         assert True
 
     session = PyTestMonitorSession(use_postgres=True)
+    session.compute_info("", [])
+    assert session.wait_until_ready(10)
     db = session._PyTestMonitorSession__db
     assert db._PostgresDBHandler__cnx.closed == 0
     session.close()
     assert db._PostgresDBHandler__cnx.closed > 0
+
+
+@pytest.fixture()
+def unreachable_postgres(monkeypatch):
+    """Point pytest-monitor to a PostgreSQL server that does not answer."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    monkeypatch.setenv("PYTEST_MONITOR_DB_NAME", "postgres")
+    monkeypatch.setenv("PYTEST_MONITOR_DB_USER", "postgres")
+    monkeypatch.setenv("PYTEST_MONITOR_DB_PASSWORD", "testing_db")
+    monkeypatch.setenv("PYTEST_MONITOR_DB_HOST", "127.0.0.1")
+    monkeypatch.setenv("PYTEST_MONITOR_DB_PORT", str(port))
+
+
+TEST_CONTENT = """
+def test_ok():
+    assert True
+"""
+
+
+@pytest.mark.usefixtures("unreachable_postgres")
+def test_unreachable_postgres_spools_session(testdir):
+    """Make sure that the session and its metrics are spooled while PostgreSQL is unreachable."""
+    testdir.makepyfile(TEST_CONTENT)
+
+    with pytest.warns(UserWarning, match="Run 'pytest-monitor replay'"):
+        result = testdir.runpytest("--use-postgres")
+    result.assert_outcomes(passed=1)
+    result.stdout.fnmatch_lines(["*Records are spooled until it is reachable*"])
+
+    spool = Spool(str(testdir.tmpdir / ".pymon-spool"), "postgres")
+    sent = []
+    spool.replay(lambda kind, records: sent.extend(kind for _ in records))
+    assert sent == ["contexts", "sessions", "metrics"]
+
+
+@pytest.mark.usefixtures("unreachable_postgres")
+def test_unreachable_postgres_reports_lost_metrics(testdir):
+    """Make sure that metrics lost without a spool are reported in the terminal summary."""
+    testdir.makepyfile(TEST_CONTENT)
+
+    with pytest.warns(UserWarning, match="1 metric"):
+        result = testdir.runpytest("--use-postgres", "--spool-dir", "")
+    result.assert_outcomes(passed=1)
+    result.stdout.fnmatch_lines(["*Deactivating*", "*pytest-monitor*", "1 metric(s) could not be stored."])
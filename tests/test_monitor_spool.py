@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+import os
+import subprocess
+import sys
+
+import pytest
+
+from pytest_monitor.spool import Backoff, RejectedError, Spool, deliver, spooled_targets
+
+
+def test_spool_replays_records_in_order(tmp_path):
+    """Ensure records are replayed in the order they were spooled, grouped by kind."""
+    spool = Spool(str(tmp_path), "postgres", segment_size=2)
+    spool.append("sessions", [{"session_h": "1"}])
+    spool.append("metrics", [[1], [2]])
+    spool.append("metrics", [[3]])
+    assert spool.pending
+    assert len(spool.segments()) == 2
+
+    sent = []
+    spool.replay(lambda kind, records: sent.append((kind, records)))
+    assert sent == [
+        ("sessions", [{"session_h": "1"}]),
+        ("metrics", [[1], [2]]),
+        ("metrics", [[3]]),
+    ]
+    assert not spool.pending
+    assert not spool.segments()
+
+
+def test_spool_keeps_segment_on_failure(tmp_path):
+    """Ensure a segment is kept when its records cannot be delivered."""
+    spool = Spool(str(tmp_path), "postgres")
+    spool.append("metrics", [[1]])
+
+    def fail(kind, records):
+        raise RuntimeError("unreachable")
+
+    with pytest.raises(RuntimeError):
+        spool.replay(fail)
+    assert spool.pending
+    assert Spool(str(tmp_path), "postgres").pending
+
+
+def test_spool_drops_rejected_records(tmp_path):
+    """Ensure a record rejected by the target does not block the ones after it."""
+    spool = Spool(str(tmp_path), "postgres")
+    spool.append("metrics", [[1], [2], [3]])
+
+    sent = []
+
+    def send(kind, records):
+        if [2] in records:
+            raise RejectedError("invalid")
+        sent.extend(records)
+
+    with pytest.warns(UserWarning, match="dropping metrics record"):
+        spool.replay(send)
+    assert sent == [[1], [3]]
+    assert not spool.pending
+
+
+def test_deliver_propagates_transient_errors():
+    """Ensure errors other than rejections are left to the caller, to spool records."""
+
+    def send(kind, records):
+        raise ConnectionError("unreachable")
+
+    with pytest.raises(ConnectionError):
+        deliver(send, "metrics", [[1]])
+
+
+def test_spool_ignores_truncated_records(tmp_path):
+    """Ensure a record partially written before a crash does not prevent replaying."""
+    spool = Spool(str(tmp_path), "postgres")
+    spool.append("metrics", [[1]])
+    with open(spool.segments()[0], "a", encoding="utf-8") as f:
+        f.write('{"target": "postgres", "kind": "metr')
+
+    sent = []
+    spool.replay(lambda kind, records: sent.append((kind, records)))
+    assert sent == [("metrics", [[1]])]
+
+
+def _dead_pid():
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return proc.pid
+
+
+def test_spool_leaves_segments_of_live_processes(tmp_path):
+    """Ensure segments still written by other processes are not replayed, but those of gone ones are."""
+    spool = Spool(str(tmp_path), "postgres")
+    spool.append("metrics", [[1]])
+    own = spool.segments()[0]
+    live = own.replace(f"-{os.getpid()}.ndjson", f"-{os.getppid()}.ndjson")
+    gone = own.replace(f"-{os.getpid()}.ndjson", f"-{_dead_pid()}.ndjson")
+    os.rename(own, live)
+    with open(gone, "w", encoding="utf-8") as f:
+        f.write('{"target": "postgres", "kind": "metrics", "data": [2]}\n')
+
+    sent = []
+    spool.replay(lambda kind, records: sent.extend(records))
+    assert sent == [[2]]
+    assert spool.segments() == [live]
+    assert spool.pending
+
+
+def test_spool_replays_segments_claimed_by_gone_processes(tmp_path):
+    """Ensure a segment left claimed by a crashed replayer is replayed by the next one."""
+    spool = Spool(str(tmp_path), "postgres")
+    spool.append("metrics", [[1]])
+    segment = spool.segments()[0]
+    os.rename(segment, f"{segment}.{_dead_pid()}.replaying")
+    spool = Spool(str(tmp_path), "postgres")
+    spool.append("metrics", [[2]])
+
+    def fail(kind, records):
+        raise RuntimeError("unreachable")
+
+    with pytest.raises(RuntimeError):
+        spool.replay(fail)
+    assert spool.segments()[0] == f"{segment}.{os.getpid()}.replaying"
+
+    sent = []
+    spool.replay(lambda kind, records: sent.extend(records))
+    assert sent == [[1], [2]]
+    assert not spool.segments()
+
+
+def test_spool_targets_are_separated(tmp_path):
+    """Ensure each target only replays its own records."""
+    Spool(str(tmp_path), "postgres").append("metrics", [[1]])
+    remote = Spool(str(tmp_path), "http://monitor:8000")
+    remote.append("metrics", [{"metric_h": "1"}])
+    assert sorted(spooled_targets(str(tmp_path))) == ["http://monitor:8000", "postgres"]
+
+    sent = []
+    remote.replay(lambda kind, records: sent.extend(records))
+    assert sent == [{"metric_h": "1"}]
+    assert Spool(str(tmp_path), "postgres").pending
+
+
+def test_backoff_is_exponential():
+    """Ensure delays double after each failure and are reset on demand."""
+    backoff = Backoff(initial=60, maximum=240)
+    assert backoff.ready()
+    backoff.failed()
+    assert not backoff.ready()
+    assert backoff._Backoff__delay == 120
+    backoff.failed()
+    backoff.failed()
+    assert backoff._Backoff__delay == 240
+    backoff.reset()
+    assert backoff.ready()
+    assert backoff._Backoff__delay == 60
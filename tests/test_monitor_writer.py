@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import pytest
+
+from pytest_monitor.writer import MetricWriter
+
+
+def test_writer_drains_queue_on_close():
+    """Ensure every submitted metric is written before close returns."""
+    written = []
+    writer = MetricWriter(lambda *metric: written.append(metric))
+    writer.start()
+    for i in range(100):
+        assert writer.submit(i, "metric")
+    writer.close()
+    assert written == [(i, "metric") for i in range(100)]
+    assert writer.written == 100
+    assert writer.dropped == 0
+    assert writer.queue_depth == 0
+
+
+def test_writer_back_pressure_drops_metrics():
+    """Ensure metrics are dropped and counted once the queue stays full."""
+    release = threading.Event()
+    writer = MetricWriter(
+        lambda *metric: release.wait(), max_size=1, put_timeout=0.01
+    )
+    writer.start()
+    assert writer.submit(1)  # taken by the writer thread, which then blocks
+    while writer.queue_depth:
+        time.sleep(0.001)
+    assert writer.submit(2)  # waits in the queue
+    assert writer.queue_depth == 1
+    assert not writer.submit(3)
+    assert writer.dropped == 1
+    release.set()
+    writer.close()
+    assert writer.written == 2
+
+
+def test_writer_survives_failing_write():
+    """Ensure a failing write is reported and does not stop the writer."""
+
+    def write(value):
+        if value == "bad":
+            raise RuntimeError("cannot write")
+
+    writer = MetricWriter(write)
+    writer.start()
+    writer.submit("bad")
+    writer.submit("good")
+    with pytest.warns(UserWarning, match="unable to write metrics"):
+        writer.close()
+    assert writer.dropped == 1
+    assert writer.written == 1
+
+
+def test_writer_flushes_when_idle():
+    """Ensure the flush callback is called when no metric comes in."""
+    flushed = threading.Event()
+    writer = MetricWriter(
+        lambda *metric: None, flush=flushed.set, flush_interval=0.01
+    )
+    writer.start()
+    assert flushed.wait(5)
+    writer.close()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+
+import pytest
+
+pytest.importorskip("xdist")
+
+
+def test_monitor_xdist(testdir):
+    """Make sure that metrics of all workers are stored by the controller."""
+    testdir.makepyfile(
+        """
+import pytest
+
+@pytest.fixture(scope="session")
+def resource():
+    return 42
+
+@pytest.mark.parametrize("i", range(8))
+def test_ok(i, resource):
+    assert True
+"""
+    )
+
+    result = testdir.runpytest("-n", "2")
+    result.assert_outcomes(passed=8)
+
+    pymon_path = testdir.tmpdir.join(".pymon")
+    assert pymon_path.size() > 0
+
+    db = sqlite3.connect(str(pymon_path))
+    cursor = db.cursor()
+    cursor.execute("SELECT count(*) FROM TEST_SESSIONS;")
+    assert cursor.fetchone() == (1,)
+    cursor.execute(
+        "SELECT DISTINCT m.SESSION_H = s.SESSION_H FROM TEST_METRICS m, TEST_SESSIONS s;"
+    )
+    assert cursor.fetchall() == [(1,)]
+    cursor.execute("SELECT ITEM_VARIANT, WORKER_ID FROM TEST_METRICS;")
+    rows = cursor.fetchall()
+    assert sorted(variant for variant, _ in rows) == [f"test_ok[{i}]" for i in range(8)]
+    assert {worker for _, worker in rows} <= {"gw0", "gw1"}
+    cursor.execute("SELECT WORKER_ID, USERS FROM FIXTURE_METRICS WHERE FIXTURE = 'resource';")
+    fixtures = cursor.fetchall()
+    assert {worker for worker, _ in fixtures} <= {"gw0", "gw1"}
+    assert sum(users for _, users in fixtures) == 8
+
+
+def test_monitor_xdist_worker_crash(testdir):
+    """Make sure that metrics of finished tests are kept when their worker crashes."""
+    testdir.makepyfile(
+        """
+import os
+
+import pytest
+
+@pytest.mark.parametrize("i", range(4))
+def test_ok(i):
+    assert True
+
+def test_zcrash():
+    os._exit(1)
+"""
+    )
+
+    result = testdir.runpytest("-n", "1", "--max-worker-restart", "0")
+    result.assert_outcomes(passed=4, failed=1)
+
+    db = sqlite3.connect(str(testdir.tmpdir.join(".pymon")))
+    cursor = db.cursor()
+    cursor.execute("SELECT ITEM_VARIANT FROM TEST_METRICS WHERE KIND = 'function';")
+    assert sorted(variant for variant, in cursor.fetchall()) == [
+        f"test_ok[{i}]" for i in range(4)
+    ]